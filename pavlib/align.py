@@ -4,6 +4,7 @@ Routines for handling alignments.
 
 import collections
 import intervaltree
+import multiprocessing as mp
 import numpy as np
 import pandas as pd
 import pysam
@@ -15,6 +16,35 @@ import svpoplib.ref
 _INT_STR_SET = {'0', '1', '2', '3', '4', '5', '6', '7', '8', '9'}
 _CIGAR_OP_SET = {'M', 'I', 'D', 'N', 'S', 'H', 'P', '=', 'X'}
 
+# CIGAR operation codes (SAM specification, same codes as pysam)
+CIGAR_M = 0
+CIGAR_I = 1
+CIGAR_D = 2
+CIGAR_N = 3
+CIGAR_S = 4
+CIGAR_H = 5
+CIGAR_P = 6
+CIGAR_EQ = 7
+CIGAR_X = 8
+
+_CIGAR_OP_CHAR = 'MIDNSHP=X'
+
+_CIGAR_OP_CHAR_ARR = np.array(list(_CIGAR_OP_CHAR))
+
+_CIGAR_OP_CODE_ARR = np.full(256, 255, dtype=np.uint8)  # ASCII to operation code, 255 for illegal characters
+_CIGAR_OP_CODE_ARR[np.frombuffer(_CIGAR_OP_CHAR.encode(), dtype=np.uint8)] = np.arange(len(_CIGAR_OP_CHAR))
+
+_CIGAR_CONSUME_REF = np.array([True, False, True, True, False, False, False, True, True])  # M, D, N, =, X
+_CIGAR_CONSUME_QRY = np.array([True, True, False, False, True, True, False, True, True])   # M, I, S, H, =, X
+
+_CIGAR_ALIGN_OPS = np.array([False, True, True, False, False, False, False, True, True])  # I, D, =, X
+_CIGAR_ALIGN_OPS_M = np.array([True, True, True, False, False, False, False, True, True])  # M, I, D, =, X
+_CIGAR_LIFT_OPS = np.array([True, True, True, False, True, True, False, True, True])  # M, I, D, S, H, =, X
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+DEFAULT_LIFT_CACHE_BYTES = 256 * 1024 ** 2  # Default size of cached liftover arrays (AlignLift) in bytes
+
 # Indices for tuples returned by trace_cigar_to_zero()
 TC_INDEX = 0
 TC_OP_LEN = 1
@@ -29,7 +59,7 @@ TC_CLIPS_BP = 9
 TC_CLIPH_BP = 10
 
 
-def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False):
+def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False, threads=1):
     """
     Do alignment trimming from prepared alignment BED file. This BED contains information about reference and
     contig coordinates mapped, CIGAR string and flags.
@@ -43,6 +73,8 @@ def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False):
         This mode is useful for generating a maximal callset where multiple contigs may cover the same region (e.g.
         alleles in squashed assembly or mixed haplotypes (e.g. subclonal events). Additional QC should be applied to
         callsets using this option.
+    :param threads: Number of processes for trimming. Contig-space trimming is distributed over contigs, and
+        reference-space trimming is distributed over reference chromosomes.
 
     :return: Trimmed alignments as an alignment DataFrame. Same format as `df` with columns added describing the
         number of reference and contig bases that were trimmed. Dropped records (mapped inside another or too shart) are
@@ -56,18 +88,62 @@ def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False):
     df['CUT_TIG_R'] = 0
 
     # Remove short alignments
-    for index in df.index:
-        if df.loc[index, 'QUERY_TIG_END'] - df.loc[index, 'QUERY_TIG_POS'] < min_trim_tig_len:
-            df.loc[index, 'INDEX'] = -1
+    df.loc[(df['QUERY_TIG_END'] - df['QUERY_TIG_POS']) < min_trim_tig_len, 'INDEX'] = -1
 
 
-    ###                                          ###
+    ###                                        ###
     ### Trim overlapping contigs in contig space ###
     ###                                          ###
 
     # Discard fully trimmed records
     df = df.loc[df['INDEX'] >= 0].copy()
 
+    df = _trim_by_group(_trim_tig_space, df, 'QUERY_ID', threads, min_trim_tig_len)
+
+    ###                                             ###
+    ### Trim overlapping contigs in reference space ###
+    ###                                             ###
+
+    # Discard fully trimmed records
+    df = df.loc[df['INDEX'] >= 0].copy()
+
+    df = _trim_by_group(_trim_ref_space, df, '#CHROM', threads, min_trim_tig_len, match_tig)
+
+    ###                      ###
+    ### Post trim formatting ###
+    ###                      ###
+
+    # Clean and re-sort
+    df = df.loc[df['INDEX'] >= 0].copy()
+
+    df = df.loc[(df['END'] - df['POS']) > 0]  # Should never occur, but don't allow 0-length records
+    df = df.loc[(df['QUERY_END'] - df['QUERY_POS']) > 0]
+
+    df.sort_values(['#CHROM', 'POS', 'END', 'QUERY_ID'], ascending=[True, True, False, True], inplace=True)
+
+    del(df['QUERY_LEN'])
+    del(df['SUB_LEN'])
+
+    # Check sanity
+    df_tig_fai = svpoplib.ref.get_df_fai(tig_fai)
+
+    check_records(df, df_tig_fai)
+
+    # Return trimmed alignments
+    return df
+
+
+def _trim_tig_space(df, min_trim_tig_len):
+    """
+    Trim overlapping alignment records in contig space.
+
+    :param df: Alignment dataframe.
+    :param min_trim_tig_len: Minimum alignment record length. Alignment records smaller will be discarded.
+
+    :return: Alignment dataframe sorted by contig and alignment length. Records that were removed have `INDEX` set to
+        -1.
+    """
+
     # Sort by alignment lengths in contig space
     df['QUERY_LEN'] = df['QUERY_END'] - df['QUERY_POS']
     df['SUB_LEN'] = df['END'] - df['POS']
@@ -76,188 +152,192 @@ def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False):
 
     df.reset_index(inplace=True, drop=True)
 
-    # Do trim in contig space #
-    iter_index_l = 0
-    index_max = df.shape[0]
-
-    while iter_index_l < index_max:
+    # Trim on column arrays. Records are read from and written to these arrays while trimming, and the DataFrame is
+    # rebuilt from them once trimming is done.
+    col_dict = {col: df[col].to_numpy(copy=True) for col in df.columns}
 
-        iter_index_r = iter_index_l + 1
+    chrom = col_dict['#CHROM']
+    pos = col_dict['POS']
+    end = col_dict['END']
+    tig_pos = col_dict['QUERY_TIG_POS']
+    tig_end = col_dict['QUERY_TIG_END']
+    is_rev = col_dict['REV']
+    aln_index = col_dict['INDEX']
 
-        while iter_index_r < index_max and df.loc[iter_index_l, 'QUERY_ID'] == df.loc[iter_index_r, 'QUERY_ID']:
-
-            # Get index in order of contig placement
-            if df.loc[iter_index_l, 'QUERY_TIG_POS'] <= df.loc[iter_index_r, 'QUERY_TIG_POS']:
-                index_l = iter_index_l
-                index_r = iter_index_r
-            else:
-                index_l = iter_index_r
-                index_r = iter_index_l
+    # Do trim in contig space #
+    for iter_index_l, iter_index_r in zip(*_trim_overlap_pairs(pd.factorize(df['QUERY_ID'])[0], tig_pos, tig_end)):
 
-            # Skip if one record was already removed
-            if df.loc[index_l, 'INDEX'] < 0 or df.loc[index_r, 'INDEX'] < 0:
-                iter_index_r += 1
-                continue
+        # Get index in order of contig placement
+        if tig_pos[iter_index_l] <= tig_pos[iter_index_r]:
+            index_l = iter_index_l
+            index_r = iter_index_r
+        else:
+            index_l = iter_index_r
+            index_r = iter_index_l
 
-            # Skip if there is no overlap
-            if df.loc[index_r, 'QUERY_TIG_POS'] >= df.loc[index_l, 'QUERY_TIG_END']:
-                iter_index_r += 1
-                continue
+        # Skip if one record was already removed
+        if aln_index[index_l] < 0 or aln_index[index_r] < 0:
+            continue
 
-            # Check for record fully contained within another
-            if df.loc[index_r, 'QUERY_TIG_END'] <= df.loc[index_l, 'QUERY_TIG_END']:
-                df.loc[index_r, 'INDEX'] = -1
-                iter_index_r += 1
-                continue
+        # Skip if there is no overlap
+        if tig_pos[index_r] >= tig_end[index_l]:
+            continue
 
-            # Determine trim orientation (right side of index_l is to trimmed, so must be reversed so
-            # trimmed CIGAR records are at the beginning; left side of index_r is to be trimmed, which is
-            # already at the start of the CIGAR string).
-            rev_l = not df.loc[index_l, 'REV']  # Trim right end of index_l
-            rev_r = df.loc[index_r, 'REV']      # Trim left end of index_r
+        # Check for record fully contained within another
+        if tig_end[index_r] <= tig_end[index_l]:
+            aln_index[index_r] = -1
+            continue
 
-            # Detect overlap in contig space
-            if rev_l == rev_r or df.loc[index_l, '#CHROM'] != df.loc[index_r, '#CHROM']:
-                # Contigs were aligned in different reference chromosomes or orientations, no overlap
-                ref_overlap = False
+        # Determine trim orientation (right side of index_l is to trimmed, so must be reversed so
+        # trimmed CIGAR records are at the beginning; left side of index_r is to be trimmed, which is
+        # already at the start of the CIGAR string).
+        rev_l = not is_rev[index_l]  # Trim right end of index_l
+        rev_r = is_rev[index_r]      # Trim left end of index_r
 
-            else:
-                if df.loc[index_l, 'POS'] < df.loc[index_r, 'POS']:
-                    ref_overlap = df.loc[index_r, 'POS'] < df.loc[index_r, 'END']
+        # Detect overlap in contig space
+        if rev_l == rev_r or chrom[index_l] != chrom[index_r]:
+            # Contigs were aligned in different reference chromosomes or orientations, no overlap
+            ref_overlap = False
 
-                elif df.loc[index_r, 'POS'] < df.loc[index_l, 'POS']:
-                    ref_overlap = df.loc[index_l, 'POS'] < df.loc[index_r, 'END']
+        else:
+            if pos[index_l] < pos[index_r]:
+                ref_overlap = pos[index_r] < end[index_r]
 
-                else:
-                    # POS placement was the same,
-                    ref_overlap = False
-
-            # If contig alignments overlap in reference space and are in the same orientation, preferentially
-            # trim the downstream end more to left-align alignment-truncating SVs (first argument to
-            # trim_alignment_record is preferentially trimmed)
-            if ref_overlap:
-                # Try both trim orientations
-
-                # a: Try with record l as first and r as second
-                record_l_a, record_r_a = trim_alignment_record(
-                    df.loc[index_l], df.loc[index_r], 'query',
-                    rev_l=rev_l,
-                    rev_r=rev_r
-                )
+            elif pos[index_r] < pos[index_l]:
+                ref_overlap = pos[index_l] < end[index_r]
 
-                # b: Try with record r as first and l as second
-                record_l_b, record_r_b = trim_alignment_record(
-                    df.loc[index_r], df.loc[index_l], 'query',
-                    rev_l=rev_r,
-                    rev_r=rev_l
-                )
+            else:
+                # POS placement was the same,
+                ref_overlap = False
 
-                ### Determine which left-aligns best ###
-                keep = None
+        # If contig alignments overlap in reference space and are in the same orientation, preferentially
+        # trim the downstream end more to left-align alignment-truncating SVs (first argument to
+        # trim_alignment_record is preferentially trimmed)
+        if ref_overlap:
+            # Try both trim orientations
+
+            # a: Try with record l as first and r as second
+            record_l_a, record_r_a = trim_alignment_record(
+                _trim_get_record(col_dict, index_l), _trim_get_record(col_dict, index_r), 'query',
+                rev_l=rev_l,
+                rev_r=rev_r
+            )
 
-                # Case: Alignment trimming completely removes one of the records
-                rm_l_a = record_l_a['QUERY_TIG_END'] - record_l_a['QUERY_TIG_POS'] < min_trim_tig_len
-                rm_l_b = record_l_b['QUERY_TIG_END'] - record_l_b['QUERY_TIG_POS'] < min_trim_tig_len
+            # b: Try with record r as first and l as second
+            record_l_b, record_r_b = trim_alignment_record(
+                _trim_get_record(col_dict, index_r), _trim_get_record(col_dict, index_l), 'query',
+                rev_l=rev_r,
+                rev_r=rev_l
+            )
 
-                rm_r_a = record_r_a['QUERY_TIG_END'] - record_r_a['QUERY_TIG_POS'] < min_trim_tig_len
-                rm_r_b = record_r_b['QUERY_TIG_END'] - record_r_b['QUERY_TIG_POS'] < min_trim_tig_len
+            ### Determine which left-aligns best ###
+            keep = None
 
-                rm_any_a = rm_l_a or rm_r_a
-                rm_any_b = rm_l_b or rm_r_b
+            # Case: Alignment trimming completely removes one of the records
+            rm_l_a = record_l_a['QUERY_TIG_END'] - record_l_a['QUERY_TIG_POS'] < min_trim_tig_len
+            rm_l_b = record_l_b['QUERY_TIG_END'] - record_l_b['QUERY_TIG_POS'] < min_trim_tig_len
 
-                # Break tie if one way removes a record and the other does not
-                if rm_any_a and not rm_any_b:
-                    if not rm_l_a and rm_r_a:
-                        keep = 'a'
+            rm_r_a = record_r_a['QUERY_TIG_END'] - record_r_a['QUERY_TIG_POS'] < min_trim_tig_len
+            rm_r_b = record_r_b['QUERY_TIG_END'] - record_r_b['QUERY_TIG_POS'] < min_trim_tig_len
 
-                elif rm_any_b and not rm_any_a:
-                    if not rm_l_b and rm_r_b:
-                        keep = 'b'
+            rm_any_a = rm_l_a or rm_r_a
+            rm_any_b = rm_l_b or rm_r_b
 
-                # Break tie if both are removed in one (do not leave short alignments).
-                if keep is None and rm_any_a:  # Both l and r are None, case where one is None was checked
+            # Break tie if one way removes a record and the other does not
+            if rm_any_a and not rm_any_b:
+                if not rm_l_a and rm_r_a:
                     keep = 'a'
 
-                if keep is None and rm_any_b:  # Both l and r are None, case where one is None was checked
+            elif rm_any_b and not rm_any_a:
+                if not rm_l_b and rm_r_b:
                     keep = 'b'
 
-                # Break tie on most left-aligned base
-                if keep is None:
+            # Break tie if both are removed in one (do not leave short alignments).
+            if keep is None and rm_any_a:  # Both l and r are None, case where one is None was checked
+                keep = 'a'
 
-                    # Get position at end of trim
-                    trim_pos_l_a = record_l_a['END'] if not record_l_a['REV'] else record_l_a['POS']
-                    trim_pos_l_b = record_l_b['END'] if not record_l_b['REV'] else record_l_b['POS']
+            if keep is None and rm_any_b:  # Both l and r are None, case where one is None was checked
+                keep = 'b'
 
-                    if trim_pos_l_a <= trim_pos_l_b:
-                        keep = 'a'
-                    else:
-                        keep = 'b'
+            # Break tie on most left-aligned base
+            if keep is None:
 
-                # Set record_l and record_r to the kept record
-                if keep == 'a':
-                    record_l = record_l_a
-                    record_r = record_r_a
+                # Get position at end of trim
+                trim_pos_l_a = record_l_a['END'] if not record_l_a['REV'] else record_l_a['POS']
+                trim_pos_l_b = record_l_b['END'] if not record_l_b['REV'] else record_l_b['POS']
 
+                if trim_pos_l_a <= trim_pos_l_b:
+                    keep = 'a'
                 else:
-                    # Note: record at index_l became record_r_b (index_r become record_l_b)
-                    # Swap back to match the index
-                    record_l = record_r_b
-                    record_r = record_l_b
+                    keep = 'b'
+
+            # Set record_l and record_r to the kept record
+            if keep == 'a':
+                record_l = record_l_a
+                record_r = record_r_a
 
             else:
+                # Note: record at index_l became record_r_b (index_r become record_l_b)
+                # Swap back to match the index
+                record_l = record_r_b
+                record_r = record_l_b
 
-                # Switch record order if they are on the same contig and same orientation (note: rev_l and rev_r are
-                # opposite if contigs are mapped in the same orientation, one was swapped to trim the dowstream-
-                # aligned end).
-                if df.loc[index_l, '#CHROM'] == df.loc[index_r, '#CHROM'] and rev_l != rev_r:
-
-                    # Get position of end to be trimmed
-                    trim_pos_l = df.loc[index_l, 'END'] if not df.loc[index_l, 'REV'] else df.loc[index_l, 'POS']
-                    trim_pos_r = df.loc[index_r, 'POS'] if not df.loc[index_r, 'REV'] else df.loc[index_r, 'END']
-
-                    # Swap positions so the upstream-aligned end of the contig is index_l. The left end is
-                    # preferentially trimmed shorter where there are equal breakpoints effectively left-aligning
-                    # around large SVs (e.g. large DELs).
-                    if trim_pos_r < trim_pos_l:
-                        # Swap
-                        rev_tmp = rev_l
-                        rev_l = rev_r
-                        rev_r = rev_tmp
-
-                        index_tmp = index_l
-                        index_l = index_r
-                        index_r = index_tmp
-
-                # Trim record
-                record_l, record_r = trim_alignment_record(
-                    df.loc[index_l], df.loc[index_r], 'query',
-                    rev_l=rev_l,
-                    rev_r=rev_r
-                )
+        else:
 
-            # Modify if new aligned size is at least min_trim_tig_len, remove if shorter
-            if record_l['QUERY_TIG_END'] - record_l['QUERY_TIG_POS'] >= min_trim_tig_len:
-                df.loc[index_l] = record_l
-            else:
-                df.loc[index_l, 'INDEX'] = -1
+            # Switch record order if they are on the same contig and same orientation (note: rev_l and rev_r are
+            # opposite if contigs are mapped in the same orientation, one was swapped to trim the dowstream-
+            # aligned end).
+            if chrom[index_l] == chrom[index_r] and rev_l != rev_r:
+
+                # Get position of end to be trimmed
+                trim_pos_l = end[index_l] if not is_rev[index_l] else pos[index_l]
+                trim_pos_r = pos[index_r] if not is_rev[index_r] else end[index_r]
+
+                # Swap positions so the upstream-aligned end of the contig is index_l. The left end is
+                # preferentially trimmed shorter where there are equal breakpoints effectively left-aligning
+                # around large SVs (e.g. large DELs).
+                if trim_pos_r < trim_pos_l:
+                    # Swap
+                    rev_tmp = rev_l
+                    rev_l = rev_r
+                    rev_r = rev_tmp
+
+                    index_tmp = index_l
+                    index_l = index_r
+                    index_r = index_tmp
+
+            # Trim record
+            record_l, record_r = trim_alignment_record(
+                _trim_get_record(col_dict, index_l), _trim_get_record(col_dict, index_r), 'query',
+                rev_l=rev_l,
+                rev_r=rev_r
+            )
 
-            if (record_r['QUERY_TIG_END'] - record_r['QUERY_TIG_POS']) >= min_trim_tig_len:
-                df.loc[index_r] = record_r
-            else:
-                df.loc[index_r, 'INDEX'] = -1
+        # Modify if new aligned size is at least min_trim_tig_len, remove if shorter
+        if record_l['QUERY_TIG_END'] - record_l['QUERY_TIG_POS'] >= min_trim_tig_len:
+            _trim_set_record(col_dict, index_l, record_l)
+        else:
+            aln_index[index_l] = -1
 
-            # Next r record
-            iter_index_r += 1
+        if (record_r['QUERY_TIG_END'] - record_r['QUERY_TIG_POS']) >= min_trim_tig_len:
+            _trim_set_record(col_dict, index_r, record_r)
+        else:
+            aln_index[index_r] = -1
 
-        # Next l record
-        iter_index_l += 1
+    return pd.DataFrame(col_dict)
 
-    ###                                             ###
-    ### Trim overlapping contigs in reference space ###
-    ###                                             ###
 
-    # Discard fully trimmed records
-    df = df.loc[df['INDEX'] >= 0].copy()
+def _trim_ref_space(df, min_trim_tig_len, match_tig):
+    """
+    Trim overlapping alignment records in reference space.
+
+    :param df: Alignment dataframe.
+    :param min_trim_tig_len: Minimum alignment record length. Alignment records smaller will be discarded.
+    :param match_tig: Only trim records if the contig (query ID) matches.
+
+    :return: Alignment dataframe sorted by reference chromosome and alignment length. Records that were removed have
+        `INDEX` set to -1.
+    """
 
     # Sort by contig alignment length in reference space
     df['QUERY_LEN'] = df['QUERY_END'] - df['QUERY_POS']
@@ -267,97 +347,189 @@ def trim_alignments(df, min_trim_tig_len, tig_fai, match_tig=False):
 
     df.reset_index(inplace=True, drop=True)
 
+    col_dict = {col: df[col].to_numpy(copy=True) for col in df.columns}
+
+    pos = col_dict['POS']
+    end = col_dict['END']
+    aln_index = col_dict['INDEX']
+
+    # Get candidate pairs
+    pair_l, pair_r = _trim_overlap_pairs(pd.factorize(df['#CHROM'])[0], pos, end)
+
+    if match_tig:
+        # Skip pairs if query names differ
+        query_code = pd.factorize(df['QUERY_ID'])[0]
+
+        pair_match = query_code[pair_l] == query_code[pair_r]
+
+        pair_l = pair_l[pair_match]
+        pair_r = pair_r[pair_match]
+
     # Do trim in reference space
-    iter_index_l = 0
-    index_max = df.shape[0]
+    for iter_index_l, iter_index_r in zip(pair_l, pair_r):
 
-    while iter_index_l < index_max:
-        iter_index_r = iter_index_l + 1
+        # Skip if one record was already removed
+        if aln_index[iter_index_l] < 0 or aln_index[iter_index_r] < 0:
+            continue
 
-        while (
-                iter_index_r < index_max and
-                df.loc[iter_index_l, '#CHROM'] == df.loc[iter_index_r, '#CHROM']
-        ):
+        # Get indices ordered by contig placement
+        if pos[iter_index_l] <= pos[iter_index_r]:
+            index_l = iter_index_l
+            index_r = iter_index_r
+        else:
+            index_l = iter_index_r
+            index_r = iter_index_l
 
-            # Skip if one record was already removed
-            if df.loc[iter_index_l, 'INDEX'] < 0 or df.loc[iter_index_r, 'INDEX'] < 0:
-                iter_index_r += 1
-                continue
+        # Check for overlaps
+        if pos[index_r] < end[index_l]:
+            # Found overlapping records
 
-            # Skip if match_tig and query names differ
-            if match_tig and df.loc[iter_index_l, 'QUERY_ID'] != df.loc[iter_index_r, 'QUERY_ID']:
-                iter_index_r += 1
-                continue
+            # Check for record fully contained within another
+            if end[index_r] <= end[index_l]:
+                aln_index[index_r] = -1
 
-            # Get indices ordered by contig placement
-            if df.loc[iter_index_l, 'POS'] <= df.loc[iter_index_r, 'POS']:
-                index_l = iter_index_l
-                index_r = iter_index_r
             else:
-                index_l = iter_index_r
-                index_r = iter_index_l
 
-            # Check for overlaps
-            if df.loc[index_r, 'POS'] < df.loc[index_l, 'END']:
-                # Found overlapping records
-                # print('Ref Overlap: {}-{} ({}:{}-{},{} vs {}:{}-{},{}) [iter {}, {}]'.format(
-                #     df.loc[index_l, 'INDEX'], df.loc[index_r, 'INDEX'],
-                #     df.loc[index_l, 'QUERY_ID'], df.loc[index_l, 'QUERY_TIG_POS'], df.loc[index_l, 'QUERY_TIG_END'], ('-' if df.loc[index_l, 'REV'] else '+'),
-                #     df.loc[index_r, 'QUERY_ID'], df.loc[index_r, 'QUERY_TIG_POS'], df.loc[index_r, 'QUERY_TIG_END'], ('-' if df.loc[index_r, 'REV'] else '+'),
-                #     iter_index_l, iter_index_r
-                # ))
+                record_l, record_r = trim_alignment_record(
+                    _trim_get_record(col_dict, index_l), _trim_get_record(col_dict, index_r), 'subject'
+                )
 
-                # Check for record fully contained within another
-                if df.loc[index_r, 'END'] <= df.loc[index_l, 'END']:
-                    # print('\t* Fully contained')
+                if record_l is not None and record_r is not None:
 
-                    df.loc[index_r, 'INDEX'] = -1
+                    # Modify if new aligned size is at least min_trim_tig_len, remove if shorter
+                    if record_l['QUERY_TIG_END'] - record_l['QUERY_TIG_POS'] >= min_trim_tig_len:
+                        _trim_set_record(col_dict, index_l, record_l)
+                    else:
+                        aln_index[index_l] = -1
 
-                else:
+                    if (record_r['QUERY_TIG_END'] - record_r['QUERY_TIG_POS']) >= min_trim_tig_len:
+                        _trim_set_record(col_dict, index_r, record_r)
+                    else:
+                        aln_index[index_r] = -1
 
-                    record_l, record_r = pavlib.align.trim_alignment_record(df.loc[index_l], df.loc[index_r], 'subject')
+    return pd.DataFrame(col_dict)
 
-                    if record_l is not None and record_r is not None:
 
-                        # Modify if new aligned size is at least min_trim_tig_len, remove if shorter
-                        if record_l['QUERY_TIG_END'] - record_l['QUERY_TIG_POS'] >= min_trim_tig_len:
-                            df.loc[index_l] = record_l
-                        else:
-                            df.loc[index_l, 'INDEX'] = -1
+def _trim_by_group(trim_func, df, group_col, threads, *args):
+    """
+    Run a trimming function on groups of records that are trimmed independently of other groups (records on the
+    same contig or the same reference chromosome). Groups are split into chunks of consecutive groups and distributed
+    over a process pool, and results are concatenated in group order. Output is the same as running `trim_func` over
+    the whole table.
 
-                        if (record_r['QUERY_TIG_END'] - record_r['QUERY_TIG_POS']) >= min_trim_tig_len:
-                            df.loc[index_r] = record_r
-                        else:
-                            df.loc[index_r, 'INDEX'] = -1
+    :param trim_func: Trimming function (`_trim_tig_space()` or `_trim_ref_space()`).
+    :param df: Alignment dataframe.
+    :param group_col: Column defining groups.
+    :param threads: Number of processes.
+    :param args: Additional arguments to `trim_func`.
 
-            # Next r record
-            iter_index_r += 1
+    :return: Dataframe returned by `trim_func`.
+    """
 
-        # Next l record
-        iter_index_l += 1
+    group_list = sorted(set(df[group_col]))
 
-    ###                      ###
-    ### Post trim formatting ###
-    ###                      ###
+    if threads <= 1 or len(group_list) < 2:
+        return trim_func(df, *args)
 
-    # Clean and re-sort
-    df = df.loc[df['INDEX'] >= 0].copy()
+    # Split groups into consecutive chunks with a similar number of records
+    group_count = df[group_col].value_counts()[group_list].to_numpy()
 
-    df = df.loc[(df['END'] - df['POS']) > 0]  # Should never occur, but don't allow 0-length records
-    df = df.loc[(df['QUERY_END'] - df['QUERY_POS']) > 0]
+    chunk_count = min(len(group_list), threads * 4)
 
-    df.sort_values(['#CHROM', 'POS', 'END', 'QUERY_ID'], ascending=[True, True, False, True], inplace=True)
+    group_chunk = dict(zip(
+        group_list,
+        (np.cumsum(group_count) - group_count) * chunk_count // np.sum(group_count)
+    ))
 
-    del(df['QUERY_LEN'])
-    del(df['SUB_LEN'])
+    record_chunk = df[group_col].map(group_chunk)
 
-    # Check sanity
-    df_tig_fai = svpoplib.ref.get_df_fai(tig_fai)
+    df_list = [df.loc[record_chunk == chunk].copy() for chunk in sorted(set(group_chunk.values()))]
 
-    df.apply(pavlib.align.check_record, df_tig_fai=df_tig_fai, axis=1)
+    # Trim
+    with mp.Pool(threads) as pool:
+        df_list = pool.starmap(trim_func, [(df_chunk, *args) for df_chunk in df_list])
 
-    # Return trimmed alignments
-    return df
+    return pd.concat(df_list, axis=0).reset_index(drop=True)
+
+
+def _trim_overlap_pairs(group, pos, end):
+    """
+    Find pairs of alignment records that may overlap. Records are only paired within a group (e.g. same contig or same
+    reference chromosome), and intervals are treated as closed so records that only touch are also returned. Trimming
+    only shrinks records, so pairs not returned here cannot overlap at any point while trimming.
+
+    Pairs are found by sorting records by group and start position and searching for the last record in each group
+    starting at or before the end of each record.
+
+    :param group: Array of integer group codes for each record.
+    :param pos: Array of start positions.
+    :param end: Array of end positions.
+
+    :return: A tuple of two arrays (index_l, index_r) of record indices where index_l < index_r. Pairs are sorted by
+        index_l then index_r, which is the order nested loops over records would visit them.
+    """
+
+    n = len(pos)
+
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    group = np.asarray(group, dtype=np.int64)
+    pos = np.asarray(pos, dtype=np.int64)
+    end = np.maximum(np.asarray(end, dtype=np.int64), pos)
+
+    # Sort by group and start position
+    span = np.max(end) + 1
+
+    key = group * span + pos
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+
+    # For each record in sorted order, all records from the next one up to (not including) hi may overlap
+    hi = np.searchsorted(key, (group * span + end)[order], side='right')
+    count = hi - np.arange(1, n + 1)
+
+    total = np.sum(count)
+
+    sort_l = np.repeat(np.arange(n), count)
+    sort_r = sort_l + 1 + np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+
+    # Translate to record indices
+    index_a = order[sort_l]
+    index_b = order[sort_r]
+
+    index_l = np.minimum(index_a, index_b)
+    index_r = np.maximum(index_a, index_b)
+
+    pair_order = np.lexsort((index_r, index_l))
+
+    return index_l[pair_order], index_r[pair_order]
+
+
+def _trim_get_record(col_dict, index):
+    """
+    Get an alignment record from column arrays.
+
+    :param col_dict: Dictionary of column names to arrays.
+    :param index: Record index.
+
+    :return: Alignment record (Pandas Series).
+    """
+
+    return pd.Series({col: vals[index] for col, vals in col_dict.items()})
+
+
+def _trim_set_record(col_dict, index, record):
+    """
+    Write an alignment record to column arrays.
+
+    :param col_dict: Dictionary of column names to arrays.
+    :param index: Record index.
+    :param record: Alignment record (Pandas Series).
+    """
+
+    for col, vals in col_dict.items():
+        vals[index] = record[col]
 
 
 def trim_alignment_record(record_l, record_r, match_coord, rev_l=True, rev_r=False):
@@ -398,9 +570,9 @@ def trim_alignment_record(record_l, record_r, match_coord, rev_l=True, rev_r=Fal
     if match_coord not in {'query', 'subject'}:
         raise RuntimeError('Unknown match_coord parameter: {}: Expected "query" or "subject"'.format(match_coord))
 
-    # Get cigar operations (list of (op_len, op_code) tuples)
-    cigar_l = list(cigar_str_to_tuples(record_l))
-    cigar_r = list(cigar_str_to_tuples(record_r))
+    # Get cigar operations
+    cigar_l = get_cigar_array(record_l)
+    cigar_r = get_cigar_array(record_r)
 
     # Orient CIGAR operations so regions to be trimmed are at the head of the list
     if rev_l:
@@ -498,9 +670,9 @@ def trim_alignment_record(record_l, record_r, match_coord, rev_l=True, rev_r=Fal
         trim_r += np.min([residual_bp, cut_r[TC_OP_LEN] - 1])
         residual_bp -= trim_r
 
-    # Get cut CIGAR String
-    cigar_l_mod = cigar_l[cut_l[TC_INDEX]:]
-    cigar_r_mod = cigar_r[cut_r[TC_INDEX]:]
+    # Get cut CIGAR String (list of (op_len, op_code) tuples)
+    cigar_l_mod = cigar_l[cut_l[TC_INDEX]:].to_tuples()
+    cigar_r_mod = cigar_r[cut_r[TC_INDEX]:].to_tuples()
 
     # Shorten last alignment record if set.
     cigar_l_mod[0] = (cigar_l_mod[0][0] - trim_l, cigar_l_mod[0][1])
@@ -806,7 +978,8 @@ def trace_cigar_to_zero(cigar_list, diff_bp, aln_record, diff_query):
             cut on clipped records, so cumulative and including does not affect the algorithm.
         * TC_CLIPH_BP = 10: Cumulative number of hard-clipped bases up to AND INCLUDING this event.
 
-    :param cigar_list: List of cigar operation tuples (cigar_len, cigar_op) with cigar_op as characters (e.g. "X", "=").
+    :param cigar_list: List of cigar operation tuples (cigar_len, cigar_op) with cigar_op as characters (e.g. "X", "=")
+        or a `CigarArray` object.
     :param diff_bp: Number of query bases to trace back. Final record will traverse past this value.
     :param aln_record: Alignment record for error reporting.
     :param diff_query: Compute base differences for query (tig) sequence if `True`. If `False`, compute for subject
@@ -915,6 +1088,46 @@ def cigar_str_to_tuples(record):
     """
     Get an iterator for cigar operation tuples. Each tuple is (cigar-len, cigar-op).
 
+    :param record: Alignment record. The CIGAR field may be a CIGAR string or a `CigarArray` object.
+
+    :return: Iterator of CIGAR operation tuples.
+    """
+
+    return iter(get_cigar_array(record).to_tuples())
+
+
+def get_cigar_array(record):
+    """
+    Get packed CIGAR operations for an alignment record.
+
+    :param record: Alignment record. The CIGAR field may be a CIGAR string or a `CigarArray` object. If it is
+        already a `CigarArray` object, it is returned without parsing.
+
+    :return: A `CigarArray` object.
+    """
+
+    cigar = record['CIGAR']
+
+    if isinstance(cigar, CigarArray):
+        return cigar
+
+    try:
+        return CigarArray.from_str(cigar)
+
+    except ValueError:
+        # Raise errors with record information
+        list(_cigar_str_iter(record))
+
+        raise RuntimeError('Error parsing CIGAR string for contig {} alignment starting at {}:{}'.format(
+            record['QUERY_ID'], record['#CHROM'], record['POS']
+        ))
+
+
+def _cigar_str_iter(record):
+    """
+    Get an iterator for cigar operation tuples by parsing the CIGAR string one character at a time. Used to report
+    errors in malformed CIGAR strings.
+
     :param record: Alignment record.
 
     :return: Iterator of CIGAR operation tuples.
@@ -947,12 +1160,133 @@ def cigar_str_to_tuples(record):
         pos = len_pos + 1
 
 
+class CigarArray:
+    """
+    Packed CIGAR operations. Operation lengths and codes are stored in parallel arrays with operation codes from the
+    SAM specification (M=0, I=1, D=2, N=3, S=4, H=5, P=6, "="=7, X=8; see `CIGAR_M` through `CIGAR_X`).
+
+    Cumulative offsets are stored for each operation. `ref_pos[i]` is the number of reference bases consumed by
+    operations before operation `i` (M, D, N, =, X), and `qry_pos[i]` is the number of query bases consumed before
+    operation `i` including clipped bases (M, I, S, H, =, X). Both arrays have one more element than the number of
+    operations, the last element is the total for all operations.
+
+    Indexing with an integer returns a (cigar-len, cigar-op) tuple like the tuples from `cigar_str_to_tuples()`, and
+    indexing with a slice returns a new `CigarArray` object.
+    """
+
+    def __init__(self, op_len, op_code):
+        """
+        Create a packed CIGAR from arrays.
+
+        :param op_len: Array of operation lengths.
+        :param op_code: Array of operation codes.
+        """
+
+        self.op_len = np.asarray(op_len, dtype=np.uint32)
+        self.op_code = np.asarray(op_code, dtype=np.uint8)
+
+        if self.op_len.shape != self.op_code.shape:
+            raise RuntimeError('CIGAR operation length and code arrays differ in length: {} != {}'.format(
+                self.op_len.shape[0], self.op_code.shape[0]
+            ))
+
+        op_len_64 = self.op_len.astype(np.int64)
+
+        self.ref_pos = np.concatenate([[0], np.cumsum(op_len_64 * _CIGAR_CONSUME_REF[self.op_code])])
+        self.qry_pos = np.concatenate([[0], np.cumsum(op_len_64 * _CIGAR_CONSUME_QRY[self.op_code])])
+
+    @staticmethod
+    def from_str(cigar):
+        """
+        Parse a CIGAR string.
+
+        :param cigar: CIGAR string.
+
+        :return: A `CigarArray` object.
+
+        :raises ValueError: If the CIGAR string is malformed.
+        """
+
+        cigar_bytes = np.frombuffer(cigar.encode(), dtype=np.uint8)
+
+        is_digit = (cigar_bytes >= 48) & (cigar_bytes <= 57)
+
+        op_index = np.flatnonzero(~ is_digit)
+        op_code = _CIGAR_OP_CODE_ARR[cigar_bytes[op_index]]
+
+        # Check for unknown operations, operations without lengths, and trailing lengths without operations
+        if np.any(op_code == 255):
+            raise ValueError('Unknown CIGAR operation')
+
+        if op_index.shape[0] == 0:
+            if cigar_bytes.shape[0] > 0:
+                raise ValueError('CIGAR length without operation')
+
+            return CigarArray(op_index, op_code)
+
+        op_start = np.concatenate([[0], op_index[:-1] + 1])  # Index of the first digit for each operation
+
+        if np.any(op_start == op_index):
+            raise ValueError('Missing length in CIGAR string')
+
+        if op_index[-1] != cigar_bytes.shape[0] - 1:
+            raise ValueError('CIGAR length without operation')
+
+        if np.max(op_index - op_start) > 10:
+            raise ValueError('CIGAR operation length exceeds 32 bits')
+
+        # Get lengths. Each digit is scaled by its place value and digits are summed for each operation.
+        digit_index = np.flatnonzero(is_digit)
+
+        digit_val = (cigar_bytes[digit_index].astype(np.int64) - 48) * _POW10[
+            op_index[np.searchsorted(op_index, digit_index)] - digit_index - 1
+        ]
+
+        op_len = np.add.reduceat(digit_val, op_start - np.arange(op_index.shape[0]))
+
+        if np.max(op_len) > np.iinfo(np.uint32).max:
+            raise ValueError('CIGAR operation length exceeds 32 bits')
+
+        return CigarArray(op_len, op_code)
+
+    def to_tuples(self):
+        """
+        Get a list of (cigar-len, cigar-op) tuples with operations as characters (e.g. "=", "X").
+
+        :return: List of CIGAR operation tuples.
+        """
+
+        return list(zip(self.op_len.tolist(), _CIGAR_OP_CHAR_ARR[self.op_code].tolist()))
+
+    def op_chars(self):
+        """
+        Get a list of operations as characters.
+
+        :return: List of CIGAR operation characters.
+        """
+
+        return _CIGAR_OP_CHAR_ARR[self.op_code].tolist()
+
+    def __len__(self):
+        return self.op_len.shape[0]
+
+    def __getitem__(self, key):
+
+        if isinstance(key, slice):
+            return CigarArray(self.op_len[key], self.op_code[key])
+
+        return int(self.op_len[key]), _CIGAR_OP_CHAR[self.op_code[key]]
+
+    def __str__(self):
+        return ''.join([str(cigar_len) + cigar_op for cigar_len, cigar_op in self.to_tuples()])
+
+
 def match_bp(record, right_end):
     """
     Get the number of matching bases at the end of an alignment. Used by variant callers to left-align SVs through
     alignment-truncating events.
 
-    :param record: Alignment record (from alignment BED) with CIGAR string.
+    :param record: Alignment record (from alignment BED) with CIGAR string or `CigarArray` object.
     :param right_end: `True` if matching alignments from the right end of `record`, or `False` to match from
         the left end.
 
@@ -1010,44 +1344,255 @@ def get_max_cluster(df, chrom, min_prop=0.85, min_aln_len=1e6):
     return cluster_count.index[0]
 
 
-class AlignLift:
+class AlignLiftRecord:
     """
-    Create an alignment liftover object for translating between reference and contig alignments (both directions). Build
-    liftover from alignment data in a DataFrame (requires #CHROM, POS, END, QUERY_ID, QUERY_POS, and QUERY_END). The
-    DataFrame index must not have repeated values. The data-frame is also expected not to change, so feed this object
-    a copy if it might be altered while this object is in use.
+    Liftover arrays for one alignment record. Reference and query intervals for each CIGAR operation are stored in
+    sorted NumPy arrays, and coordinates are lifted by searching the interval start positions (`np.searchsorted`).
+
+    Reference intervals (`sub_pos`, `sub_end`) are built from aligned bases (M, =, X) and deletions (D), and each
+    reference interval maps to a query interval (`sub_data_pos`, `sub_data_end`). Query intervals (`qry_pos`,
+    `qry_end`) are built from aligned bases and insertions (I), and each maps to a reference interval (`qry_data_pos`,
+    `qry_data_end`). Query coordinates are in QUERY_POS space (reverse-complemented for reverse alignments). Inserted
+    and deleted bases map to a 1 bp interval on the other sequence, and lifts through them resolve to the end of that
+    interval.
     """
 
-    def __init__(self, df, df_fai, cache_align=10):
+    def __init__(self, row, qry_len):
         """
-        Create AlignLift instance.
+        Create liftover arrays for an alignment record.
 
-        :param df: Alignment BED file (post-cut) as DataFrame.
-        :param df_fai: Contig FAI file as Series.
-        :param cache_align: Number of alignment records to cache.
+        :param row: Alignment record (Pandas Series).
+        :param qry_len: Length of the query (contig) sequence. Used to translate coordinates for reverse-complemented
+            alignments.
         """
 
-        self.df = df
-        self.df_fai = df_fai
-        self.cache_align = cache_align
+        self.chrom = row['#CHROM']
+        self.query_id = row['QUERY_ID']
+        self.is_rev = row['REV']
+        self.index = row['INDEX']
+        self.qry_len = qry_len
 
-        # Check df
-        if len(set(df.index)) != df.shape[0]:
-            raise RuntimeError('Cannot create AlignLift object with duplicate index values')
+        # Get CIGAR and check query start position
+        cigar = get_cigar_array(row)
 
-        # Build a reference-coordinate and a tig-coordinate tree
-        self.ref_tree = collections.defaultdict(intervaltree.IntervalTree)
-        self.tig_tree = collections.defaultdict(intervaltree.IntervalTree)
+        op_code = cigar.op_code
 
-        for index, row in df.iterrows():
-            self.ref_tree[row['#CHROM']][row['POS']:row['END']] = index
-            self.tig_tree[row['QUERY_ID']][row['QUERY_TIG_POS']:row['QUERY_TIG_END']] = index
+        clipped_index = 0
 
-        # Build alignment caching structures
-        self.cache_queue = collections.deque()
+        while clipped_index < len(cigar) and op_code[clipped_index] in {CIGAR_S, CIGAR_H}:
+            clipped_index += 1
 
-        self.ref_cache = dict()
-        self.tig_cache = dict()
+        clipped_bp = cigar.qry_pos[clipped_index]
+
+        if row['QUERY_POS'] != clipped_bp:
+            raise RuntimeError(
+                'Number of clipped bases ({}) does not match query start position {}: Alignment {}:{} ({}:{})'.format(
+                    clipped_bp, row['QUERY_POS'], row['#CHROM'], row['POS'], row['QUERY_ID'], row['QUERY_POS']
+                )
+            )
+
+        # Check for unhandled operations
+        bad_op = ~ _CIGAR_LIFT_OPS[op_code]
+
+        if np.any(bad_op):
+            raise RuntimeError('Unhandled CIGAR operation: {}: Alignment {}:{} ({}:{})'.format(
+                _CIGAR_OP_CHAR[op_code[np.argmax(bad_op)]], row['#CHROM'], row['POS'], row['QUERY_ID'], row['QUERY_POS']
+            ))
+
+        # Get operation coordinates
+        op_len = cigar.op_len.astype(np.int64)
+        sub_bp = cigar.ref_pos[:-1] + row['POS']
+        qry_bp = cigar.qry_pos[:-1]
+
+        is_match = np.isin(op_code, (CIGAR_EQ, CIGAR_X, CIGAR_M)) & (op_len > 0)
+
+        # Reference intervals (aligned and deleted bases)
+        is_sub = is_match | ((op_code == CIGAR_D) & (op_len > 0))
+
+        self.sub_pos = sub_bp[is_sub]
+        self.sub_end = self.sub_pos + op_len[is_sub]
+        self.sub_data_pos = qry_bp[is_sub]
+        self.sub_data_end = self.sub_data_pos + np.where(is_match[is_sub], op_len[is_sub], 1)
+
+        # Query intervals (aligned and inserted bases)
+        is_qry = is_match | ((op_code == CIGAR_I) & (op_len > 0))
+
+        self.qry_pos = qry_bp[is_qry]
+        self.qry_end = self.qry_pos + op_len[is_qry]
+        self.qry_data_pos = sub_bp[is_qry]
+        self.qry_data_end = self.qry_data_pos + np.where(is_match[is_qry], op_len[is_qry], 1)
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes used by liftover arrays.
+        """
+
+        return (
+            self.sub_pos.nbytes + self.sub_end.nbytes + self.sub_data_pos.nbytes + self.sub_data_end.nbytes +
+            self.qry_pos.nbytes + self.qry_end.nbytes + self.qry_data_pos.nbytes + self.qry_data_end.nbytes
+        )
+
+    def lift_to_sub(self, pos):
+        """
+        Lift query (contig) coordinates to the subject (reference).
+
+        :param pos: Array of query coordinates (QUERY_TIG_POS space, not reversed for reverse alignments).
+
+        :return: A tuple of two arrays, lifted subject coordinates and a boolean array that is `True` for each
+            coordinate that was lifted. Coordinates ending exactly at the end of an interval are lifted through it.
+        """
+
+        pos = np.asarray(pos, dtype=np.int64)
+
+        # Reverse coordinates of pos if the alignment is reverse-complemented. Translates from QUERY_TIG_POS-space
+        # to QUERY_POS-space.
+        if self.is_rev:
+            pos = self.qry_len - pos
+
+        lift_pos, is_lift = _lift_arrays(self.qry_pos, self.qry_end, self.qry_data_pos, self.qry_data_end, pos)
+
+        # Allow queries to match if they end exactly at the alignment end
+        if not np.all(is_lift):
+            lift_pos_end, is_lift_end = _lift_arrays(
+                self.qry_pos, self.qry_end, self.qry_data_pos, self.qry_data_end, pos, end_match=True
+            )
+
+            lift_pos = np.where(is_lift, lift_pos, lift_pos_end)
+            is_lift |= is_lift_end
+
+        return lift_pos, is_lift
+
+    def lift_to_qry(self, pos):
+        """
+        Lift subject (reference) coordinates to the query (contig).
+
+        :param pos: Array of subject coordinates.
+
+        :return: A tuple of two arrays, lifted query coordinates (QUERY_TIG_POS space) and a boolean array that is
+            `True` for each coordinate that was lifted.
+        """
+
+        pos = np.asarray(pos, dtype=np.int64)
+
+        lift_pos, is_lift = _lift_arrays(self.sub_pos, self.sub_end, self.sub_data_pos, self.sub_data_end, pos)
+
+        if self.is_rev:
+            lift_pos = self.qry_len - lift_pos
+
+        return lift_pos, is_lift
+
+
+def _lift_arrays(begin, end, data_pos, data_end, pos, end_match=False):
+    """
+    Lift coordinates through sorted non-overlapping intervals.
+
+    :param begin: Interval start positions (sorted).
+    :param end: Interval end positions.
+    :param data_pos: Start of the interval each interval lifts to.
+    :param data_end: End of the interval each interval lifts to.
+    :param pos: Array of coordinates to lift.
+    :param end_match: If `True`, find intervals ending exactly at each position instead of intervals containing it.
+
+    :return: A tuple of two arrays, lifted coordinates and a boolean array that is `True` for each coordinate with a
+        matching interval.
+    """
+
+    if begin.shape[0] == 0:
+        return np.zeros(pos.shape, dtype=np.int64), np.zeros(pos.shape, dtype=bool)
+
+    index = np.searchsorted(begin, pos - 1 if end_match else pos, side='right') - 1
+
+    is_lift = index >= 0
+    index[~ is_lift] = 0
+
+    if end_match:
+        is_lift &= end[index] == pos
+    else:
+        is_lift &= pos < end[index]
+
+    # Interpolate coordinates, lifts through missing bases on the target (insertion or deletion) resolve to the end
+    lift_pos = np.where(
+        data_end[index] - data_pos[index] > 1,
+        data_pos[index] + (pos - begin[index]),
+        data_end[index]
+    )
+
+    return lift_pos, is_lift
+
+
+class AlignLift:
+    """
+    Create an alignment liftover object for translating between reference and contig alignments (both directions). Build
+    liftover from alignment data in a DataFrame (requires #CHROM, POS, END, QUERY_ID, QUERY_POS, and QUERY_END). The
+    DataFrame index must not have repeated values. The data-frame is also expected not to change, so feed this object
+    a copy if it might be altered while this object is in use.
+
+    Each alignment record is lifted through an `AlignLiftRecord` object (sorted arrays of CIGAR operation coordinates).
+    These are built when an alignment is first used and cached, or they are all built up front if `precompute` is
+    `True`. Least-recently used records are discarded when cached records exceed `max_cache_bytes`, and the most
+    recently used record is always kept. Counters "hits", "misses", and "evictions" count cache lookups and discarded
+    records.
+    """
+
+    def __init__(self, df, df_fai, max_cache_bytes=None, precompute=False):
+        """
+        Create AlignLift instance.
+
+        :param df: Alignment BED file (post-cut) as DataFrame.
+        :param df_fai: Contig FAI file as Series.
+        :param max_cache_bytes: Maximum size of cached alignment records in bytes. If `None`, set to
+            `DEFAULT_LIFT_CACHE_BYTES`.
+        :param precompute: Build liftover arrays for all alignment records up front and keep them for the life of this
+            object (`max_cache_bytes` is ignored).
+        """
+
+        if max_cache_bytes is None:
+            max_cache_bytes = DEFAULT_LIFT_CACHE_BYTES
+
+        if max_cache_bytes < 0:
+            raise RuntimeError('Alignment lift cache size must not be negative: {}'.format(max_cache_bytes))
+
+        self.df = df
+        self.df_fai = df_fai
+        self.max_cache_bytes = max_cache_bytes if not precompute else None
+
+        # Check df
+        if len(set(df.index)) != df.shape[0]:
+            raise RuntimeError('Cannot create AlignLift object with duplicate index values')
+
+        # Build a reference-coordinate and a tig-coordinate tree
+        self.ref_tree = collections.defaultdict(intervaltree.IntervalTree)
+        self.tig_tree = collections.defaultdict(intervaltree.IntervalTree)
+
+        for index, row in df.iterrows():
+            self.ref_tree[row['#CHROM']][row['POS']:row['END']] = index
+            self.tig_tree[row['QUERY_ID']][row['QUERY_TIG_POS']:row['QUERY_TIG_END']] = index
+
+        # Index sorted contig spans for gap interpolation. Key: Query ID, Value: Tuple of sorted QUERY_TIG_END,
+        # DataFrame index in QUERY_TIG_END order, sorted QUERY_TIG_POS, and DataFrame index in QUERY_TIG_POS order.
+        self.tig_span = dict()
+
+        for query_id, subdf in df.groupby('QUERY_ID'):
+            end_order = np.argsort(subdf['QUERY_TIG_END'].to_numpy(), kind='stable')
+            pos_order = np.argsort(subdf['QUERY_TIG_POS'].to_numpy(), kind='stable')
+
+            self.tig_span[query_id] = (
+                subdf['QUERY_TIG_END'].to_numpy()[end_order], subdf.index[end_order],
+                subdf['QUERY_TIG_POS'].to_numpy()[pos_order], subdf.index[pos_order]
+            )
+
+        # Build alignment caching structures
+        self.align_cache = collections.OrderedDict()  # Key: DataFrame index, Value: AlignLiftRecord
+        self.cache_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if precompute:
+            for index in df.index:
+                self._add_align(index)
 
     def lift_to_sub(self, query_id, coord, gap=False):
         """
@@ -1066,114 +1611,87 @@ class AlignLift:
         based on the alignment using a strategy outlined by the `gap` parameter.
 
         :param query_id: Query record ID.
-        :param coord: Query coordinates. May be a single value, list, or tuple.
+        :param coord: Query coordinates. May be a single value, list, tuple, or array. Coordinates lifted through the
+            same alignment record are lifted together.
         :param gap: Interpolate into an alignment gap between two contigs if `True`.
 
-        :return: Single coordinate tuple or list of coordinate tuples if `coord` is a list or tuple. Returns `None`
-            for coordinates that cannot be lifted.
+        :return: Single coordinate tuple or list of coordinate tuples if `coord` is a list, tuple, or array. Returns
+            `None` for coordinates that cannot be lifted.
         """
 
         # Determine type
-        if issubclass(coord.__class__, list) or issubclass(coord.__class__, tuple):
-            ret_list = True
-        else:
-            ret_list = False
-            coord = (coord,)
+        coord, ret_list = _lift_coord(coord)
 
-        # Do lift
-        lift_coord_list = list()
+        # Lift
+        lift_coord_list = self.lift_to_sub_many(query_id, coord, gap)
 
-        for pos in coord:
-            pos_org = pos  # Pre-reverse position
+        # Return coordinates
+        if ret_list:
+            return lift_coord_list
+        else:
+            return lift_coord_list[0]
 
-            # Find matching records
-            match_set = self.tig_tree[query_id][pos:(pos + 1)]
+    def lift_to_sub_many(self, query_id, coord, gap=False):
+        """
+        Lift many coordinates from query (tig) to subject (reference) in one pass. Coordinates are grouped by alignment
+        record, and each group is lifted through the record's liftover arrays together.
 
-            if len(match_set) == 1:
-                index = list(match_set)[0].data
+        :param query_id: Query record ID or a list or array of query record IDs (one for each coordinate).
+        :param coord: List or array of query coordinates.
+        :param gap: Interpolate into an alignment gap between two contigs if `True`. May be a list or array of
+            booleans (one for each coordinate).
 
-            elif len(match_set) == 0 and gap:
-                lift_coord_list.append(self._get_subject_gap(query_id, pos))
-                continue
-
-            else:
-                lift_coord_list.append(None)
-                continue
+        :return: A list of coordinate tuples (see `lift_to_sub()`), one for each coordinate. Elements are `None` for
+            coordinates that cannot be lifted.
+        """
 
-            # Get lift tree
-            if index not in self.tig_cache.keys():
-                self._add_align(index)
+        coord = coord.tolist() if isinstance(coord, np.ndarray) else list(coord)
 
-            lift_tree = self.tig_cache[index]
+        query_id_list = _lift_arg_list(query_id, len(coord), 'query_id')
+        gap_list = _lift_arg_list(gap, len(coord), 'gap')
 
-            # Get row
-            row = self.df.loc[index]
+        # Find alignment records
+        lift_coord_list = [None] * len(coord)
+        align_coord = collections.defaultdict(list)  # Alignment index -> coord index
 
-            # Reverse coordinates of pos if the alignment is reverse-complemented. Translates from QUERY_TIG_POS-space
-            # to QUERY_POS-space.
-            if row['REV']:
-                pos = self.df_fai[query_id] - pos
+        for coord_index, pos in enumerate(coord):
 
-            # Get match record
-            match_set = lift_tree[pos]
+            match_set = self.tig_tree[query_id_list[coord_index]][pos:(pos + 1)]
 
             if len(match_set) == 1:
-                match_interval = list(match_set)[0]
+                align_coord[list(match_set)[0].data].append(coord_index)
 
-            if len(match_set) == 0:
-                # Allow queries to match if they end exactly at the alignment end
-                match_set = lift_tree[pos - 1]
+            elif len(match_set) == 0 and gap_list[coord_index]:
+                lift_coord_list[coord_index] = self._get_subject_gap(query_id_list[coord_index], pos)
 
-                match_interval = list(match_set)[0] if len(match_set) == 1 else None
+        # Lift through each alignment record
+        for index, coord_index_list in align_coord.items():
 
-                if not match_interval or match_interval.end != pos:
-                    lift_coord_list.append(None)
+            align_rec = self._get_align(index)
 
-                    raise RuntimeError(
-                        (
-                            'Found no matches in a lift-tree for a record within a '
-                            'global to-subject tree: {}:{} (index={}, gap={})'
-                        ).format(query_id, pos_org, index, gap)
-                    )
+            lift_pos, is_lift = align_rec.lift_to_sub([coord[coord_index] for coord_index in coord_index_list])
 
-            elif len(match_set) > 1:
-                lift_coord_list.append(None)
+            if not np.all(is_lift):
+                coord_index = coord_index_list[np.argmin(is_lift)]
 
                 raise RuntimeError(
                     (
-                        'Found multiple matches in a lift-tree for a record within a '
+                        'Found no matches in a lift-tree for a record within a '
                         'global to-subject tree: {}:{} (index={}, gap={})'
-                    ).format(query_id, pos_org, index,  gap)
+                    ).format(query_id_list[coord_index], coord[coord_index], index, gap_list[coord_index])
                 )
 
-            # Interpolate coordinates
-            if match_interval.data[1] - match_interval.data[0] > 1:
-                lift_pos = match_interval.data[0] + (pos - match_interval.begin)
-
-                lift_coord_list.append((
-                    row['#CHROM'],
-                    lift_pos,
-                    row['REV'],
-                    lift_pos,
-                    lift_pos,
-                    (row['INDEX'],)
-                ))
-
-            else:  # Lift from missing bases on the target (insertion or deletion)
-                lift_coord_list.append((
-                    row['#CHROM'],
-                    match_interval.data[1],
-                    row['REV'],
-                    match_interval.data[1],
-                    match_interval.data[1],
-                    (row['INDEX'],)
-                ))
+            for coord_index, pos in zip(coord_index_list, lift_pos.tolist()):
+                lift_coord_list[coord_index] = (
+                    align_rec.chrom,
+                    pos,
+                    align_rec.is_rev,
+                    pos,
+                    pos,
+                    (align_rec.index,)
+                )
 
-        # Return coordinates
-        if ret_list:
-            return lift_coord_list
-        else:
-            return lift_coord_list[0]
+        return lift_coord_list
 
     def lift_to_qry(self, subject_id, coord):
         """
@@ -1189,88 +1707,80 @@ class AlignLift:
             5: Align record index.
 
         :param subject_id: Subject ID.
-        :param coord: Subject coordinates. May be a single value, list, or tuple.
+        :param coord: Subject coordinates. May be a single value, list, tuple, or array. Coordinates lifted through the
+            same alignment record are lifted together.
 
-        :return: Single coordinate tuple or list of coordinate tuples if `coord` is a list or tuple. Returns `None`
-            for coordinates that cannot be lifted.
+        :return: Single coordinate tuple or list of coordinate tuples if `coord` is a list, tuple, or array. Returns
+            `None` for coordinates that cannot be lifted.
         """
 
         # Determine type
-        if issubclass(coord.__class__, list) or issubclass(coord.__class__, tuple):
-            ret_list = True
+        coord, ret_list = _lift_coord(coord)
+
+        # Lift
+        lift_coord_list = self.lift_to_qry_many(subject_id, coord)
+
+        # Return coordinates
+        if ret_list:
+            return lift_coord_list
         else:
-            ret_list = False
-            coord = (coord,)
+            return lift_coord_list[0]
 
-        # Do lift
-        lift_coord_list = list()
+    def lift_to_qry_many(self, subject_id, coord):
+        """
+        Lift many coordinates from subject (reference) to query (tig) in one pass. Coordinates are grouped by alignment
+        record, and each group is lifted through the record's liftover arrays together.
 
-        for pos in coord:
-            match_set = self.ref_tree[subject_id][pos:(pos + 1)]
+        :param subject_id: Subject ID or a list or array of subject IDs (one for each coordinate).
+        :param coord: List or array of subject coordinates.
 
-            # Check coordinates
-            if len(match_set) == 0:
-                lift_coord_list.append(None)
-                continue
+        :return: A list of coordinate tuples (see `lift_to_qry()`), one for each coordinate. Elements are `None` for
+            coordinates that cannot be lifted.
+        """
 
-                # raise ValueError('Subject region {}:{} has no to-query lift records'.format(subject_id, pos))
+        coord = coord.tolist() if isinstance(coord, np.ndarray) else list(coord)
 
-            if len(match_set) > 1:
-                lift_coord_list.append(None)
-                continue
+        subject_id_list = _lift_arg_list(subject_id, len(coord), 'subject_id')
 
-                # raise ValueError(
-                #     'Subject region {}:{} has {} to-query lift records'.format(subject_id, pos, len(match_set))
-                # )
+        # Find alignment records. Coordinates with no records or multiple records are not lifted.
+        lift_coord_list = [None] * len(coord)
+        align_coord = collections.defaultdict(list)  # Alignment index -> coord index
 
-            # Get lift tree
-            index = list(match_set)[0].data
+        for coord_index, pos in enumerate(coord):
 
-            if index not in self.ref_cache.keys():
-                self._add_align(index)
+            match_set = self.ref_tree[subject_id_list[coord_index]][pos:(pos + 1)]
 
-            lift_tree = self.ref_cache[index]
+            if len(match_set) == 1:
+                align_coord[list(match_set)[0].data].append(coord_index)
+
+        # Lift through each alignment record
+        for index, coord_index_list in align_coord.items():
+
+            align_rec = self._get_align(index)
 
-            # Save row
-            row = self.df.loc[index]
+            lift_pos, is_lift = align_rec.lift_to_qry([coord[coord_index] for coord_index in coord_index_list])
 
-            # Get match record
-            match_set = lift_tree[pos:(pos + 1)]
+            if not np.all(is_lift):
+                coord_index = coord_index_list[np.argmin(is_lift)]
 
-            if len(match_set) != 1:
                 raise RuntimeError(
                     (
                         'Program bug: Found no matches in a lift-tree for a record withing a '
                         'global to-query tree: {}:{} (index={})'
-                    ).format(subject_id, pos, index)
+                    ).format(subject_id_list[coord_index], coord[coord_index], index)
                 )
 
-            match_interval = list(match_set)[0]
-
-            # Interpolate coordinates
-            if match_interval.data[1] - match_interval.data[0] > 1:
-                qry_pos = match_interval.data[0] + (pos - match_interval.begin)
-
-            else:  # Lift from missing bases on the target (insertion or deletion)
-                qry_pos = match_interval.data[1]
-
-            if row['REV']:
-                qry_pos = self.df_fai[row['QUERY_ID']] - qry_pos
-
-            lift_coord_list.append((
-                row['QUERY_ID'],
-                qry_pos,
-                row['REV'],
-                qry_pos,
-                qry_pos,
-                (row['INDEX'],)
-            ))
+            for coord_index, pos in zip(coord_index_list, lift_pos.tolist()):
+                lift_coord_list[coord_index] = (
+                    align_rec.query_id,
+                    pos,
+                    align_rec.is_rev,
+                    pos,
+                    pos,
+                    (align_rec.index,)
+                )
 
-        # Return coordinates
-        if ret_list:
-            return lift_coord_list
-        else:
-            return lift_coord_list[0]
+        return lift_coord_list
 
     def lift_region_to_sub(self, region, gap=False):
         """
@@ -1282,26 +1792,31 @@ class AlignLift:
         :return: Subject region or `None` if it could not be lifted.
         """
 
-        # Lift
-        sub_pos, sub_end = self.lift_to_sub(region.chrom, (region.pos, region.end), gap)
+        return self.lift_region_to_sub_many([region], gap)[0]
 
-        # Check lift: Must lift both ends to the same subject ID
-        if sub_pos is None or sub_end is None:
-            return None
+    def lift_region_to_sub_many(self, region_list, gap=False):
+        """
+        Lift regions to subject. Both ends of all regions are lifted in one pass (see `lift_to_sub_many()`).
 
-        if sub_pos[0] != sub_end[0] or (sub_pos[2] is not None and sub_end[2] is not None and sub_pos[2] != sub_end[2]):
-            return None
+        :param region_list: List of query regions.
+        :param gap: Interpolate within gap if `True`. May be a list of booleans (one for each region).
+
+        :return: A list of subject regions (`None` for regions that could not be lifted).
+        """
 
-        # Return
-        return pavlib.seq.Region(
-            sub_pos[0], sub_pos[1], sub_end[1],
-            is_rev=False,
-            pos_min=sub_pos[3], pos_max=sub_pos[4],
-            end_min=sub_end[3], end_max=sub_end[4],
-            pos_aln_index=(sub_pos[5],),
-            end_aln_index=(sub_end[5],)
+        gap_list = _lift_arg_list(gap, len(region_list), 'gap')
+
+        # Lift
+        lift_coord_list = self.lift_to_sub_many(
+            [region.chrom for region in region_list for i in range(2)],
+            [coord for region in region_list for coord in (region.pos, region.end)],
+            [region_gap for region_gap in gap_list for i in range(2)]
         )
 
+        return [
+            _sub_lift_region(sub_pos, sub_end) for sub_pos, sub_end in zip(lift_coord_list[0::2], lift_coord_list[1::2])
+        ]
+
     def lift_region_to_qry(self, region):
         """
         Lift region to query.
@@ -1311,26 +1826,27 @@ class AlignLift:
         :return: Query region or `None` if it could not be lifted.
         """
 
-        # Lift
-        query_pos, query_end = self.lift_to_qry(region.chrom, (region.pos, region.end))
+        return self.lift_region_to_qry_many([region])[0]
 
-        # Check lift: Must lift both ends to the same query ID
-        if query_pos is None or query_end is None:
-            return None
+    def lift_region_to_qry_many(self, region_list):
+        """
+        Lift regions to query. Both ends of all regions are lifted in one pass (see `lift_to_qry_many()`).
 
-        if query_pos[0] != query_end[0] or query_pos[2] != query_end[2]:
-            return None
+        :param region_list: List of subject regions.
+
+        :return: A list of query regions (`None` for regions that could not be lifted).
+        """
 
-        # Return
-        return pavlib.seq.Region(
-            query_pos[0], query_pos[1], query_end[1],
-            is_rev=query_pos[2],
-            pos_min=query_pos[3], pos_max=query_pos[4],
-            end_min=query_end[3], end_max=query_end[4],
-            pos_aln_index=(query_pos[5],),
-            end_aln_index=(query_end[5],)
+        # Lift
+        lift_coord_list = self.lift_to_qry_many(
+            [region.chrom for region in region_list for i in range(2)],
+            [coord for region in region_list for coord in (region.pos, region.end)]
         )
 
+        return [
+            _qry_lift_region(query_pos, query_end) for query_pos, query_end in zip(lift_coord_list[0::2], lift_coord_list[1::2])
+        ]
+
     def _get_subject_gap(self, query_id, pos):
         """
         Interpolate lift coordinates to an alignment gap.
@@ -1341,27 +1857,22 @@ class AlignLift:
         """
 
         # Check arguments
-        if pos is None:
+        if pos is None or query_id not in self.tig_span:
             return None
 
-        # Get alignment records for this contig
-        subdf = self.df.loc[self.df['QUERY_ID'] == query_id]
+        # Get sorted spans of alignment records for this contig
+        end_arr, end_index, pos_arr, pos_index = self.tig_span[query_id]
 
-        # Must be flanked by two contigs on either side
-        if not np.any(subdf['QUERY_TIG_END'] < pos):
-            return None
+        end_n = np.searchsorted(end_arr, pos, side='left')  # Number of records ending before pos
+        pos_n = np.searchsorted(pos_arr, pos, side='right')  # Number of records starting at or before pos
 
-        if not np.any(subdf['QUERY_TIG_POS'] > pos):
+        # Must be flanked by two contigs on either side
+        if end_n == 0 or pos_n == pos_arr.shape[0]:
             return None
 
         # Get left and right rows for the alignment record flanking this position
-        row_l = subdf.loc[
-            subdf.loc[subdf['QUERY_TIG_END'] < pos, 'QUERY_TIG_END'].sort_values().index[-1]
-        ]
-
-        row_r = subdf.loc[
-            subdf.loc[subdf['QUERY_TIG_POS'] > pos, 'QUERY_TIG_POS'].sort_values().index[0]
-        ]
+        row_l = self.df.loc[end_index[end_n - 1]]
+        row_r = self.df.loc[pos_index[pos_n]]
 
         # Rows must be mapped to the same subject
         if row_l['#CHROM'] != row_r['#CHROM']:
@@ -1378,108 +1889,160 @@ class AlignLift:
             )
         )
 
-    def _add_align(self, index):
+    def cache_stats(self):
         """
-        Add an alignment from DataFrame index `index`.
+        Get alignment record cache statistics.
+
+        :return: A string of cache statistics suitable for logs.
+        """
+
+        return 'hits={}, misses={}, evictions={}, cached={} alignment(s), cached_bytes={:,d}, max_bytes={}'.format(
+            self.hits, self.misses, self.evictions, len(self.align_cache), self.cache_bytes,
+            '{:,d}'.format(self.max_cache_bytes) if self.max_cache_bytes is not None else 'None'
+        )
+
+    def _get_align(self, index):
+        """
+        Get liftover arrays for an alignment record, building them if they are not cached.
 
         :param index: DataFrame index.
+
+        :return: An `AlignLiftRecord` object.
         """
 
-        # No alignment to add if it's already cached.
-        if index in self.ref_cache.keys():
+        if index in self.align_cache:
+            self.hits += 1
+            self.align_cache.move_to_end(index)
+
+            return self.align_cache[index]
 
-            # Append to end (last used) and skip adding alignment
-            while index in self.cache_queue:
-                self.cache_queue.remove(index)
+        self.misses += 1
 
-            self.cache_queue.appendleft(index)
+        return self._add_align(index)
 
-            return
+    def _add_align(self, index):
+        """
+        Add an alignment from DataFrame index `index`.
 
-        # Make space for this alignment
-        self._check_and_clear()
+        :param index: DataFrame index.
+
+        :return: An `AlignLiftRecord` object.
+        """
 
         # Get row
         row = self.df.loc[index]
 
-        # Build lift trees
-        sub_bp = row['POS']
-        qry_bp = 0
+        # Build liftover arrays
+        align_rec = AlignLiftRecord(row, self.df_fai[row['QUERY_ID']])
 
-        itree_ref = intervaltree.IntervalTree()
-        itree_tig = intervaltree.IntervalTree()
+        # Make space and add
+        if self.max_cache_bytes is not None:
+            while len(self.align_cache) > 0 and self.cache_bytes + align_rec.nbytes > self.max_cache_bytes:
+                self.cache_bytes -= self.align_cache.popitem(last=False)[1].nbytes
+                self.evictions += 1
 
-        # Get CIGAR and check query start position
-        cigar_op_list = list(cigar_str_to_tuples(self.df.loc[index]))
+        self.align_cache[index] = align_rec
+        self.cache_bytes += align_rec.nbytes
 
-        clipped_bp = 0
+        return align_rec
 
-        cigar_index = 0
 
-        while cigar_index < len(cigar_op_list) and cigar_op_list[cigar_index][1] in {'S', 'H'}:
-            clipped_bp += cigar_op_list[cigar_index][0]
-            cigar_index += 1
+def _lift_arg_list(val, n, arg_name):
+    """
+    Get a list of values for each coordinate from an argument that may be a single value or a list of values.
 
-        if row['QUERY_POS'] != clipped_bp:
-            raise RuntimeError(
-                'Number of clipped bases ({}) does not match query start position {}: Alignment {}:{} ({}:{})'.format(
-                    clipped_bp, row['QUERY_POS'], row['#CHROM'], row['POS'], row['QUERY_ID'], row['QUERY_POS']
-                )
-            )
+    :param val: Single value or a list, tuple, or array of values.
+    :param n: Number of coordinates.
+    :param arg_name: Argument name for error messages.
 
-        # Build trees
-        for cigar_len, cigar_op in cigar_op_list:
+    :return: A list of `n` values.
+    """
 
-            if cigar_op in {'=', 'X', 'M'}:
+    if isinstance(val, np.ndarray):
+        val = val.tolist()
 
-                itree_ref[sub_bp:(sub_bp + cigar_len)] = (qry_bp, qry_bp + cigar_len)
-                itree_tig[qry_bp:(qry_bp + cigar_len)] = (sub_bp, sub_bp + cigar_len)
+    if not (issubclass(val.__class__, list) or issubclass(val.__class__, tuple)):
+        return [val] * n
 
-                sub_bp += cigar_len
-                qry_bp += cigar_len
+    if len(val) != n:
+        raise RuntimeError('Length of "{}" ({}) does not match the number of coordinates ({})'.format(arg_name, len(val), n))
 
-            elif cigar_op == 'I':
+    return val
 
-                itree_tig[qry_bp:(qry_bp + cigar_len)] = (sub_bp, sub_bp + 1)
 
-                qry_bp += cigar_len
+def _sub_lift_region(sub_pos, sub_end):
+    """
+    Get a subject region from lifted coordinates (see `AlignLift.lift_region_to_sub()`).
 
-            elif cigar_op == 'D':
+    :param sub_pos: Lifted start coordinate tuple.
+    :param sub_end: Lifted end coordinate tuple.
 
-                itree_ref[sub_bp:(sub_bp + cigar_len)] = (qry_bp, qry_bp + 1)
+    :return: Subject region or `None` if both ends were not lifted to the same subject ID and orientation.
+    """
 
-                sub_bp += cigar_len
+    # Check lift: Must lift both ends to the same subject ID
+    if sub_pos is None or sub_end is None:
+        return None
 
-            elif cigar_op in {'S', 'H'}:
+    if sub_pos[0] != sub_end[0] or (sub_pos[2] is not None and sub_end[2] is not None and sub_pos[2] != sub_end[2]):
+        return None
 
-                qry_bp += cigar_len
+    # Return
+    return pavlib.seq.Region(
+        sub_pos[0], sub_pos[1], sub_end[1],
+        is_rev=False,
+        pos_min=sub_pos[3], pos_max=sub_pos[4],
+        end_min=sub_end[3], end_max=sub_end[4],
+        pos_aln_index=(sub_pos[5],),
+        end_aln_index=(sub_end[5],)
+    )
 
-                clipped_bp += cigar_len
 
-            else:
-                row = self.df.loc[index]
+def _qry_lift_region(query_pos, query_end):
+    """
+    Get a query region from lifted coordinates (see `AlignLift.lift_region_to_qry()`).
 
-                raise RuntimeError('Unhandled CIGAR operation: {}: Alignment {}:{} ({}:{})'.format(
-                    cigar_op, row['#CHROM'], row['POS'], row['QUERY_ID'], row['QUERY_POS']
-                ))
+    :param query_pos: Lifted start coordinate tuple.
+    :param query_end: Lifted end coordinate tuple.
 
-        # Cache trees
-        self.ref_cache[index] = itree_ref
-        self.tig_cache[index] = itree_tig
+    :return: Query region or `None` if both ends were not lifted to the same query ID and orientation.
+    """
 
-        # Add index to end of queue
-        self.cache_queue.appendleft(index)
+    # Check lift: Must lift both ends to the same query ID
+    if query_pos is None or query_end is None:
+        return None
 
-    def _check_and_clear(self):
-        """
-        Check alignment cache and clear if necessary to make space.
-        """
+    if query_pos[0] != query_end[0] or query_pos[2] != query_end[2]:
+        return None
+
+    # Return
+    return pavlib.seq.Region(
+        query_pos[0], query_pos[1], query_end[1],
+        is_rev=query_pos[2],
+        pos_min=query_pos[3], pos_max=query_pos[4],
+        end_min=query_end[3], end_max=query_end[4],
+        pos_aln_index=(query_pos[5],),
+        end_aln_index=(query_end[5],)
+    )
+
+
+def _lift_coord(coord):
+    """
+    Get a list of coordinates to lift.
+
+    :param coord: A single coordinate, list, tuple, or array.
+
+    :return: A tuple of the coordinates as a list or tuple and `True` if a list of lifted coordinates should be returned
+        (`coord` was a list, tuple, or array).
+    """
+
+    if isinstance(coord, np.ndarray):
+        return coord.tolist(), True
 
-        while len(self.cache_queue) >= self.cache_align:
-            index = self.cache_queue.pop()
+    if issubclass(coord.__class__, list) or issubclass(coord.__class__, tuple):
+        return coord, True
 
-            del(self.ref_cache[index])
-            del(self.tig_cache[index])
+    return (coord,), False
 
 
 def check_record(row, df_tig_fai):
@@ -1590,6 +2153,76 @@ def check_record(row, df_tig_fai):
         )
 
 
+def check_records(df, df_tig_fai):
+    """
+    Check all records in an alignment DataFrame for sanity. Performs the same checks as `check_record()`, but checks
+    are done on whole columns. If any record fails, `check_record()` is run on the first failing record so the same
+    exception is raised with the same message. Returns nothing if everything passes.
+
+    :param df: Dataframe of alignment records.
+    :param df_tig_fai: Panadas Series with contig names as keys and contig lengths as values.
+    """
+
+    if df.shape[0] == 0:
+        return
+
+    # Count CIGAR bases
+    cigar_counts = np.zeros((df.shape[0], 6), dtype=np.int64)
+
+    for index, cigar in enumerate(df['CIGAR']):
+        try:
+            cigar_counts[index] = count_cigar({'CIGAR': cigar})
+
+        except Exception:
+            check_record(df.iloc[index], df_tig_fai)
+            raise
+
+    ref_bp, tig_bp, clip_h_l, clip_s_l = (cigar_counts[:, col] for col in range(4))
+
+    # Get contig lengths
+    tig_len = df['QUERY_ID'].map(df_tig_fai)
+
+    if np.any(pd.isnull(tig_len)):
+        check_record(df.iloc[np.flatnonzero(pd.isnull(tig_len))[0]], df_tig_fai)
+
+    tig_len = np.asarray(tig_len, dtype=np.int64)
+
+    # Get columns
+    pos = np.asarray(df['POS'], dtype=np.int64)
+    end = np.asarray(df['END'], dtype=np.int64)
+    query_pos = np.asarray(df['QUERY_POS'], dtype=np.int64)
+    query_end = np.asarray(df['QUERY_END'], dtype=np.int64)
+    query_tig_pos = np.asarray(df['QUERY_TIG_POS'], dtype=np.int64)
+    query_tig_end = np.asarray(df['QUERY_TIG_END'], dtype=np.int64)
+    is_rev = np.asarray(df['REV'], dtype=bool)
+
+    # Find records failing any check (same checks as check_record())
+    fail = (
+        (pos + ref_bp != end) |
+        (query_pos + tig_bp != query_end) |
+        (query_tig_pos + tig_bp != query_tig_end) |
+        (is_rev & (query_tig_pos != tig_len - query_end)) |
+        (is_rev & (query_tig_end != tig_len - query_pos)) |
+        (~ is_rev & (query_tig_pos != query_pos)) |
+        (~ is_rev & (query_tig_end != query_end)) |
+        (query_pos >= query_end) |
+        (query_tig_pos >= query_tig_end) |
+        (pos >= end) |
+        (query_tig_end > tig_len) |
+        (query_end > tig_len) |
+        (query_pos != clip_h_l + clip_s_l)
+    )
+
+    if np.any(fail):
+        index = np.flatnonzero(fail)[0]
+
+        check_record(df.iloc[index], df_tig_fai)
+
+        raise RuntimeError('Program bug: Record failed vectorized checks, but passed check_record() (INDEX={})'.format(
+            df.iloc[index]['INDEX']
+        ))
+
+
 def check_record_err_string(df, df_tig_fai):
     """
     Runs check_record on each row of `df`, captures exceptions, and returns a Series of error message strings instead
@@ -1625,13 +2258,47 @@ def count_cigar(row, allow_m=False):
     * clip_h_r: Hard-clipped bases on the right (downstream) side.
     * clip_s_r: Soft-clipped bases on the right (downstream) side.
 
-    :param row: Row with CIGAR records as a CIGAR string.
+    :param row: Row with CIGAR records as a CIGAR string or a `CigarArray` object.
     :param allow_m: If True, allow "M" CIGAR operations. PAV does not allow M operations, this option exists for other
         tools using the PAV library.
 
     :return: A tuple of (ref_bp, tig_bp, clip_h_l, clip_s_l, clip_h_r, clip_s_r).
     """
 
+    cigar = get_cigar_array(row)
+
+    # Count from packed operations if clipping is well-formed (H then S on the left, S then H on the right) and there
+    # are only alignment operations between clipped ends. Other cases fall through to the checks below, which
+    # raise the appropriate error.
+    op_code = cigar.op_code
+
+    align_index = np.flatnonzero((op_code != CIGAR_S) & (op_code != CIGAR_H))
+
+    if align_index.shape[0] > 0:
+        op_len = cigar.op_len.astype(np.int64)
+
+        align_first = align_index[0]
+        align_last = align_index[-1] + 1
+
+        clip_l = op_code[:align_first].tolist()
+        clip_r = op_code[align_last:].tolist()
+
+        if (
+            clip_l in ([], [CIGAR_H], [CIGAR_S], [CIGAR_H, CIGAR_S]) and
+            clip_r in ([], [CIGAR_S], [CIGAR_H], [CIGAR_S, CIGAR_H]) and
+            np.all((_CIGAR_ALIGN_OPS_M if allow_m else _CIGAR_ALIGN_OPS)[op_code[align_first:align_last]])
+        ):
+            clip_h_l = int(op_len[0]) if clip_l[:1] == [CIGAR_H] else 0
+            clip_s_l = int(op_len[align_first - 1]) if clip_l[-1:] == [CIGAR_S] else 0
+
+            clip_s_r = int(op_len[align_last]) if clip_r[:1] == [CIGAR_S] else 0
+            clip_h_r = int(op_len[-1]) if clip_r[-1:] == [CIGAR_H] else 0
+
+            ref_bp = int(cigar.ref_pos[-1])
+            tig_bp = int(cigar.qry_pos[-1]) - clip_h_l - clip_s_l - clip_s_r - clip_h_r
+
+            return ref_bp, tig_bp, clip_h_l, clip_s_l, clip_h_r, clip_s_r
+
     ref_bp = 0
     tig_bp = 0
 
@@ -1641,7 +2308,7 @@ def count_cigar(row, allow_m=False):
     clip_s_r = 0
     clip_h_r = 0
 
-    cigar_list = list(pavlib.align.cigar_str_to_tuples(row))
+    cigar_list = cigar.to_tuples()
 
     cigar_n = len(cigar_list)
 
@@ -1749,6 +2416,9 @@ def get_align_bed(align_file, df_tig_fai, hap, chrom_cluster=False, min_mapq=0):
     """
     Read alignment file as a BED file that PAV can process. Drops any records marked as unaligned by the SAM flag.
 
+    Records are streamed into typed column buffers (see `AlignBedColumns`) and the DataFrame is built once after all
+    records are read. "#CHROM" and "QUERY_ID" are categorical columns.
+
     :param align_file: SAM, CRAM, BAM, anything `pysam.AlignmentFile` can read.
     :param df_tig_fai: Pandas Series with contig names as keys and contig lengths as values. Index should be cast as
         type str if contig names are numeric.
@@ -1764,11 +2434,12 @@ def get_align_bed(align_file, df_tig_fai, hap, chrom_cluster=False, min_mapq=0):
     """
 
     # Get records from SAM
-    record_list = list()
-
     align_index = 0
 
     with pysam.AlignmentFile(align_file, 'rb') as in_file:
+
+        align_cols = AlignBedColumns(in_file.references, df_tig_fai)
+
         for record in in_file:
 
             # Increment align_index
@@ -1778,12 +2449,6 @@ def get_align_bed(align_file, df_tig_fai, hap, chrom_cluster=False, min_mapq=0):
             if record.is_unmapped or record.mapping_quality < min_mapq or len(record.cigar) == 0:
                 continue
 
-            # Get length for computing real tig positions for rev-complemented records
-            tig_len = df_tig_fai[record.query_name]
-
-            # Read tags
-            tags = dict(record.get_tags())
-
             # Determine left hard-clipped bases.
             # pysam query alignment functions are relative to the sequence in the alignment record, not the original
             # sequence. The left-most hard-clipped bases must be added to the query positions to translate to the
@@ -1793,92 +2458,230 @@ def get_align_bed(align_file, df_tig_fai, hap, chrom_cluster=False, min_mapq=0):
             clip_h_l = 0
             cigar_index = 0
 
-            while cigar_tuples[cigar_index][0] == 5 and cigar_index < len(record.cigar):
+            while cigar_tuples[cigar_index][0] == 5 and cigar_index < len(cigar_tuples):
                 clip_h_l += cigar_tuples[cigar_index][1]
                 cigar_index += 1
 
             # Disallow alignment match (M) in CIGAR (requires =X for base match/mismatch)
-            if 'M' in record.cigarstring:
+            cigar_str = record.cigarstring
+
+            if 'M' in cigar_str:
                 raise RuntimeError((
                     'Found alignment match CIGAR operation (M) for record {} (Start = {}:{}): '
                     'Alignment requires CIGAR base-level match/mismatch (=X)'
                 ).format(record.query_name, record.reference_name, record.reference_start))
 
             # Save record
-            record_list.append(pd.Series(
-                [
-                    record.reference_name,
-                    record.reference_start,
-                    record.reference_end,
-
-                    align_index,
-
-                    record.query_name,
-                    record.query_alignment_start + clip_h_l,
-                    record.query_alignment_end + clip_h_l,
-
-                    tig_len - (record.query_alignment_end + clip_h_l) if record.is_reverse else record.query_alignment_start + clip_h_l,
-                    tig_len - (record.query_alignment_start + clip_h_l) if record.is_reverse else record.query_alignment_end + clip_h_l,
-
-                    tags['RG'] if 'RG' in tags else 'NA',
-                    tags['AO'] if 'AO' in tags else 'NA',
-
-                    record.mapping_quality,
-
-                    record.is_reverse,
-                    '0x{:04x}'.format(record.flag),
-
-                    hap,
-                    record.cigarstring
-                ],
-                index=[
-                    '#CHROM', 'POS', 'END',
-                    'INDEX',
-                    'QUERY_ID', 'QUERY_POS', 'QUERY_END',
-                    'QUERY_TIG_POS', 'QUERY_TIG_END',
-                    'RG', 'AO',
-                    'MAPQ',
-                    'REV', 'FLAGS', 'HAP',
-                    'CIGAR'
-                ]
-            ))
+            align_cols.append(record, align_index, clip_h_l, cigar_str)
 
-    # Merge records
-    if len(record_list) > 0:
-        df = pd.concat(record_list, axis=1).T
-    else:
-        df = pd.DataFrame(
-            [],
-            columns=[
-                '#CHROM', 'POS', 'END',
-                'INDEX',
-                'QUERY_ID', 'QUERY_POS', 'QUERY_END',
-                'QUERY_TIG_POS', 'QUERY_TIG_END',
-                'RG', 'AO',
-                'MAPQ',
-                'REV', 'FLAGS', 'HAP',
-                'CIGAR'
-            ]
-        )
+    df = align_cols.to_df(hap)
 
     df.sort_values(['#CHROM', 'POS', 'END', 'QUERY_ID'], ascending=[True, True, False, True], inplace=True)
 
     # Check sanity
-    df.apply(pavlib.align.check_record, df_tig_fai=df_tig_fai, axis=1)
+    check_records(df, df_tig_fai)
 
     # Find max cluster match for each chromosome
     if chrom_cluster and df.shape[0] > 0:
         df['SUB_LEN'] = df['END'] - df['POS']
 
-        df['CLUSTER'] = df['QUERY_ID'].apply(lambda val: val.split('_')[0])
+        query_id = df['QUERY_ID'].cat
+
+        df['CLUSTER'] = np.asarray(
+            [val.split('_')[0] for val in query_id.categories], dtype=object
+        )[query_id.codes.values]
+
         max_cluster = {chrom: pavlib.align.get_max_cluster(df, chrom) for chrom in set(df['#CHROM'])}
 
-        df['CLUSTER_MATCH'] = df.apply(lambda row: row['CLUSTER'] == max_cluster[row['#CHROM']], axis=1)
-        df['CLUSTER_MATCH'] = df.apply(lambda row: row['CLUSTER_MATCH'] if max_cluster[row['#CHROM']] is not None else np.nan, axis=1)
+        chrom = df['#CHROM'].cat
+
+        chrom_max_cluster = np.asarray(
+            [max_cluster.get(val, None) for val in chrom.categories], dtype=object
+        )[chrom.codes.values]
+
+        has_max_cluster = pd.notnull(chrom_max_cluster)
+
+        cluster_match = np.full(df.shape[0], np.nan, dtype=object)
+        cluster_match[has_max_cluster] = df['CLUSTER'].values[has_max_cluster] == chrom_max_cluster[has_max_cluster]
+
+        df['CLUSTER_MATCH'] = cluster_match
 
         del(df['SUB_LEN'])
     else:
         df['CLUSTER_MATCH'] = np.nan
 
     # Return BED
-    return df
\ No newline at end of file
+    return df
+
+
+class AlignBedColumns:
+    """
+    Typed column buffers for building an alignment BED from a stream of `pysam.AlignedSegment` records. Buffers are
+    preallocated NumPy arrays that grow by doubling when full, and the DataFrame is built once by `to_df()`. Reference
+    and contig names are stored as integer codes and become categorical columns.
+    """
+
+    INIT_SIZE = 1024
+
+    INT_COLS = ('POS', 'END', 'INDEX', 'QUERY_ALN_POS', 'QUERY_ALN_END', 'MAPQ', 'FLAG')
+    OBJ_COLS = ('RG', 'AO', 'CIGAR')
+
+    def __init__(self, references, df_tig_fai):
+        """
+        Create empty column buffers.
+
+        :param references: Reference sequence names (`pysam.AlignmentFile.references`). Index is the reference ID in
+            alignment records.
+        :param df_tig_fai: Pandas Series with contig names as keys and contig lengths as values.
+        """
+
+        self.references = tuple(references)
+        self.df_tig_fai = df_tig_fai
+
+        self.size = 0
+        self.capacity = self.INIT_SIZE
+
+        self.int_cols = {col: np.zeros(self.capacity, dtype=np.int64) for col in self.INT_COLS}
+        self.obj_cols = {col: np.empty(self.capacity, dtype=object) for col in self.OBJ_COLS}
+
+        self.chrom_code = np.zeros(self.capacity, dtype=np.int32)
+        self.query_code = np.zeros(self.capacity, dtype=np.int32)
+        self.is_rev = np.zeros(self.capacity, dtype=bool)
+
+        # Contig names and lengths indexed by query code
+        self.query_code_dict = dict()
+        self.query_len_list = list()
+
+    def append(self, record, align_index, clip_h_l, cigar_str):
+        """
+        Append an alignment record.
+
+        :param record: Alignment record (`pysam.AlignedSegment`).
+        :param align_index: Alignment index (record number in the alignment file).
+        :param clip_h_l: Number of hard-clipped bases on the left end of the alignment.
+        :param cigar_str: CIGAR string.
+        """
+
+        if self.size == self.capacity:
+            self._grow()
+
+        i = self.size
+
+        # Get contig code, read length for computing real tig positions for rev-complemented records
+        query_code = self.query_code_dict.get(record.query_name, None)
+
+        if query_code is None:
+            query_code = len(self.query_len_list)
+
+            self.query_len_list.append(self.df_tig_fai[record.query_name])
+            self.query_code_dict[record.query_name] = query_code
+
+        # Set values
+        self.chrom_code[i] = record.reference_id
+        self.query_code[i] = query_code
+        self.is_rev[i] = record.is_reverse
+
+        int_cols = self.int_cols
+
+        int_cols['POS'][i] = record.reference_start
+        int_cols['END'][i] = record.reference_end
+        int_cols['INDEX'][i] = align_index
+        int_cols['QUERY_ALN_POS'][i] = record.query_alignment_start + clip_h_l
+        int_cols['QUERY_ALN_END'][i] = record.query_alignment_end + clip_h_l
+        int_cols['MAPQ'][i] = record.mapping_quality
+        int_cols['FLAG'][i] = record.flag
+
+        self.obj_cols['RG'][i] = record.get_tag('RG') if record.has_tag('RG') else 'NA'
+        self.obj_cols['AO'][i] = record.get_tag('AO') if record.has_tag('AO') else 'NA'
+        self.obj_cols['CIGAR'][i] = cigar_str
+
+        self.size += 1
+
+    def to_df(self, hap):
+        """
+        Build the alignment DataFrame from buffered records.
+
+        :param hap: Haplotype.
+
+        :return: Alignment DataFrame (unsorted).
+        """
+
+        n = self.size
+
+        int_cols = {col: vals[:n] for col, vals in self.int_cols.items()}
+        is_rev = self.is_rev[:n]
+
+        # Contig positions
+        query_len = np.asarray(self.query_len_list, dtype=np.int64)[self.query_code[:n]]
+
+        query_pos = int_cols['QUERY_ALN_POS']
+        query_end = int_cols['QUERY_ALN_END']
+
+        return pd.DataFrame({
+            '#CHROM': self._categorical(self.chrom_code[:n], self.references),
+            'POS': int_cols['POS'],
+            'END': int_cols['END'],
+            'INDEX': int_cols['INDEX'],
+            'QUERY_ID': self._categorical(self.query_code[:n], list(self.query_code_dict.keys())),
+            'QUERY_POS': query_pos,
+            'QUERY_END': query_end,
+            'QUERY_TIG_POS': np.where(is_rev, query_len - query_end, query_pos),
+            'QUERY_TIG_END': np.where(is_rev, query_len - query_pos, query_end),
+            'RG': self.obj_cols['RG'][:n],
+            'AO': self.obj_cols['AO'][:n],
+            'MAPQ': int_cols['MAPQ'],
+            'REV': is_rev,
+            'FLAGS': np.asarray(['0x{:04x}'.format(val) for val in int_cols['FLAG']], dtype=object),
+            'HAP': np.full(n, hap, dtype=object),
+            'CIGAR': self.obj_cols['CIGAR'][:n]
+        })
+
+    def _grow(self):
+        """
+        Double the capacity of all buffers.
+        """
+
+        self.capacity *= 2
+
+        for col_dict in (self.int_cols, self.obj_cols):
+            for col in col_dict.keys():
+                col_dict[col] = self._resize(col_dict[col])
+
+        self.chrom_code = self._resize(self.chrom_code)
+        self.query_code = self._resize(self.query_code)
+        self.is_rev = self._resize(self.is_rev)
+
+    def _resize(self, vals):
+        """
+        Copy buffered values into a new array with the current capacity.
+
+        :param vals: Buffer array.
+
+        :return: New buffer array.
+        """
+
+        new_vals = np.empty(self.capacity, dtype=vals.dtype)
+        new_vals[:self.size] = vals[:self.size]
+
+        return new_vals
+
+    @staticmethod
+    def _categorical(codes, names):
+        """
+        Make a categorical from integer codes with categories sorted by name. Sorting categories by name keeps
+        `sort_values()` in the same order as sorting the names as strings.
+
+        :param codes: Codes indexing `names`.
+        :param names: Category names.
+
+        :return: A `pd.Categorical` object.
+        """
+
+        names = np.asarray(names, dtype=object)
+
+        name_order = np.argsort(names, kind='stable')
+
+        code_map = np.zeros(len(names), dtype=np.int32)
+        code_map[name_order] = np.arange(len(names))
+
+        return pd.Categorical.from_codes(code_map[codes], categories=names[name_order])
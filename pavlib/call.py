@@ -3,16 +3,31 @@ Variant caller functions.
 """
 
 
-import collections
-import intervaltree
+import multiprocessing as mp
 import numpy as np
+import os
 import pandas as pd
 import re
+import tempfile
 
 import svpoplib
 import pavlib
 
 
+#
+# Definitions
+#
+
+MERGE_GROUP_SIZE = 50000  # Minimum number of variant records (h1 + h2) in each chromosome group for grouped merges
+
+HOM_CHUNK_MIN = 16    # Bases compared for each query in the first step of a batch homology search
+HOM_CHUNK_MAX = 4096  # Maximum bases compared for each query in one step (chunk size doubles after each step)
+
+# Bases matched by homology searches (upper or lower case)
+_HOM_BASE = np.zeros(256, dtype=bool)
+_HOM_BASE[np.frombuffer(b'ACGTacgt', dtype=np.uint8)] = True
+
+
 def get_gt(row, hap, map_tree):
     """
     Get variant genotype based on haplotype and mappability.
@@ -36,6 +51,61 @@ def get_gt(row, hap, map_tree):
     return '.'
 
 
+def get_gt_callable(df, hap, df_callable):
+    """
+    Get variant genotypes for one haplotype based on haplotype and callable regions for all variants at once (see
+    `get_gt()`).
+
+    Callable regions are sorted by start position for each chromosome, and a running maximum of end positions is
+    computed over the sorted regions. A variant is inside a callable region if the running maximum end of the last
+    region starting at or before the variant start reaches the variant end.
+
+    :param df: Variant calls (post h1/h2 merge).
+    :param hap: Haplotype being called.
+    :param df_callable: Callable regions (DataFrame with "#CHROM", "POS", and "END").
+
+    :return: A Pandas Series keyed by the index of `df` with '1' if the variant call is in this haplotype, '0' if it
+        was not called but is in a callable region, and '.' if it is not in a callable region.
+    """
+
+    gt = np.full(df.shape[0], '.', dtype=object)
+
+    # Callable variants
+    var_chrom = df['#CHROM'].to_numpy()
+    var_pos = df['POS'].to_numpy()
+    var_end = df['END'].to_numpy()
+
+    df_callable = df_callable.loc[df_callable['POS'] < df_callable['END']]
+
+    for chrom, df_callable_chrom in df_callable.groupby('#CHROM'):
+
+        var_index = np.flatnonzero(var_chrom == chrom)
+
+        if var_index.shape[0] == 0:
+            continue
+
+        df_callable_chrom = df_callable_chrom.sort_values('POS')
+
+        callable_pos = df_callable_chrom['POS'].to_numpy()
+        callable_end_max = np.maximum.accumulate(df_callable_chrom['END'].to_numpy())
+
+        # Last callable region starting at or before each variant
+        callable_index = np.searchsorted(callable_pos, var_pos[var_index], side='right') - 1
+
+        is_callable = (
+            (callable_index >= 0) &
+            (callable_end_max[np.maximum(callable_index, 0)] >= var_end[var_index]) &
+            (var_pos[var_index] < var_end[var_index])
+        )
+
+        gt[var_index[is_callable]] = '0'
+
+    # Variants in this haplotype
+    gt[(';' + df['HAP'] + ';').str.contains(';' + hap + ';', regex=False).to_numpy()] = '1'
+
+    return pd.Series(gt, index=df.index)
+
+
 def val_per_hap(df, df_h1, df_h2, col_name, delim=';'):
     """
     Construct a field from a merged variant DataFrame (`df`) by pulling values from each pre-merged haplotype. Matches
@@ -43,97 +113,129 @@ def val_per_hap(df, df_h1, df_h2, col_name, delim=';'):
     of values. `df_h1` and `df_h2` must be indexed with the original variant ID from the corresponding haplotype.
     Function returns a Pandas Series keyed by the `df` index.
 
+    Haplotype variants (`HAP` and `HAP_VARIANTS`) are exploded once into a table with one record per haplotype variant,
+    and values for all columns in `col_name` are joined from `df_h1` and `df_h2` in one merge.
+
     :param df: Merged DataFrame of variants.
     :param df_h1: Pre-merged DataFrame of variants from h1. Index must be variant IDs for the original unmerged calls.
     :param df_h2: Pre-merged DataFrame of variants from h2. Index must be variant IDs for the original unmerged calls.
-    :param col_name: Get this column name from `df_h1` and `df_h2`.
+    :param col_name: Get this column name from `df_h1` and `df_h2`. May be a list of column names.
     :param delim: Separate values by this delimiter.
 
     :return: A Pandas series keyed by indices from `df` with comma-separated values extracted from each haplotype
-        DataFrame.
+        DataFrame. If `col_name` is a list, a DataFrame with one column for each column name is returned.
     """
 
-    df_dict = {'h1': df_h1, 'h2': df_h2}
-
-    # Generate a Series keyed by variant ID with tuples of (hap, id) for the haplotype and variant ID in that haplotype.
-    # Then, apply a function to join the target values from each dataframe in the correct order.
-    return df.apply(lambda row:
-         tuple(zip(
-             row['HAP'].split(';'), row['HAP_VARIANTS'].split(';')
-         )),
-         axis=1
-    ).apply(
-        lambda val_list: delim.join(df_dict[val[0]].loc[val[1], col_name] for val in val_list)
-        ## Get from original table, correct back to original ID (take off everything after ".')
-        #lambda val_list: delim.join(df_dict[val[0]].loc[val[1].rsplit('.', 1)[0], col_name] for val in val_list)
+    col_list = [col_name] if isinstance(col_name, str) else list(col_name)
+
+    if df.shape[0] == 0:
+        df_val = pd.DataFrame([], index=df.index, columns=col_list, dtype=object)
+
+        return df_val[col_name] if isinstance(col_name, str) else df_val
+
+    # Table of haplotype variants for each merged variant (ROW is the row number in df)
+    df_hap_var = pd.DataFrame({
+        'ROW': np.arange(df.shape[0]),
+        'HAP': df['HAP'].str.split(';').to_numpy(),
+        'HAP_VARIANTS': df['HAP_VARIANTS'].str.split(';').to_numpy()
+    }).explode(['HAP', 'HAP_VARIANTS'])
+
+    # Values from each haplotype keyed by haplotype and variant ID
+    df_hap_val = pd.concat(
+        [
+            df_hap[col_list].assign(HAP=hap, HAP_VARIANTS=df_hap.index.to_numpy())
+                for hap, df_hap in (('h1', df_h1), ('h2', df_h2))
+        ],
+        axis=0
+    )
+
+    if np.any(df_hap_val.duplicated(['HAP', 'HAP_VARIANTS'])):
+        dup_id = df_hap_val.loc[df_hap_val.duplicated(['HAP', 'HAP_VARIANTS'])].iloc[0]
+
+        raise RuntimeError('Duplicate variant ID in haplotype {}: {}'.format(dup_id['HAP'], dup_id['HAP_VARIANTS']))
+
+    # Join values (left merge preserves haplotype variant order)
+    df_hap_var = df_hap_var.merge(df_hap_val, on=['HAP', 'HAP_VARIANTS'], how='left', indicator=True)
+
+    if np.any(df_hap_var['_merge'] != 'both'):
+        missing_id = df_hap_var.loc[df_hap_var['_merge'] != 'both'].iloc[0]
+
+        raise RuntimeError('Variant ID not found in haplotype {}: {}'.format(missing_id['HAP'], missing_id['HAP_VARIANTS']))
+
+    # Join values for each merged variant. Haplotype variants for each merged variant are in one contiguous run of
+    # records in order (joining runs directly is much faster than groupby().agg(), which creates an object per group).
+    row = df_hap_var['ROW'].to_numpy()
+
+    run_start = np.flatnonzero(np.concatenate([[True], row[1:] != row[:-1]]))
+    run_end = np.concatenate([run_start[1:], [row.shape[0]]]).tolist()
+    run_start = run_start.tolist()
+
+    df_val = pd.DataFrame(
+        {
+            col: [
+                delim.join(val_list[start:end]) for start, end in zip(run_start, run_end)
+            ] for col, val_list in ((col, df_hap_var[col].tolist()) for col in col_list)
+        },
+        index=df.index
     )
 
+    return df_val[col_name] if isinstance(col_name, str) else df_val
+
 
 def filter_by_ref_tree(df, filter_tree, match_tig=False):
     """
-    Filter DataFrame by a dict (keyed by chromosome) of interval trees.
+    Filter DataFrame by reference regions.
 
     :param df: DataFrame to filter.
-    :param filter_tree: Dict of trees.
-    :param match_tig: Match TIG_REGION contig name to the value in the filter tree for intersected intervals (filter
-        tree values should be contig names for the interval). When set, only filters variants inside regions with a
+    :param filter_tree: Filter regions (`pavlib.util.IntervalSet` on reference chromosomes).
+    :param match_tig: Match TIG_REGION contig name to the data value of intersected filter regions (filter region
+        data values should be contig names for the interval). When set, only filters variants inside regions with a
         matching contig. This causes PAV to treat each contig as a separate haplotype.
 
     :return: Filtered DataFrame.
     """
 
-    if match_tig:
-        df = df.loc[
-            df.apply(
-                lambda row: not np.any(
-                    [row['TIG_REGION'].split(':', 1)[0] == region.data for region in filter_tree[row['#CHROM']][row['POS']:row['END']]]
-                ),
-                axis=1
-            )
-        ]
+    if df.shape[0] == 0:
+        return df
 
-    else:
-        df = df.loc[
-            df.apply(
-                lambda row: len(filter_tree[row['#CHROM']][row['POS']:row['END']]) == 0,
-                axis=1
-            )
-        ]
+    is_filtered = filter_tree.overlaps(
+        df['#CHROM'].to_numpy(), df['POS'].to_numpy(), df['END'].to_numpy(),
+        data=df['TIG_REGION'].str.split(':', n=1).str[0].to_numpy() if match_tig else None
+    )
 
-    return df
+    return df.loc[~ is_filtered]
 
 
 def filter_by_tig_tree(df, tig_filter_tree):
     """
-    Filter records from a callset DataFrame by matching "TIG_REGION" with regions in an IntervalTree.
+    Filter records from a callset DataFrame by matching "TIG_REGION" with contig regions.
 
     :param df: DataFrame to filter. Must contain field "TIG_REGION".
-    :param tig_filter_tree: A `collections.defaultdict` of `intervaltree.IntervalTree` (indexed by contig name) of
-        no-call regions. Variants with a tig region intersecting these records will be removed (any intersect). If
-        `None`, then `df` is not filtered.
+    :param tig_filter_tree: A `pavlib.util.IntervalSet` of no-call regions on contigs. Variants with a tig region
+        intersecting these records will be removed (any intersect). If `None`, then `df` is not filtered.
 
     :return: Filtered `df`.
     """
 
-    if tig_filter_tree is None:
+    if tig_filter_tree is None or df.shape[0] == 0:
         return df
 
-    rm_index_set = set()
+    df_tig = df['TIG_REGION'].str.extract(r'^([^:]+):(\d+)-(\d+)$')
 
-    for index, row in df.iterrows():
-        match_obj = re.match('^([^:]+):(\d+)-(\d+)$', row['TIG_REGION'])
+    if np.any(df_tig[0].isnull()):
+        index = df_tig.index[np.argmax(df_tig[0].isnull().to_numpy())]
 
-        if match_obj is None:
-            raise RuntimeError('Unrecognized TIG_REGION format for record {}: {}'.format(index, row['TIG_REGION']))
+        raise RuntimeError('Unrecognized TIG_REGION format for record {}: {}'.format(index, df.loc[index, 'TIG_REGION']))
 
-        if tig_filter_tree[match_obj[1]][int(match_obj[2]) - 1:int(match_obj[3])]:
-            rm_index_set.add(index)
+    is_filtered = tig_filter_tree.overlaps(
+        df_tig[0].to_numpy(), df_tig[1].astype(np.int64).to_numpy() - 1, df_tig[2].astype(np.int64).to_numpy()
+    )
 
     # Return
-    if not rm_index_set:
+    if not np.any(is_filtered):
         return df
 
-    return df.loc[[val not in rm_index_set for val in df.index]]
+    return df.loc[~ is_filtered]
 
 
 def left_homology(pos_tig, seq_tig, seq_sv):
@@ -244,6 +346,140 @@ def right_homology(pos_tig, seq_tig, seq_sv):
     return hom_len
 
 
+def left_homology_batch(pos_tig, seq_tig, seq_sv):
+    """
+    Batch version of `left_homology()` for many SV/indel queries against one contig or reference sequence. Each query
+    is a position (the first base upstream of the SV/indel) and an SV/indel sequence. Homology lengths are identical to
+    `left_homology()` with upper-case sequences, including wrapping through the SV/indel sequence.
+
+    Bases are compared in vectorized chunks over all unfinished queries at once (see `_homology_batch()`). Bases are
+    compared without regard to case, so `seq_tig` may be the original soft-masked sequence.
+
+    :param pos_tig: Array-like of contig/reference positions (0-based) where each homology search begins.
+    :param seq_tig: Contig/reference sequence as a uint8 array (e.g. `seq.CachedSeq.seq_bytes`), bytes, or string.
+    :param seq_sv: List of SV/indel sequences (strings or bytes), one for each position. Queries with a `None` or empty
+        sequence have 0 homology.
+
+    :return: A numpy array of homology lengths, one for each query.
+    """
+
+    return _homology_batch(pos_tig, seq_tig, seq_sv, True)
+
+
+def right_homology_batch(pos_tig, seq_tig, seq_sv):
+    """
+    Batch version of `right_homology()` for many SV/indel queries against one contig or reference sequence. Each query
+    is a position (the first base downstream of the SV/indel) and an SV/indel sequence. Homology lengths are identical
+    to `right_homology()` with upper-case sequences, including wrapping through the SV/indel sequence.
+
+    Bases are compared in vectorized chunks over all unfinished queries at once (see `_homology_batch()`). Bases are
+    compared without regard to case, so `seq_tig` may be the original soft-masked sequence.
+
+    :param pos_tig: Array-like of contig/reference positions (0-based) where each homology search begins.
+    :param seq_tig: Contig/reference sequence as a uint8 array (e.g. `seq.CachedSeq.seq_bytes`), bytes, or string.
+    :param seq_sv: List of SV/indel sequences (strings or bytes), one for each position. Queries with a `None` or empty
+        sequence have 0 homology.
+
+    :return: A numpy array of homology lengths, one for each query.
+    """
+
+    return _homology_batch(pos_tig, seq_tig, seq_sv, False)
+
+
+def _homology_batch(pos_tig, seq_tig, seq_sv, is_left):
+    """
+    Find breakpoint homology for a batch of queries (see `left_homology_batch()` and `right_homology_batch()`).
+
+    All unfinished queries are compared together in a 2D array of `chunk` bases starting with `HOM_CHUNK_MIN` bases.
+    Queries with a mismatch (or an ambiguous base or the end of the sequence) in the chunk are finished at the first
+    mismatch (`np.argmin`), and queries matching all bases continue with the next chunk, which doubles in size up to
+    `HOM_CHUNK_MAX` bases for long tandem repeats.
+
+    :param pos_tig: Array-like of positions.
+    :param seq_tig: Contig/reference sequence.
+    :param seq_sv: List of SV/indel sequences.
+    :param is_left: Search upstream (`left_homology()`) if `True` and downstream (`right_homology()`) if `False`.
+
+    :return: A numpy array of homology lengths.
+    """
+
+    # Get sequence arrays
+    if isinstance(seq_tig, str):
+        seq_tig = seq_tig.encode()
+
+    if isinstance(seq_tig, (bytes, bytearray)):
+        seq_tig = np.frombuffer(seq_tig, dtype=np.uint8)
+
+    pos_tig = np.asarray(pos_tig, dtype=np.int64)
+
+    if len(seq_sv) != pos_tig.shape[0]:
+        raise RuntimeError('Number of SV sequences ({}) does not match the number of positions ({})'.format(
+            len(seq_sv), pos_tig.shape[0]
+        ))
+
+    hom_len = np.zeros(pos_tig.shape[0], dtype=np.int64)
+
+    if pos_tig.shape[0] == 0:
+        return hom_len
+
+    seq_sv = [
+        b'' if seq is None else (seq.encode() if isinstance(seq, str) else bytes(seq)) for seq in seq_sv
+    ]
+
+    sv_len = np.array([len(seq) for seq in seq_sv], dtype=np.int64)
+    sv_offset = np.cumsum(sv_len) - sv_len
+    sv_bytes = np.frombuffer(b''.join(seq_sv) + b'\0', dtype=np.uint8)  # Padded so empty sequences can be indexed
+
+    # Maximum homology for each query (do not shift off the edge of the sequence)
+    tig_len = seq_tig.shape[0]
+
+    if is_left:
+        hom_limit = np.where(pos_tig < tig_len, pos_tig + 1, 0)
+    else:
+        hom_limit = np.where(pos_tig >= 0, tig_len - pos_tig, 0)
+
+    hom_limit[sv_len == 0] = 0
+
+    active = np.flatnonzero(hom_limit > 0)
+
+    # Compare chunks
+    chunk_pos = 0
+    chunk_len = HOM_CHUNK_MIN
+
+    while active.shape[0] > 0:
+
+        hom_index = np.arange(chunk_pos, chunk_pos + chunk_len, dtype=np.int64)[np.newaxis, :]
+
+        in_limit = hom_index < hom_limit[active, np.newaxis]
+
+        active_sv_len = sv_len[active, np.newaxis]
+
+        if is_left:
+            tig_index = pos_tig[active, np.newaxis] - hom_index
+            sv_index = (active_sv_len - 1 - hom_index) % active_sv_len  # Circular from the last base back to the first
+        else:
+            tig_index = pos_tig[active, np.newaxis] + hom_index
+            sv_index = hom_index % active_sv_len
+
+        tig_base = seq_tig[np.where(in_limit, tig_index, 0)]
+        sv_base = sv_bytes[sv_offset[active, np.newaxis] + sv_index]
+
+        is_match = in_limit & _HOM_BASE[tig_base] & ((tig_base & 0xDF) == (sv_base & 0xDF))
+
+        # Finish queries with a mismatch in this chunk
+        is_done = ~ np.all(is_match, axis=1)
+
+        hom_len[active[is_done]] = chunk_pos + np.argmin(is_match[is_done], axis=1)
+
+        # Continue with the next chunk
+        active = active[~ is_done]
+
+        chunk_pos += chunk_len
+        chunk_len = min(chunk_len * 2, HOM_CHUNK_MAX)
+
+    return hom_len
+
+
 def merge_haplotypes(h1_file_name, h2_file_name, h1_callable, h2_callable, config_def, threads=1, chrom=None, is_inv=None):
     """
     Merge haplotypes for one variant type.
@@ -333,12 +569,7 @@ def merge_haplotypes(h1_file_name, h2_file_name, h1_callable, h2_callable, confi
         df_h2['CLUSTER_MATCH'].fillna('NA', inplace=True)
         df_h2 = df_h2.astype(str)
 
-        df['TIG_REGION'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'TIG_REGION')
-        df['QUERY_STRAND'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'QUERY_STRAND')
-        df['CI'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'CI')
-        df['ALIGN_INDEX'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'ALIGN_INDEX')
-        df['CLUSTER_MATCH'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'CLUSTER_MATCH')
-        df['CALL_SOURCE'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'CALL_SOURCE')
+        val_col_list = ['TIG_REGION', 'QUERY_STRAND', 'CI', 'ALIGN_INDEX', 'CLUSTER_MATCH', 'CALL_SOURCE']
 
         # Set inversion columns
         if is_inv:
@@ -347,34 +578,22 @@ def merge_haplotypes(h1_file_name, h2_file_name, h1_callable, h2_callable, confi
             del(df['FLAG_ID'])
             del(df['FLAG_TYPE'])
 
-            df['RGN_REF_INNER'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'RGN_REF_INNER')
-            df['RGN_TIG_INNER'] = pavlib.call.val_per_hap(df, df_h1, df_h2, 'RGN_TIG_INNER')
+            val_col_list += ['RGN_REF_INNER', 'RGN_TIG_INNER']
 
-        # Load mapped regions
-        map_tree_h1 = collections.defaultdict(intervaltree.IntervalTree)
-        map_tree_h2 = collections.defaultdict(intervaltree.IntervalTree)
+        df[val_col_list] = pavlib.call.val_per_hap(df, df_h1, df_h2, val_col_list)
 
+        # Load mapped regions
         df_map_h1 = pd.read_csv(h1_callable, sep='\t')
         df_map_h2 = pd.read_csv(h2_callable, sep='\t')
 
-        for index, row in df_map_h1.iterrows():
-            map_tree_h1[row['#CHROM']][row['POS']:row['END']] = True
-
-        for index, row in df_map_h2.iterrows():
-            map_tree_h2[row['#CHROM']][row['POS']:row['END']] = True
-
         # Get genotypes setting no-call for non-mappable regions
-        df['GT_H1'] = df.apply(pavlib.call.get_gt, hap='h1', map_tree=map_tree_h1, axis=1)
-        df['GT_H2'] = df.apply(pavlib.call.get_gt, hap='h2', map_tree=map_tree_h2, axis=1)
-
-        df['GT'] = df.apply(lambda row: '{}|{}'.format(row['GT_H1'], row['GT_H2']), axis=1)
+        df['GT'] = (
+            pavlib.call.get_gt_callable(df, 'h1', df_map_h1) + '|' + pavlib.call.get_gt_callable(df, 'h2', df_map_h2)
+        )
 
-        if np.any(df['GT'].apply(lambda val: val == '0|0')):
+        if np.any(df['GT'] == '0|0'):
             raise RuntimeError('Program bug: Found 0|0 genotypes after merging haplotypes')
 
-        del df['GT_H1']
-        del df['GT_H2']
-
     else:
 
         df['TIG_REGION'] = np.nan
@@ -399,6 +618,153 @@ def merge_haplotypes(h1_file_name, h2_file_name, h1_callable, h2_callable, confi
     return df
 
 
+def get_merge_chrom_groups(chrom_count, group_size=None):
+    """
+    Pack chromosomes into groups for merging. Chromosomes are taken in sorted order, and consecutive chromosomes are
+    added to a group until it reaches `group_size` records. Large chromosomes get their own group, and small contigs
+    (e.g. unplaced and alt scaffolds) are packed together.
+
+    :param chrom_count: Pandas Series of variant record counts keyed by chromosome name.
+    :param group_size: Minimum number of records in each group (the last group may be smaller). If `None`, set to
+        `MERGE_GROUP_SIZE`.
+
+    :return: A list of chromosome lists (one list per group).
+    """
+
+    if group_size is None:
+        group_size = MERGE_GROUP_SIZE
+
+    group_list = list()
+
+    group_chrom = list()
+    group_count = 0
+
+    for chrom in sorted(chrom_count.index):
+        group_chrom.append(chrom)
+        group_count += chrom_count[chrom]
+
+        if group_count >= group_size:
+            group_list.append(group_chrom)
+
+            group_chrom = list()
+            group_count = 0
+
+    if group_chrom:
+        group_list.append(group_chrom)
+
+    return group_list
+
+
+def merge_haplotypes_grouped(
+        h1_file_name, h2_file_name, h1_callable, h2_callable, config_def, threads=1, is_inv=None, group_size=None,
+        temp_dir=None
+):
+    """
+    Merge haplotypes for one variant type in one step. Each haplotype callset and callable region table is read once
+    and split by chromosome in memory, chromosomes are packed into groups (see `get_merge_chrom_groups()`), and groups
+    are merged in parallel on a pool of `threads` processes (see `merge_haplotypes()`).
+
+    :param h1_file_name: h1 variant call BED file name.
+    :param h2_file_name: h2 variant call BED file name.
+    :param h1_callable: h1 callable region BED file name.
+    :param h2_callable: h2 callable region BED file name.
+    :param config_def: Merge definition.
+    :param threads: Number of processes merging chromosome groups.
+    :param is_inv: Add inversion columns if `True`, autodetect if `None`.
+    :param group_size: Minimum number of variant records (h1 + h2) in each chromosome group. If `None`, set to
+        `MERGE_GROUP_SIZE`.
+    :param temp_dir: Directory for temporary per-group BED files. If `None`, use the system default.
+
+    :return: A dataframe of variant calls (chromosomes in sorted order).
+    """
+
+    # Read (as text, written back to per-group files without changing values)
+    df_var_list = [
+        pd.read_csv(file_name, sep='\t', dtype=str, keep_default_na=False) for file_name in (h1_file_name, h2_file_name)
+    ]
+
+    df_callable_list = [
+        pd.read_csv(file_name, sep='\t', dtype=str, keep_default_na=False) for file_name in (h1_callable, h2_callable)
+    ]
+
+    # Get chromosome groups
+    chrom_count = pd.concat([df_var['#CHROM'] for df_var in df_var_list]).value_counts()
+
+    group_list = get_merge_chrom_groups(chrom_count, group_size)
+
+    if not group_list:
+        group_list = [[]]  # Merge empty tables for column names
+
+    # Merge groups
+    with tempfile.TemporaryDirectory(dir=temp_dir) as group_dir:
+
+        # Write group tables
+        group_args = list()
+
+        for group_index, group_chrom in enumerate(group_list):
+            group_chrom = set(group_chrom)
+
+            file_name_list = list()
+
+            for df_table, table_name in zip(df_var_list + df_callable_list, ('h1', 'h2', 'callable_h1', 'callable_h2')):
+                file_name_list.append(os.path.join(group_dir, '{}_{}.bed.gz'.format(table_name, group_index)))
+
+                df_table.loc[df_table['#CHROM'].isin(group_chrom)].to_csv(
+                    file_name_list[-1], sep='\t', index=False, compression={'method': 'gzip', 'compresslevel': 1}
+                )
+
+            group_args.append((group_index, file_name_list, config_def, is_inv))
+
+        del df_var_list
+        del df_callable_list
+
+        # Merge (largest groups first)
+        group_cost = [np.sum(chrom_count[group_chrom]) for group_chrom in group_list]
+        group_args = [group_args[group_index] for group_index in np.argsort(group_cost, kind='stable')[::-1]]
+
+        df_group = dict()
+
+        if threads < 2 or len(group_args) < 2:
+            for args in group_args:
+                group_index, df = _merge_haplotypes_group(args)
+                df_group[group_index] = df
+
+        else:
+            with mp.Pool(min(threads, len(group_args))) as pool:
+                for group_index, df in pool.imap_unordered(_merge_haplotypes_group, group_args, chunksize=1):
+                    df_group[group_index] = df
+
+    # Concatenate in chromosome order
+    df_list = list()
+
+    for group_index, group_chrom in enumerate(group_list):
+        df = df_group[group_index]
+
+        if len(group_chrom) < 2:
+            df_list.append(df)
+
+        else:
+            chrom_col = df['#CHROM'].astype(str)
+            df_list += [df.loc[chrom_col == chrom] for chrom in group_chrom]
+
+    return pd.concat(df_list, axis=0)
+
+
+def _merge_haplotypes_group(args):
+    """
+    Merge one chromosome group (see `merge_haplotypes_grouped()`).
+
+    :param args: Tuple of group index, a list of h1, h2, h1 callable, and h2 callable file names, the merge definition,
+        and `is_inv`.
+
+    :return: A tuple of the group index and a dataframe of merged variant calls.
+    """
+
+    group_index, file_name_list, config_def, is_inv = args
+
+    return group_index, merge_haplotypes(*file_name_list, config_def, threads=1, is_inv=is_inv)
+
+
 def get_merge_params(wildcards, config):
     """
     Get merging parameters.
@@ -2,10 +2,8 @@
 Call variants by CIGAR string.
 """
 
-import Bio
 import numpy as np
 import pandas as pd
-import pysam
 
 import pavlib
 import svpoplib
@@ -20,6 +18,44 @@ CALL_SOURCE = 'CIGAR'
 
 CALL_CIGAR_BATCH_COUNT = 10
 
+# SNV table columns
+SNV_COLUMNS = [
+    '#CHROM', 'POS', 'END',
+    'ID', 'SVTYPE', 'SVLEN',
+    'REF', 'ALT',
+    'HAP',
+    'TIG_REGION', 'QUERY_STRAND',
+    'CI',
+    'ALIGN_INDEX', 'CLUSTER_MATCH',
+    'CALL_SOURCE'
+]
+
+# INS/DEL table columns
+INSDEL_COLUMNS = [
+    '#CHROM', 'POS', 'END',
+    'ID', 'SVTYPE', 'SVLEN',
+    'HAP',
+    'TIG_REGION', 'QUERY_STRAND',
+    'CI',
+    'ALIGN_INDEX', 'CLUSTER_MATCH',
+    'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
+    'CALL_SOURCE',
+    'SEQ'
+]
+
+# CIGAR operations handled by the caller (all others are an error)
+_CIGAR_CALL_OPS = np.array([
+    pavlib.align.CIGAR_EQ, pavlib.align.CIGAR_X,
+    pavlib.align.CIGAR_I, pavlib.align.CIGAR_D,
+    pavlib.align.CIGAR_S, pavlib.align.CIGAR_H
+])
+
+# Byte value to base (str) and upper-case base
+_BYTE_TO_BASE = np.array([chr(byte_val) for byte_val in range(256)], dtype=object)
+_BYTE_TO_BASE_UPPER = np.array(
+    [chr(byte_val).upper() if byte_val < 128 else chr(byte_val) for byte_val in range(256)], dtype=object
+)
+
 
 def make_insdel_snv_calls(df_align, ref_fa_name, tig_fa_name, hap):
     """
@@ -33,323 +69,320 @@ def make_insdel_snv_calls(df_align, ref_fa_name, tig_fa_name, hap):
     :return: A tuple of two dataframes, one for insertions and deletions (SV and indel), and one for SNVs.
     """
 
-    df_insdel_list = list()
-    df_snv_list = list()
+    insdel_col_list = list()  # Tuples of (alignment order, dictionary of INS/DEL columns) for alignment records with INS/DELs
+    snv_col_list = list()     # Tuples of (alignment order, dictionary of SNV columns) for alignment records with SNVs
 
-    seq_ref = None       # Current reference sequence
-    seq_ref_name = None  # Current reference contig name
+    # Sequence caches
+    ref_cache = pavlib.seq.FastaSeqCache(ref_fa_name, max_seq=2)
+    tig_cache = pavlib.seq.FastaSeqCache(tig_fa_name, max_seq=4)
 
-    seq_tig = None       # Current tig sequence
-    seq_tig_name = None  # Current tig name
-    seq_tig_len = None   # Current tig length
-    seq_tig_rev = None   # Aligned contig was reverse-complemented
+    # Parse alignment records. Records are ordered by reference and contig so cached sequences are reused, and calls are
+    # returned to the order of records in df_align before tables are merged.
+    df_align = df_align.reset_index(drop=True)
 
-    # Parse alignment records
-    for index, row in df_align.iterrows():
+    for align_order, row in df_align.sort_values(['#CHROM', 'QUERY_ID', 'REV']).iterrows():
 
         # Get strand
         is_rev = row['REV']
-        strand = '-' if is_rev else '+'
         cluster_match = row['CLUSTER_MATCH']
         align_index = row['INDEX']
 
-        # Load reference and tig sequences
-        if seq_ref_name is None or row['#CHROM'] != seq_ref_name:
-            with pysam.FastaFile(ref_fa_name) as ref_fa:
-                seq_ref_name = row['#CHROM']
-                seq_ref = ref_fa.fetch(str(seq_ref_name))
-
-        if seq_tig_name is None or row['QUERY_ID'] != seq_tig_name or is_rev != seq_tig_rev:
-            with pysam.FastaFile(tig_fa_name) as tig_fa:
-                seq_tig_name = row['QUERY_ID']
-                seq_tig = tig_fa.fetch(str(seq_tig_name))
-                seq_tig_len = len(seq_tig)
+        # Get reference and tig sequences
+        seq_ref_name = row['#CHROM']
+        cached_seq = ref_cache.get(seq_ref_name)
 
-                if is_rev:
-                    seq_tig = str(Bio.Seq.Seq(seq_tig).reverse_complement())
+        seq_ref = cached_seq.seq
+        seq_ref_bytes = cached_seq.seq_bytes
 
-                seq_tig_rev = is_rev
+        seq_tig_name = row['QUERY_ID']
+        cached_seq = tig_cache.get(seq_tig_name, is_rev)
 
-        seq_ref_upper = seq_ref.upper()
-        seq_tig_upper = seq_tig.upper()
+        seq_tig = cached_seq.seq
+        seq_tig_bytes = cached_seq.seq_bytes
+        seq_tig_len = len(cached_seq)
 
         # Process CIGAR
-        pos_ref = row['POS']
-        pos_tig = 0
-
-        cigar_index = 0
-
-        last_op = None
-        last_oplen = 0
-
-        for oplen, op in pavlib.align.cigar_str_to_tuples(row):
-            # NOTE: break/continue in this look will not advance last_op and last_oplen (end of loop)
-
-            cigar_index += 1
-
-            if op == '=':
-                pos_ref += oplen
-                pos_tig += oplen
-
-            elif op == 'X':
-                # Call SNV(s)
-
-                for i in range(oplen):
-
-                    # Get position and bases
-                    pos_ref_snv = pos_ref + i
-                    pos_tig_snv = pos_tig + i
-
-                    base_ref = seq_ref[pos_ref_snv]
-                    base_tig = seq_tig[pos_tig_snv]
-
-                    # pos_tig_snv to fwd contig if alignment is reversed
-                    if is_rev:
-                        pos_tig_snv = seq_tig_len - pos_tig_snv - 1
-
-                    # Add variant
-                    var_id = f'{seq_ref_name}-{pos_ref_snv + 1}-SNV-{base_ref.upper()}-{base_tig.upper()}'
-
-                    df_snv_list.append(pd.Series(
-                        [
-                            seq_ref_name, pos_ref_snv, pos_ref_snv + 1,
-                            var_id, 'SNV', 1,
-                            base_ref, base_tig,
-                            hap,
-                            f'{seq_tig_name}:{pos_tig_snv + 1}-{pos_tig_snv + 1}', strand,
-                            0,
-                            align_index, cluster_match,
-                            CALL_SOURCE
-                        ],
-                        index=[
-                            '#CHROM', 'POS', 'END',
-                            'ID', 'SVTYPE', 'SVLEN',
-                            'REF', 'ALT',
-                            'HAP',
-                            'TIG_REGION', 'QUERY_STRAND',
-                            'CI',
-                            'ALIGN_INDEX', 'CLUSTER_MATCH',
-                            'CALL_SOURCE'
-                        ]
-                    ))
-
-                # Advance
-                pos_ref += oplen
-                pos_tig += oplen
-
-            elif op == 'I':
-                # Call INS
-
-                # Get sequence
-                seq = seq_tig[pos_tig:(pos_tig + oplen)]
-                seq_upper = seq.upper()
-
-                # Left shift
-                if last_op == '=':
-                    left_shift = np.min([
-                        last_oplen,
-                        pavlib.call.left_homology(pos_ref - 1, seq_ref_upper, seq_upper)  # SV/breakpoint upstream homology
-                    ])
-                else:
-                    left_shift = 0
-
-                sv_pos_ref = pos_ref - left_shift
-                sv_end_ref = sv_pos_ref + 1
-                sv_pos_tig = pos_tig - left_shift
-                sv_end_tig = sv_pos_tig + oplen
-
-                if left_shift != 0:
-                    seq = seq_tig[sv_pos_tig:(sv_pos_tig + oplen)]
-
-                # Get positions in the original SV space
-                # pos_tig_insdel to fwd contig if alignment is reversed
-                if is_rev:
-                    end_tig_insdel = seq_tig_len - sv_pos_tig
-                    pos_tig_insdel = end_tig_insdel - oplen
-
-                else:
-                    pos_tig_insdel = sv_pos_tig
-                    end_tig_insdel = pos_tig_insdel + oplen
-
-                # Find breakpoint homology
-                seq_upper = seq.upper()
-
-                hom_ref_l = pavlib.call.left_homology(sv_pos_ref - 1, seq_ref_upper, seq_upper)
-                hom_ref_r = pavlib.call.right_homology(sv_pos_ref, seq_ref_upper, seq_upper)
-
-                hom_tig_l = pavlib.call.left_homology(sv_pos_tig - 1, seq_tig_upper, seq_upper)
-                hom_tig_r = pavlib.call.right_homology(sv_end_tig, seq_tig_upper, seq_upper)
-
-                # Add variant
-                var_id = f'{seq_ref_name}-{sv_pos_ref + 1}-INS-{oplen}'
-
-                df_insdel_list.append(pd.Series(
-                    [
-                        seq_ref_name, sv_pos_ref, sv_end_ref,
-                        var_id, 'INS', oplen,
-                        hap,
-                        f'{seq_tig_name}:{pos_tig_insdel + 1}-{end_tig_insdel}', strand,
-                        0,
-                        align_index, cluster_match,
-                        left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
-                        CALL_SOURCE,
-                        seq
-                    ],
-                    index=[
-                        '#CHROM', 'POS', 'END',
-                        'ID', 'SVTYPE', 'SVLEN',
-                        'HAP',
-                        'TIG_REGION', 'QUERY_STRAND',
-                        'CI',
-                        'ALIGN_INDEX', 'CLUSTER_MATCH',
-                        'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-                        'CALL_SOURCE',
-                        'SEQ'
-                    ]
-                ))
+        cigar = pavlib.align.get_cigar_array(row)
+
+        # Call SNVs
+        snv_cols = get_snv_cols(
+            cigar, row['POS'],
+            seq_ref_name, seq_ref_bytes,
+            seq_tig_name, seq_tig_bytes, seq_tig_len,
+            is_rev, hap, align_index, cluster_match
+        )
 
-                # Advance
-                pos_tig += oplen
-
-                pass
-
-            elif op == 'D':
-                # Call DEL
-
-                # Get sequence
-                seq = seq_ref[pos_ref:(pos_ref + oplen)]
-                seq_upper = seq.upper()
-
-                # Left shift
-                if last_op == '=':
-                    left_shift = np.min([
-                        last_oplen,
-                        pavlib.call.left_homology(pos_ref - 1, seq_ref_upper, seq_upper)  # SV/breakpoint upstream homology
-                    ])
-                else:
-                    left_shift = 0
-
-                sv_pos_ref = pos_ref - left_shift
-                sv_end_ref = sv_pos_ref + oplen
-                sv_pos_tig = pos_tig - left_shift
-                sv_end_tig = sv_pos_tig + 1
-
-                # Contig position in original coordinates (translate if - strand)
-                pos_tig_insdel = sv_pos_tig
-
-                if is_rev:
-                    pos_tig_insdel = seq_tig_len - sv_pos_tig
-
-                # Find breakpoint homology
-                seq_upper = seq.upper()
-
-                hom_ref_l = pavlib.call.left_homology(sv_pos_ref - 1, seq_ref_upper, seq_upper)
-                hom_ref_r = pavlib.call.right_homology(sv_end_ref, seq_ref_upper, seq_upper)
-
-                hom_tig_l = pavlib.call.left_homology(sv_pos_tig - 1, seq_tig_upper, seq_upper)
-                hom_tig_r = pavlib.call.right_homology(sv_pos_tig, seq_tig_upper, seq_upper)
-
-                # Add variant
-                var_id = f'{seq_ref_name}-{pos_ref + 1}-DEL-{oplen}'
-
-                df_insdel_list.append(pd.Series(
-                    [
-                        seq_ref_name, pos_ref, pos_ref + oplen,
-                        var_id, 'DEL', oplen,
-                        hap,
-                        f'{seq_tig_name}:{pos_tig_insdel + 1}-{pos_tig_insdel + 1}', strand,
-                        0,
-                        align_index, cluster_match,
-                        left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
-                        CALL_SOURCE,
-                        seq
-                    ],
-                    index=[
-                        '#CHROM', 'POS', 'END',
-                        'ID', 'SVTYPE', 'SVLEN',
-                        'HAP',
-                        'TIG_REGION', 'QUERY_STRAND',
-                        'CI',
-                        'ALIGN_INDEX', 'CLUSTER_MATCH',
-                        'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-                        'CALL_SOURCE',
-                        'SEQ'
-                    ]
-                ))
+        if snv_cols is not None:
+            snv_col_list.append((align_order, snv_cols))
+
+        # Check CIGAR operations
+        is_bad_op = ~ np.isin(cigar.op_code, _CIGAR_CALL_OPS)
 
-                # Advance
-                pos_ref += oplen
+        if np.any(is_bad_op):
+            cigar_index = np.argmax(is_bad_op)
+            op = cigar.op_chars()[cigar_index]
 
-                pass
+            pos_ref = cigar.ref_pos[cigar_index] + row['POS']
+            pos_tig = cigar.qry_pos[cigar_index]
 
-            elif op in {'S', 'H'}:
-                pos_tig += oplen
+            if op == 'M':
+                raise RuntimeError((
+                    'Illegal operation code in CIGAR string at operation {}: '
+                    'Alignments must be generated with =/X (not M): '
+                    'opcode={}, subject={}:{}, query={}:{}, align-index={}'
+                ).format(
+                    cigar_index + 1, op, seq_ref_name, pos_ref, seq_tig_name, pos_tig, row['INDEX']
+                ))
 
             else:
-                # Cannot handle CIGAR operation
-
-                if op == 'M':
-                    raise RuntimeError((
-                        'Illegal operation code in CIGAR string at operation {}: '
-                        'Alignments must be generated with =/X (not M): '
-                        'opcode={}, subject={}:{}, query={}:{}, align-index={}'
-                    ).format(
-                        cigar_index, op, seq_ref_name, pos_ref, seq_tig_name, pos_tig, row['INDEX']
-                    ))
-
-                else:
-                    raise RuntimeError((
-                        'Illegal operation code in CIGAR string at operation {}: '
-                        'opcode={}, subject={}:{} , query={}:{}, align-index={}'
-                    ).format(
-                        cigar_index, op, seq_ref_name, pos_ref, seq_tig_name, pos_tig, row['INDEX']
-                    ))
-
-            # Save last op
-            last_op = op
-            last_oplen = oplen
+                raise RuntimeError((
+                    'Illegal operation code in CIGAR string at operation {}: '
+                    'opcode={}, subject={}:{} , query={}:{}, align-index={}'
+                ).format(
+                    cigar_index + 1, op, seq_ref_name, pos_ref, seq_tig_name, pos_tig, row['INDEX']
+                ))
+
+        # Call INS/DEL
+        insdel_cols = get_insdel_cols(
+            cigar, row['POS'],
+            seq_ref_name, seq_ref, seq_ref_bytes,
+            seq_tig_name, seq_tig, seq_tig_bytes, seq_tig_len,
+            is_rev, hap, align_index, cluster_match
+        )
+
+        if insdel_cols is not None:
+            insdel_col_list.append((align_order, insdel_cols))
 
     # Merge tables
-    if len(df_snv_list) > 0:
-        df_snv = pd.concat(df_snv_list, axis=1).T
+    # Restore alignment record order
+    snv_col_list = [snv_cols for align_order, snv_cols in sorted(snv_col_list, key=lambda val: val[0])]
+    insdel_col_list = [insdel_cols for align_order, insdel_cols in sorted(insdel_col_list, key=lambda val: val[0])]
+
+    if len(snv_col_list) > 0:
+        df_snv = pd.DataFrame({
+            col: np.concatenate([snv_cols[col] for snv_cols in snv_col_list]) for col in SNV_COLUMNS
+        })
+
         df_snv['ID'] = svpoplib.variant.version_id(df_snv['ID'])
         df_snv.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
 
     else:
-        df_snv = pd.DataFrame(
-            [],
-            columns=[
-                '#CHROM', 'POS', 'END',
-                'ID', 'SVTYPE', 'SVLEN',
-                'REF', 'ALT',
-                'HAP',
-                'TIG_REGION', 'QUERY_STRAND',
-                'CI',
-                'ALIGN_INDEX', 'CLUSTER_MATCH',
-                'CALL_SOURCE'
-            ]
-        )
+        df_snv = pd.DataFrame([], columns=SNV_COLUMNS)
+
+    if len(insdel_col_list) > 0:
+        df_insdel = pd.DataFrame({
+            col: np.concatenate([insdel_cols[col] for insdel_cols in insdel_col_list]) for col in INSDEL_COLUMNS
+        })
 
-    if len(df_insdel_list) > 0:
-        df_insdel = pd.concat(df_insdel_list, axis=1).T
         df_insdel['ID'] = svpoplib.variant.version_id(df_insdel['ID'])
         df_insdel.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
 
     else:
-        df_insdel = pd.DataFrame(
-            [],
-            columns=[
-                '#CHROM', 'POS', 'END',
-                'ID', 'SVTYPE', 'SVLEN',
-                'HAP',
-                'TIG_REGION', 'QUERY_STRAND',
-                'CI',
-                'ALIGN_INDEX', 'CLUSTER_MATCH',
-                'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-                'CALL_SOURCE',
-                'SEQ'
-            ]
-        )
+        df_insdel = pd.DataFrame([], columns=INSDEL_COLUMNS)
 
     # Return tables
     return df_snv, df_insdel
+
+
+def get_snv_cols(cigar, pos, seq_ref_name, seq_ref_bytes, seq_tig_name, seq_tig_bytes, seq_tig_len, is_rev, hap,
+                 align_index, cluster_match):
+    """
+    Call SNVs from mismatched bases (CIGAR "X" operations) in one alignment record. Bases for all SNVs are gathered
+    from sequence arrays at once and returned as column arrays.
+
+    :param cigar: Packed CIGAR operations (`pavlib.align.CigarArray`).
+    :param pos: Alignment start position on the reference.
+    :param seq_ref_name: Reference sequence name.
+    :param seq_ref_bytes: Reference sequence as a uint8 array.
+    :param seq_tig_name: Contig name.
+    :param seq_tig_bytes: Contig sequence as a uint8 array (reverse-complemented if the alignment is reversed).
+    :param seq_tig_len: Contig length.
+    :param is_rev: `True` if the contig was reverse-complemented in the alignment.
+    :param hap: String identifying the haplotype ("h1", "h2").
+    :param align_index: Alignment record index.
+    :param cluster_match: Alignment record cluster match.
+
+    :return: A dictionary of column names (`SNV_COLUMNS`) to arrays, or `None` if there are no SNVs.
+    """
+
+    # Get mismatch operations
+    is_x = cigar.op_code == pavlib.align.CIGAR_X
+
+    x_len = cigar.op_len[is_x].astype(np.int64)
+
+    snv_count = np.sum(x_len)
+
+    if snv_count == 0:
+        return None
+
+    # Get SNV positions (one element for each mismatched base)
+    x_offset = np.arange(snv_count) - np.repeat(np.cumsum(x_len) - x_len, x_len)
+
+    pos_ref = np.repeat(cigar.ref_pos[:-1][is_x] + pos, x_len) + x_offset
+    pos_tig = np.repeat(cigar.qry_pos[:-1][is_x], x_len) + x_offset
+
+    # Get bases
+    base_ref_bytes = seq_ref_bytes[pos_ref]
+    base_tig_bytes = seq_tig_bytes[pos_tig]
+
+    base_ref_upper = _BYTE_TO_BASE_UPPER[base_ref_bytes]
+    base_tig_upper = _BYTE_TO_BASE_UPPER[base_tig_bytes]
+
+    # pos_tig to fwd contig if alignment is reversed
+    if is_rev:
+        pos_tig = seq_tig_len - pos_tig - 1
+
+    # Make columns
+    return {
+        '#CHROM': np.repeat(np.array([seq_ref_name], dtype=object), snv_count),
+        'POS': pos_ref,
+        'END': pos_ref + 1,
+        'ID': np.array([
+            f'{seq_ref_name}-{pos_snv}-SNV-{base_ref}-{base_tig}'
+                for pos_snv, base_ref, base_tig in zip((pos_ref + 1).tolist(), base_ref_upper, base_tig_upper)
+        ], dtype=object),
+        'SVTYPE': np.repeat('SNV', snv_count).astype(object),
+        'SVLEN': np.ones(snv_count, dtype=np.int64),
+        'REF': _BYTE_TO_BASE[base_ref_bytes],
+        'ALT': _BYTE_TO_BASE[base_tig_bytes],
+        'HAP': np.repeat(hap, snv_count).astype(object),
+        'TIG_REGION': np.array([
+            f'{seq_tig_name}:{pos_snv}-{pos_snv}' for pos_snv in (pos_tig + 1).tolist()
+        ], dtype=object),
+        'QUERY_STRAND': np.repeat('-' if is_rev else '+', snv_count).astype(object),
+        'CI': np.zeros(snv_count, dtype=np.int64),
+        'ALIGN_INDEX': np.repeat(np.array([align_index], dtype=object), snv_count),
+        'CLUSTER_MATCH': np.repeat(np.array([cluster_match], dtype=object), snv_count),
+        'CALL_SOURCE': np.repeat(CALL_SOURCE, snv_count).astype(object)
+    }
+
+
+def get_insdel_cols(cigar, pos, seq_ref_name, seq_ref, seq_ref_bytes, seq_tig_name, seq_tig, seq_tig_bytes, seq_tig_len,
+                    is_rev, hap, align_index, cluster_match):
+    """
+    Call insertions and deletions (CIGAR "I" and "D" operations) in one alignment record. Variants following an
+    aligned ("=") operation are left-shifted through breakpoint homology (not more than the length of the "="
+    operation), and breakpoint homology is found for all variants at once (see `call.left_homology_batch()` and
+    `call.right_homology_batch()`).
+
+    :param cigar: Packed CIGAR operations (`pavlib.align.CigarArray`).
+    :param pos: Alignment start position on the reference.
+    :param seq_ref_name: Reference sequence name.
+    :param seq_ref: Reference sequence string.
+    :param seq_ref_bytes: Reference sequence as a uint8 array.
+    :param seq_tig_name: Contig name.
+    :param seq_tig: Contig sequence string (reverse-complemented if the alignment is reversed).
+    :param seq_tig_bytes: Contig sequence as a uint8 array (reverse-complemented if the alignment is reversed).
+    :param seq_tig_len: Contig length.
+    :param is_rev: `True` if the contig was reverse-complemented in the alignment.
+    :param hap: String identifying the haplotype ("h1", "h2").
+    :param align_index: Alignment record index.
+    :param cluster_match: Alignment record cluster match.
+
+    :return: A dictionary of column names (`INSDEL_COLUMNS`) to arrays, or `None` if there are no INS/DELs.
+    """
+
+    # Get INS/DEL operations
+    op_index = np.flatnonzero((cigar.op_code == pavlib.align.CIGAR_I) | (cigar.op_code == pavlib.align.CIGAR_D))
+
+    insdel_count = op_index.shape[0]
+
+    if insdel_count == 0:
+        return None
+
+    is_ins = cigar.op_code[op_index] == pavlib.align.CIGAR_I
+
+    op_len = cigar.op_len[op_index].astype(np.int64)
+    pos_ref = cigar.ref_pos[op_index].astype(np.int64) + pos
+    pos_tig = cigar.qry_pos[op_index].astype(np.int64)
+
+    # Left-shift limit (length of the previous "=" operation)
+    shift_limit = np.zeros(insdel_count, dtype=np.int64)
+
+    has_prev = op_index > 0
+    prev_index = op_index[has_prev] - 1
+
+    shift_limit[has_prev] = np.where(
+        cigar.op_code[prev_index] == pavlib.align.CIGAR_EQ, cigar.op_len[prev_index], 0
+    )
+
+    # Get sequences
+    seq_list = [
+        seq_tig[sv_pos_tig:(sv_pos_tig + sv_len)] if sv_is_ins else seq_ref[sv_pos_ref:(sv_pos_ref + sv_len)]
+            for sv_is_ins, sv_pos_ref, sv_pos_tig, sv_len in zip(
+                is_ins.tolist(), pos_ref.tolist(), pos_tig.tolist(), op_len.tolist()
+            )
+    ]
+
+    # Left shift (SV/breakpoint upstream homology)
+    left_shift = np.zeros(insdel_count, dtype=np.int64)
+
+    shift_index = np.flatnonzero(shift_limit > 0)
+
+    if shift_index.shape[0] > 0:
+        left_shift[shift_index] = np.minimum(
+            shift_limit[shift_index],
+            pavlib.call.left_homology_batch(
+                pos_ref[shift_index] - 1, seq_ref_bytes, [seq_list[index] for index in shift_index]
+            )
+        )
+
+    sv_pos_ref = pos_ref - left_shift
+    sv_end_ref = np.where(is_ins, sv_pos_ref + 1, sv_pos_ref + op_len)
+    sv_pos_tig = pos_tig - left_shift
+    sv_end_tig = np.where(is_ins, sv_pos_tig + op_len, sv_pos_tig + 1)
+
+    # Shifted INS sequence
+    for index in np.flatnonzero(is_ins & (left_shift != 0)):
+        seq_list[index] = seq_tig[sv_pos_tig[index]:(sv_pos_tig[index] + op_len[index])]
+
+    # Find breakpoint homology
+    hom_ref_l = pavlib.call.left_homology_batch(sv_pos_ref - 1, seq_ref_bytes, seq_list)
+    hom_ref_r = pavlib.call.right_homology_batch(np.where(is_ins, sv_pos_ref, sv_end_ref), seq_ref_bytes, seq_list)
+
+    hom_tig_l = pavlib.call.left_homology_batch(sv_pos_tig - 1, seq_tig_bytes, seq_list)
+    hom_tig_r = pavlib.call.right_homology_batch(np.where(is_ins, sv_end_tig, sv_pos_tig), seq_tig_bytes, seq_list)
+
+    # Contig positions in the original contig orientation. DEL records keep the un-shifted reference position
+    if is_rev:
+        pos_tig_insdel = np.where(is_ins, seq_tig_len - sv_pos_tig - op_len, seq_tig_len - sv_pos_tig)
+    else:
+        pos_tig_insdel = sv_pos_tig
+
+    end_tig_insdel = np.where(is_ins, pos_tig_insdel + op_len, pos_tig_insdel + 1)
+
+    pos_var = np.where(is_ins, sv_pos_ref, pos_ref)
+    end_var = np.where(is_ins, sv_end_ref, pos_ref + op_len)
+
+    svtype = np.where(is_ins, 'INS', 'DEL').astype(object)
+
+    # Make columns
+    return {
+        '#CHROM': np.repeat(np.array([seq_ref_name], dtype=object), insdel_count),
+        'POS': pos_var,
+        'END': end_var,
+        'ID': np.array([
+            f'{seq_ref_name}-{var_pos}-{var_svtype}-{var_len}'
+                for var_pos, var_svtype, var_len in zip((pos_var + 1).tolist(), svtype, op_len.tolist())
+        ], dtype=object),
+        'SVTYPE': svtype,
+        'SVLEN': op_len,
+        'HAP': np.repeat(hap, insdel_count).astype(object),
+        'TIG_REGION': np.array([
+            f'{seq_tig_name}:{var_pos}-{var_end}'
+                for var_pos, var_end in zip((pos_tig_insdel + 1).tolist(), end_tig_insdel.tolist())
+        ], dtype=object),
+        'QUERY_STRAND': np.repeat('-' if is_rev else '+', insdel_count).astype(object),
+        'CI': np.zeros(insdel_count, dtype=np.int64),
+        'ALIGN_INDEX': np.repeat(np.array([align_index], dtype=object), insdel_count),
+        'CLUSTER_MATCH': np.repeat(np.array([cluster_match], dtype=object), insdel_count),
+        'LEFT_SHIFT': left_shift,
+        'HOM_REF': np.array([
+            f'{hom_l},{hom_r}' for hom_l, hom_r in zip(hom_ref_l.tolist(), hom_ref_r.tolist())
+        ], dtype=object),
+        'HOM_TIG': np.array([
+            f'{hom_l},{hom_r}' for hom_l, hom_r in zip(hom_tig_l.tolist(), hom_tig_r.tolist())
+        ], dtype=object),
+        'CALL_SOURCE': np.repeat(CALL_SOURCE, insdel_count).astype(object),
+        'SEQ': np.array(seq_list, dtype=object)
+    }
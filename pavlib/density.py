@@ -2,12 +2,19 @@
 K-mer density used for calling inversions.
 """
 
+import atexit
 import multiprocessing as mp
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
 import numpy as np
 import pandas as pd
 
+import scipy.signal
 import scipy.stats
 
+import pavlib.seq
+import kanapy.util.kmer
+
 # K-mer orientation matrix: Tig k-mer against forward (vertical axis)
 # and reverse (horizontal axis) k-mers in the reference
 #
@@ -23,7 +30,359 @@ KMER_ORIENTATION_STATE = np.asarray(
     ]
 )
 
-SAMPLE_INDEX_CHUNK_SIZE = 400
+SAMPLE_INDEX_CHUNK_SIZE = 400  # Chunk density indices into groups of this many and compute density together.
+
+MAX_REF_KMER_COUNT = 100   # Skip low-complexity regions
+
+DENSITY_COLUMNS = ['INDEX', 'STATE_MER', 'STATE', 'KERN_FWD', 'KERN_FWDREV', 'KERN_REV', 'KMER']
+
+DENSITY_METHODS = ('kde', 'fft')  # Density methods (see get_smoothed_density())
+
+DEFAULT_DENSITY_METHOD = 'kde'
+
+FFT_KERNEL_TRUNCATE = 9  # Truncate the FFT Gaussian kernel at this many standard deviations
+
+
+#
+# Worker pool
+#
+
+# Worker pool persists across density calls (created on first use)
+_density_pool = None
+_density_pool_threads = None
+
+
+def get_density_pool(threads):
+    """
+    Get a persistent worker pool for computing densities. The pool is created on the first call and reused by all
+    density calls in this process until the number of threads changes or `close_density_pool()` is called.
+
+    :param threads: Number of worker processes (may be a string from config overrides).
+
+    :return: A `multiprocessing.Pool` object or `None` if `threads` is less than 2 (compute in this process).
+    """
+
+    global _density_pool
+    global _density_pool_threads
+
+    if threads is None:
+        return None
+
+    threads = int(threads)
+
+    if threads < 2:
+        return None
+
+    if _density_pool is not None and _density_pool_threads != threads:
+        close_density_pool()
+
+    if _density_pool is None:
+        mp.resource_tracker.ensure_running()  # Workers share the tracker for shared memory blocks
+
+        _density_pool = mp.Pool(threads)
+        _density_pool_threads = threads
+
+    return _density_pool
+
+
+def close_density_pool():
+    """
+    Shut down the persistent density worker pool if it was created.
+    """
+
+    global _density_pool
+    global _density_pool_threads
+
+    if _density_pool is not None:
+        _density_pool.close()
+        _density_pool.join()
+
+    _density_pool = None
+    _density_pool_threads = None
+
+
+atexit.register(close_density_pool)
+
+
+def _kernel_density(index_den, state_index, bandwidth, state_count):
+    """
+    Compute a scaled kernel density for one k-mer state.
+
+    :param index_den: Points (density space) to compute density over.
+    :param state_index: Density-space indices of k-mers in this state.
+    :param bandwidth: Kernel bandwidth.
+    :param state_count: Number of k-mers in this state (density is scaled by this value).
+
+    :return: An array of densities for each point in `index_den`.
+    """
+
+    if state_count == 0:
+        return np.zeros(len(index_den))
+
+    return scipy.stats.gaussian_kde(state_index, bw_method=bandwidth)(index_den) * state_count
+
+
+def _kernel_density_shared(index_den, shm_name, shm_len, state_pos, state_end, bandwidth):
+    """
+    Compute a scaled kernel density for one k-mer state in a worker process. Density-space indices for all states are
+    read from a shared memory block written by `_kernel_density_states()` instead of being copied to each task.
+
+    :param index_den: Points (density space) to compute density over.
+    :param shm_name: Name of the shared memory block.
+    :param shm_len: Number of indices (int64) in the shared memory block.
+    :param state_pos: Position of the first index for this state in the shared memory block.
+    :param state_end: End position of indices for this state in the shared memory block.
+    :param bandwidth: Kernel bandwidth.
+
+    :return: An array of densities for each point in `index_den`.
+    """
+
+    shm = mp.shared_memory.SharedMemory(name=shm_name)
+
+    try:
+        state_index = np.ndarray(shm_len, dtype=np.int64, buffer=shm.buf)[state_pos:state_end]
+
+        density = _kernel_density(index_den, state_index, bandwidth, state_end - state_pos)
+
+        del state_index  # Release the shared buffer before closing
+
+    finally:
+        shm.close()
+
+    return density
+
+
+def _kernel_density_states(index_den, state_index_list, bandwidth, pool):
+    """
+    Compute scaled kernel densities for all k-mer states. If a worker pool is used, the density-space indices for each
+    state are placed in shared memory for the duration of the call.
+
+    :param index_den: Array of points (density space) to compute density over.
+    :param state_index_list: List of density-space index arrays, one for each state (fwd, fwd-rev, rev).
+    :param bandwidth: Kernel bandwidth.
+    :param pool: Worker pool or `None` to compute in this process.
+
+    :return: A list of density arrays, one for each state.
+    """
+
+    index_den_chunked = [
+        index_den[x:x + SAMPLE_INDEX_CHUNK_SIZE]
+            for x in range(0, len(index_den), SAMPLE_INDEX_CHUNK_SIZE)
+    ]
+
+    if pool is not None:
+
+        # Write state indices to shared memory
+        state_end = np.cumsum([len(state_index) for state_index in state_index_list])
+        state_pos = state_end - [len(state_index) for state_index in state_index_list]
+
+        shm_len = int(state_end[-1])
+
+        shm = mp.shared_memory.SharedMemory(create=True, size=max(shm_len, 1) * 8)
+
+        try:
+            shm_index = np.ndarray(shm_len, dtype=np.int64, buffer=shm.buf)
+
+            for state_n, state_index in enumerate(state_index_list):
+                shm_index[state_pos[state_n]:state_end[state_n]] = state_index
+
+            del shm_index
+
+            density_list = pool.starmap(
+                _kernel_density_shared,
+                [
+                    (index_chunk, shm.name, shm_len, int(state_pos[state_n]), int(state_end[state_n]), bandwidth)
+                        for state_n in range(len(state_index_list)) for index_chunk in index_den_chunked
+                ]
+            )
+
+        finally:
+            shm.close()
+            shm.unlink()
+
+    else:
+        density_list = [
+            _kernel_density(index_chunk, state_index, bandwidth, len(state_index))
+                for state_index in state_index_list for index_chunk in index_den_chunked
+        ]
+
+    n_chunk = len(index_den_chunked)
+
+    return [
+        np.concatenate(density_list[state_n * n_chunk:(state_n + 1) * n_chunk])
+            for state_n in range(len(state_index_list))
+    ]
+
+
+def _fft_kernel_density(n, state_index, bandwidth):
+    """
+    Compute a scaled kernel density for one k-mer state over all points in density space (0 to `n - 1`). Gives the
+    same density as `_kernel_density()` (a Gaussian KDE with Scott's-rule bandwidth scaled by the number of k-mers)
+    by convolving the count of k-mers at each point with a Gaussian kernel using FFT. The kernel is truncated at
+    `FFT_KERNEL_TRUNCATE` standard deviations or at the size of the region, whichever is smaller.
+
+    :param n: Number of points in density space.
+    :param state_index: Density-space indices of k-mers in this state.
+    :param bandwidth: Kernel bandwidth.
+
+    :return: An array of densities for each point in density space.
+    """
+
+    if len(state_index) == 0:
+        return np.zeros(n)
+
+    if len(state_index) < 2:
+        raise RuntimeError('Cannot compute kernel density for a state with fewer than 2 k-mers')
+
+    # Kernel standard deviation (same as scipy.stats.gaussian_kde: sample standard deviation times bandwidth)
+    kernel_sd = np.std(state_index, ddof=1) * bandwidth
+
+    kernel_flank = int(min(n - 1, np.ceil(kernel_sd * FFT_KERNEL_TRUNCATE)))
+
+    kernel = np.arange(-kernel_flank, kernel_flank + 1) / kernel_sd
+    kernel = np.exp(-0.5 * kernel * kernel) / (kernel_sd * np.sqrt(2 * np.pi))
+
+    # Convolve k-mer counts with the kernel
+    density = scipy.signal.fftconvolve(
+        np.bincount(state_index, minlength=n).astype(np.float64), kernel, mode='full'
+    )[kernel_flank:kernel_flank + n]
+
+    return np.maximum(density, 0.0)  # Remove negative FFT round-off
+
+
+#
+# Density
+#
+
+def _check_ref_kmer_count(ref_kmer_count, region_ref, k_util):
+    """
+    Check reference k-mer counts before computing density. Raises `RuntimeError` if there are no reference k-mers or
+    if any k-mer is found more than `MAX_REF_KMER_COUNT` times (low-complexity region).
+
+    :param ref_kmer_count: Reference k-mer counts (see `pavlib.seq.ref_kmers()`).
+    :param region_ref: Reference region (for error messages).
+    :param k_util: K-mer utility from kanapy package.
+    """
+
+    if ref_kmer_count is None or len(ref_kmer_count) == 0:
+        raise RuntimeError(f'No reference k-mers for region {region_ref}')
+
+    # Skip low-complexity sites with repetitive k-mers
+    max_mer_count = np.max(list(ref_kmer_count.values()))
+
+    if max_mer_count > MAX_REF_KMER_COUNT:
+        max_mer = [kmer for kmer, count in ref_kmer_count.items() if count == max_mer_count][0]
+
+        raise RuntimeError('K-mer count exceeds max: {} > {} ({}): {}'.format(
+            max_mer_count,
+            MAX_REF_KMER_COUNT,
+            k_util.to_string(max_mer),
+            region_ref
+        ))
+
+
+def get_kmer_state(kmers, ref_kmer_set, k_util):
+    """
+    Get the orientation state of each contig k-mer against reference k-mers (see `KMER_ORIENTATION_STATE`).
+
+    :param kmers: Contig k-mers (list, array, or Series).
+    :param ref_kmer_set: A set of reference k-mers or a sorted k-mer array (see `pavlib.seq.kmer_array()`).
+    :param k_util: K-mer utility from kanapy package.
+
+    :return: An integer array of k-mer states.
+    """
+
+    if k_util.k_size > pavlib.seq.MAX_KMER_ARRAY_K:
+        # K-mers do not fit in arrays
+        if isinstance(ref_kmer_set, np.ndarray):
+            ref_kmer_set = set(ref_kmer_set.tolist())
+
+        return np.asarray([
+            KMER_ORIENTATION_STATE[
+                int(kmer in ref_kmer_set),
+                int(k_util.rev_complement(kmer) in ref_kmer_set)
+            ] for kmer in kmers
+        ], dtype=int)
+
+    if not isinstance(ref_kmer_set, np.ndarray):
+        ref_kmer_set = pavlib.seq.kmer_array(ref_kmer_set)
+
+    kmer_arr = np.asarray(kmers, dtype=np.uint64)
+
+    return KMER_ORIENTATION_STATE[
+        pavlib.seq.kmer_in_array(kmer_arr, ref_kmer_set).astype(int),
+        pavlib.seq.kmer_in_array(
+            pavlib.seq.kmer_rev_complement_array(kmer_arr, k_util.k_size), ref_kmer_set
+        ).astype(int)
+    ]
+
+
+def get_density_table(
+        region_ref, region_tig,
+        ref_fa_name, tig_fa_name,
+        k_util,
+        threads=1,
+        min_informative_kmers=2000,
+        density_smooth_factor=1,
+        min_state_count=20,
+        state_run_smooth=20,
+        state_run_smooth_delta=0.005,
+        density_method=DEFAULT_DENSITY_METHOD
+    ):
+    """
+    Get a k-mer density table for a contig region aligned to a reference region. Contig k-mers are read from
+    `region_tig` in contig orientation, and if `region_tig` is reverse-complemented (`region_tig.is_rev`), reference
+    k-mers are reverse-complemented. See `get_smoothed_density()` for a description of the density table.
+
+    :param region_ref: Reference region.
+    :param region_tig: Contig region.
+    :param ref_fa_name: Reference FASTA file name.
+    :param tig_fa_name: Contig FASTA file name.
+    :param k_util: K-mer utility from kanapy package.
+    :param threads: Number of worker processes for computing densities (persistent pool, see `get_density_pool()`).
+    :param min_informative_kmers: See `get_smoothed_density()`.
+    :param density_smooth_factor: See `get_smoothed_density()`.
+    :param min_state_count: See `get_smoothed_density()`.
+    :param state_run_smooth: See `get_smoothed_density()`.
+    :param state_run_smooth_delta: See `get_smoothed_density()`.
+    :param density_method: See `get_smoothed_density()`.
+
+    :return: A Pandas dataframe describing the density.
+    """
+
+    ### Get reference k-mer counts ###
+    ref_kmer_count = pavlib.seq.ref_kmers(region_ref, ref_fa_name, k_util)
+
+    _check_ref_kmer_count(ref_kmer_count, region_ref, k_util)
+
+    if k_util.k_size <= pavlib.seq.MAX_KMER_ARRAY_K:
+        ref_kmer_set = pavlib.seq.kmer_array(ref_kmer_count.keys())
+
+        if region_tig.is_rev:
+            ref_kmer_set = np.sort(pavlib.seq.kmer_rev_complement_array(ref_kmer_set, k_util.k_size))
+
+    else:
+        ref_kmer_set = set(ref_kmer_count)
+
+        if region_tig.is_rev:
+            ref_kmer_set = {k_util.rev_complement(kmer) for kmer in ref_kmer_set}
+
+    ### Get contig k-mers as list ###
+    seq_tig = pavlib.seq.region_seq_fasta(region_tig, tig_fa_name, False)
+
+    tig_mer_stream = list(kanapy.util.kmer.stream(seq_tig, k_util, index=True))
+
+    ### Get density ###
+    return get_smoothed_density(
+        tig_mer_stream, ref_kmer_set, k_util,
+        threads=threads,
+        min_informative_kmers=min_informative_kmers,
+        density_smooth_factor=density_smooth_factor,
+        min_state_count=min_state_count,
+        state_run_smooth=state_run_smooth,
+        state_run_smooth_delta=state_run_smooth_delta,
+        density_method=density_method
+    )
 
 
 def get_smoothed_density(
@@ -35,7 +394,8 @@ def get_smoothed_density(
         density_smooth_factor=1,
         min_state_count=20,
         state_run_smooth=20,
-        state_run_smooth_delta=0.005
+        state_run_smooth_delta=0.005,
+        density_method=DEFAULT_DENSITY_METHOD
     ):
 
     """
@@ -51,56 +411,96 @@ def get_smoothed_density(
     * density: All missing and uninformative k-mers (k-mers not in the reference region in either orientation) are
         removed and records are re-indexed starting from 0. This keeps the density from dropping off if there is
         disagreement between the sequence and reference (e.g. SVs or indels in the sequence). This index is "INDEX_DEN"
-        in the output DataFrame. It is useful for following the density smoothing process, but is not used outside this
-        function.
+        and is used for density computations, but it is not part of the output DataFrame.
     
     Dataframe fields:
     * INDEX: K-mer index from the k-mer stream (skipped k-mers also skips indices).
-    * INDEX_DEN: Index in density space. All uninformative k-mers are removed and remaining rows are re-indexed starting
-        from 0. The kernel density function is computed over this range.
     * STATE_MER: State of the k-mer record.
     * STATE: Kernel density smoothed states.
     * KERN_FWD: Kernel density of forward-oriented k-mers.
     * KERN_FWDREV: Kernel density of forward- and reverse-oriented k-mers (found in both orientations in the reference).
     * KERN_REV: Kernel density of reverse-oriented k-mers.
+    * KMER: K-mer.
+
+    If there are fewer than `min_informative_kmers` informative k-mers, densities are not computed, "STATE" is -1 for
+    all informative k-mers, and density columns are NaN.
 
     :param tig_mer_stream: A list of (k-mer, count) tuples from the contig region.
-    :param ref_kmer_set: A set of k-mers in the reference region where the contig region aligns.
+    :param ref_kmer_set: A set of k-mers in the reference region where the contig region aligns. May also be a
+        sorted k-mer array (see `pavlib.seq.kmer_array()`).
     :param k_util: K-mer utility from kanapy package.
-    :param threads: Number of threads to use for computing densities.
+    :param threads: Number of worker processes to use for computing densities. Workers are kept in a persistent pool
+        and reused by subsequent calls (see `get_density_pool()`).
     :param min_informative_kmers: Do not attempt density if the number of informative k-mers does not reach this limit.
         Informative k-mers are defined as k-mers that are in forward and/or reverse-complement in the reference
         k-mer set.
     :param density_smooth_factor: Smooth density by this factor. Density bandwidth is estimated by Scott's rule then
         multiplied by this factor to further smooth (> 1) or restrict smoothing (< 1). See
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.gaussian_kde.html
+    :param min_state_count: States (fwd, fwd-rev, rev) that do not appear in at least this many k-mers are discarded.
+        This prevents extreme density spikes concentrated in a small number of k-mers from states that are too sparse
+        to be informative.
     :param state_run_smooth: Smooth density calculations by this many records. Initially, calculate density only once
         in a run of this many k-mers. If there is a state change or a delta larger than `state_run_smooth_delta`, then
         density is filled in for all skipped elements. If there is no state change and the delta is small, use linear
         interpolation to fill in missing values.
     :param state_run_smooth_delta: Changes between state densities by this much or more will be filled in with actual
         density values instead of interpolated. See `state_run_smooth`.
+    :param density_method: Method for computing densities. "kde" evaluates a Gaussian KDE on sampled k-mers and fills
+        in densities between samples (see `state_run_smooth`). "fft" computes the same Gaussian densities for all
+        k-mers by FFT convolution on the density-space grid. It does not sample or interpolate, and `threads`,
+        `state_run_smooth`, and `state_run_smooth_delta` are ignored. "fft" is much faster for large regions.
 
     :return: A Pandas dataframe describing the density. The dataframe index is set to the "INDEX" column (index in
         k-mer/tig space).
     """
 
-    # Objects used by threads
-    kernel_dict = None
-
     # Make dataframe
     df = pd.DataFrame(tig_mer_stream, columns=['KMER', 'INDEX'])
 
     df['STATE'] = -1
 
     # Assign state
-    df['STATE_MER'] = df['KMER'].apply(lambda kmer:
-       KMER_ORIENTATION_STATE[
-           int(kmer in ref_kmer_set),
-           int(k_util.rev_complement(kmer) in ref_kmer_set)
-       ]
+    df['STATE_MER'] = get_kmer_state(df['KMER'], ref_kmer_set, k_util)
+
+    # Get density
+    return get_state_density(
+        df,
+        threads=threads,
+        min_informative_kmers=min_informative_kmers,
+        density_smooth_factor=density_smooth_factor,
+        min_state_count=min_state_count,
+        state_run_smooth=state_run_smooth,
+        state_run_smooth_delta=state_run_smooth_delta,
+        density_method=density_method
     )
 
+
+def get_state_density(
+        df,
+        threads=1,
+        min_informative_kmers=2000,
+        density_smooth_factor=1,
+        min_state_count=20,
+        state_run_smooth=20,
+        state_run_smooth_delta=0.005,
+        density_method=DEFAULT_DENSITY_METHOD
+    ):
+    """
+    Compute smoothed k-mer densities from a table of contig k-mers with k-mer states assigned. Parameters and the
+    returned table are described in `get_smoothed_density()`.
+
+    :param df: Dataframe with columns "KMER", "INDEX", "STATE", and "STATE_MER" (k-mer state, see
+        `get_kmer_state()`) in k-mer index order.
+
+    :return: A Pandas dataframe describing the density.
+    """
+
+    if density_method not in DENSITY_METHODS:
+        raise RuntimeError('Unknown density method: {}: Expected one of {}'.format(
+            density_method, ', '.join(DENSITY_METHODS)
+        ))
+
     # Subset to informative sites
     df = df.loc[df['STATE_MER'] != -1]
 
@@ -108,223 +508,362 @@ def get_smoothed_density(
     state_count = df.groupby('STATE_MER')['STATE_MER'].count()
 
     for low_state in state_count[state_count < min_state_count].index:
-        df_rm = df.loc[df['STATE_MER'] == low_state].copy()
-
-        df_rm['KERN_FWD'] = np.nan
-        df_rm['KERN_FWDREV'] = np.nan
-        df_rm['KERN_REV'] = np.nan
-
         df = df.loc[df['STATE_MER'] != low_state]
 
     # Check for number of informative k-mers before computing density
-    if df.shape[0] < min_informative_kmers or np.all(df['STATE_MER'] == 0):
-        return pd.DataFrame([], columns=['INDEX', 'STATE_MER', 'STATE', 'KERN_FWD', 'KERN_FWDREV', 'KERN_REV', 'KMER'])
+    if df.shape[0] == 0 or df.shape[0] < min_informative_kmers:
+        df = df.assign(KERN_FWD=np.nan, KERN_FWDREV=np.nan, KERN_REV=np.nan)[DENSITY_COLUMNS]
+        df.set_index(df['INDEX'], inplace=True, drop=False)
+
+        return df
 
     # Setup bandwidth and index in informative k-mer space (ignore df['INDEX'] for density)
     density_bandwidth = df.shape[0] ** (-1.0 / 5.0) * density_smooth_factor
 
-    # Index in condensed space
-    df.insert(1, 'INDEX_DEN', np.arange(df.shape[0]))
+    # Index in condensed space (density space index is the position in these arrays)
+    state_mer = df['STATE_MER'].values
+    index_den = np.arange(df.shape[0])
 
-    df.set_index('INDEX_DEN', inplace=True, drop=False)  # Switch index to density space
+    state_index_list = [index_den[state_mer == state] for state in (0, 1, 2)]  # fwd, fwdrev, rev
 
-    # Count states for scaled-density
-    sum_state_fwd = np.sum(df['STATE_MER'] == 0)
-    sum_state_fwdrev = np.sum(df['STATE_MER'] == 1)
-    sum_state_rev = np.sum(df['STATE_MER'] == 2)
+    if density_method == 'fft':
+        # Compute density for all k-mers
+        kern = np.column_stack([
+            _fft_kernel_density(df.shape[0], state_index, density_bandwidth) for state_index in state_index_list
+        ])
 
-    # Setup density models.
-    # Initializes kernel_dict per-thread
-    def init_density():
-        global kernel_dict
+    else:
+        # Compute density on sampled k-mers and fill in
+        kern = np.full((df.shape[0], 3), np.nan)
 
-        if kernel_dict is None:
-            kernel_dict = dict()
+        pool = get_density_pool(threads)
 
-            if np.any(df['STATE_MER'] == 0):
-                kernel_dict['fwd'] = scipy.stats.gaussian_kde(
-                    df.loc[df['STATE_MER'] == 0, 'INDEX_DEN'],
-                    bw_method=density_bandwidth
-                )
-            else:
-                kernel_dict['fwd'] = lambda x: np.zeros(np.array(x).shape[0])
+        # Setup indexes (initial non-sampled sites density is initially calcuated over)
+        sample_index = index_den[index_den % state_run_smooth == 0]
 
-            if np.any(df['STATE_MER'] == 1):
-                kernel_dict['fwdrev'] = scipy.stats.gaussian_kde(
-                    df.loc[df['STATE_MER'] == 1, 'INDEX_DEN'],
-                    bw_method=density_bandwidth
-                )
-            else:
-                kernel_dict['fwdrev'] = lambda x: np.zeros(np.array(x).shape[0])
+        if sample_index[-1] != index_den[-1]:  # Add last table element if it does not exist
+            sample_index = np.append(sample_index, index_den[-1])
 
-            if np.any(df['STATE_MER'] == 2):
-                kernel_dict['rev'] = scipy.stats.gaussian_kde(
-                    df.loc[df['STATE_MER'] == 2, 'INDEX_DEN'],
-                    bw_method=density_bandwidth
-                )
-            else:
-                kernel_dict['rev'] = lambda x: np.zeros(np.array(x).shape[0])
-
-    # Density calculation functions.
-    def density_fwd(val):
-        return kernel_dict['fwd'](val) * sum_state_fwd
-
-    def density_fwdrev(val):
-        return kernel_dict['fwdrev'](val) * sum_state_fwdrev
-
-    def density_rev(val):
-        return kernel_dict['rev'](val) * sum_state_rev
-
-    # Interpolation functions.
-    # Take a range of values where the flanks (values just before and after inner_range) ar filled in, then
-    # interpolates density values between them.
-    def interp_fwd(inner_range):
-        range_start = inner_range[0] - 1
-        range_end = inner_range[-1] + 1
-
-        return \
-        np.interp(
-            inner_range,
-            [range_start, range_end],
-            [df.loc[range_start, 'KERN_FWD'], df.loc[range_end, 'KERN_FWD']]
+        # Assign density on sampled sites
+        kern[sample_index, :] = np.column_stack(
+            _kernel_density_states(sample_index, state_index_list, density_bandwidth, pool)
         )
 
-    def interp_fwdrev(inner_range):
-        range_start = inner_range[0] - 1
-        range_end = inner_range[-1] + 1
+        # Get max state on sampled sites
+        sample_state = np.argmax(kern[sample_index, :], axis=1)
 
-        return \
-        np.interp(
-            inner_range,
-            [range_start, range_end],
-            [df.loc[range_start, 'KERN_FWDREV'], df.loc[range_end, 'KERN_FWDREV']]
-        )
+        # Get indices where density must be computed and indices that can be interpolated.
+        range_start = sample_index[:-1]
+        range_end = sample_index[1:]
 
-    def interp_rev(inner_range):
-        range_start = inner_range[0] - 1
-        range_end = inner_range[-1] + 1
+        mer_change_count = np.concatenate([[0], np.cumsum(state_mer[1:] != state_mer[:-1])])
 
-        return \
-        np.interp(
-            inner_range,
-            [range_start, range_end],
-            [df.loc[range_start, 'KERN_REV'], df.loc[range_end, 'KERN_REV']]
-        )
+        state_change = \
+            (mer_change_count[range_end] != mer_change_count[range_start]) | \
+            (sample_state[:-1] != sample_state[1:])
 
-    # Setup indexes (initial non-sampled sites density is initially calcuated over)
-    sample_index_list = list(df.loc[df['INDEX_DEN'] % state_run_smooth == 0, 'INDEX_DEN'])
+        density_change = np.max(np.abs(kern[range_start, :] - kern[range_end, :]), axis=1) > state_run_smooth_delta
 
-    if sample_index_list[-1] != np.int32(df.iloc[-1]['INDEX_DEN']):  # Add last table element if it does not exist
-        sample_index_list.append(np.int32(df.iloc[-1]['INDEX_DEN']))
+        has_inner = range_end > range_start + 1  # Ranges with adjacent indexes have density calculated for all records
 
-    # Break sample_index_list into equal-sized lists for parallel processing in chunks (last list may be shorter)
-    sample_index_chunked = [
-        sample_index_list[x:x + SAMPLE_INDEX_CHUNK_SIZE]
-            for x in range(0, len(sample_index_list), SAMPLE_INDEX_CHUNK_SIZE)
-    ]
+        # Interpolate values (where density does not need to be calculated)
+        for range_n in np.flatnonzero(has_inner & ~ (state_change | density_change)):
+            start = range_start[range_n]
+            end = range_end[range_n]
 
-    # Setup thread object
-    pool = mp.Pool(threads, initializer=init_density)
+            inner_range = np.arange(start + 1, end)
 
-    # Assign density on sampled sites
-    df['STATE'] = -1
-    df['KERN_FWD'] = np.nan
-    df['KERN_FWDREV'] = np.nan
-    df['KERN_REV'] = np.nan
-    df['INTERP'] = False
-
-    df.loc[sample_index_list, 'KERN_FWD'] = np.concatenate(pool.map(density_fwd, sample_index_chunked))
-    df.loc[sample_index_list, 'KERN_FWDREV'] = np.concatenate(pool.map(density_fwdrev, sample_index_chunked))
-    df.loc[sample_index_list, 'KERN_REV'] = np.concatenate(pool.map(density_rev, sample_index_chunked))
-
-    # Get max state
-    df.loc[sample_index_list, 'STATE'] = df.loc[
-        sample_index_list, ['KERN_FWD', 'KERN_FWDREV', 'KERN_REV']
-    ].apply(
-        lambda vals: np.argmax(vals.array), axis=1
-    )
+            for state_n in range(3):
+                kern[inner_range, state_n] = np.interp(
+                    inner_range,
+                    [start, end],
+                    [kern[start, state_n], kern[end, state_n]]
+                )
 
-    # Get indices where density must be computed and indices that can be interpolated
-    density_range_list = list()  # Fully compute density
-    interp_range_list = list()   # Interpolate from sampled loci
+        # Calculate density values within chunks where values could not be interpolated
+        # (too close to potential state changes)
+        density_range_n = np.flatnonzero(has_inner & (state_change | density_change))
 
-    for index in range(len(sample_index_list) - 1):
+        if len(density_range_n) > 0:
+            density_index = np.concatenate([
+                np.arange(range_start[range_n] + 1, range_end[range_n]) for range_n in density_range_n
+            ])
 
-        range_start = sample_index_list[index]
-        range_end = sample_index_list[index + 1]
+            kern[density_index, :] = np.column_stack(
+                _kernel_density_states(density_index, state_index_list, density_bandwidth, pool)
+            )
 
-        outer_range = np.arange(range_start, range_end + 1)  # All values including the first and last with densities
-        inner_range = np.arange(range_start + 1, range_end)  # Inner values (without densities calculated)
+    # Penalize spikes above 1.0.
+    spike = kern > 1.0
+    kern[spike] = 1 / kern[spike]
 
-        if range_end == range_start + 1:
-            continue  # Indexes are next to each other, all records in range have density calculations
+    # Set max densities on all
+    df = df.copy()
 
-        state_change = \
-            len(set(df.loc[outer_range, 'STATE_MER'])) > 1 or \
-            df.loc[range_start, 'STATE'] != df.loc[range_end, 'STATE']
+    df['KERN_FWD'] = kern[:, 0]
+    df['KERN_FWDREV'] = kern[:, 1]
+    df['KERN_REV'] = kern[:, 2]
+
+    df['STATE'] = np.argmax(kern, axis=1)
+
+    # Column order
+    df = df[DENSITY_COLUMNS]
+
+    # Return
+    df.set_index(df['INDEX'], inplace=True, drop=False)
+
+    return df
+
+
+class IncrementalDensity:
+    """
+    Computes density tables for a reference and contig region pair that grows between calls, such as regions expanded
+    by `pavlib.inv.scan_for_inv()`. Reference k-mer counts, contig k-mers, and the reference membership of contig
+    k-mers are kept from the previous call, and only k-mers in the flanks added to each region are read. If a region
+    does not contain the region from the previous call (e.g. it was shifted or lifted to a different location), k-mers
+    are read for the whole region.
+
+    Densities are recomputed on each call because the kernel bandwidth depends on the number of informative k-mers.
+
+    K-mers larger than `pavlib.seq.MAX_KMER_ARRAY_K` are not cached; each call reads k-mers for the whole region
+    (same as `get_density_table()`).
+    """
+
+    def __init__(self, ref_fa_name, tig_fa_name, k_util):
+        """
+        Create an incremental density object.
+
+        :param ref_fa_name: Reference FASTA file name.
+        :param tig_fa_name: Contig FASTA file name.
+        :param k_util: K-mer utility from kanapy package.
+        """
+
+        self.ref_fa_name = ref_fa_name
+        self.tig_fa_name = tig_fa_name
+        self.k_util = k_util
+
+        # Reference k-mers
+        self.region_ref = None
+        self.ref_kmer_count = None
+        self.ref_kmer_arr = None
+
+        # Contig k-mers (k-mer, index relative to region_tig.pos, k-mer in reference, rev-compl k-mer in reference)
+        self.region_tig = None
+        self.tig_kmer = None
+        self.tig_index = None
+        self.tig_in_ref = None
+        self.tig_rev_in_ref = None
+
+    def get_density_table(self, region_ref, region_tig, **kwargs):
+        """
+        Get a k-mer density table. Same as `get_density_table()`, but reuses k-mers from the previous call.
+
+        :param region_ref: Reference region.
+        :param region_tig: Contig region.
+        :param kwargs: Density parameters passed to `get_state_density()`.
+
+        :return: A Pandas dataframe describing the density.
+        """
+
+        k_util = self.k_util
 
-        density_change = np.max(np.abs(
-            df.loc[range_start, ['KERN_FWD', 'KERN_FWDREV', 'KERN_REV']] -
-            df.loc[range_end, ['KERN_FWD', 'KERN_FWDREV', 'KERN_REV']]
-        )) > state_run_smooth_delta
+        if k_util.k_size > pavlib.seq.MAX_KMER_ARRAY_K:
+            return get_density_table(region_ref, region_tig, self.ref_fa_name, self.tig_fa_name, k_util, **kwargs)
 
-        if state_change or density_change:
-            # Save indices where density must be calculated
-            density_range_list.append(inner_range)
+        # Update reference and contig k-mers
+        ref_kmer_new = self._update_ref(region_ref)
+        is_tig_new = self._update_tig(region_tig)
 
+        # Update reference membership for contig k-mers
+        if ref_kmer_new is None:
+            is_tig_new[:] = True  # Reference k-mers were replaced, test all contig k-mers
+
+        elif len(ref_kmer_new) > 0:
+            # Contig k-mers from the previous call are tested against reference k-mers added by this call
+            is_tig_old = ~ is_tig_new
+
+            tig_kmer_old = self.tig_kmer[is_tig_old]
+
+            self.tig_in_ref[is_tig_old] |= pavlib.seq.kmer_in_array(tig_kmer_old, ref_kmer_new)
+            self.tig_rev_in_ref[is_tig_old] |= pavlib.seq.kmer_in_array(
+                pavlib.seq.kmer_rev_complement_array(tig_kmer_old, k_util.k_size), ref_kmer_new
+            )
+
+        if np.any(is_tig_new):
+            tig_kmer_new = self.tig_kmer[is_tig_new]
+
+            self.tig_in_ref[is_tig_new] = pavlib.seq.kmer_in_array(tig_kmer_new, self.ref_kmer_arr)
+            self.tig_rev_in_ref[is_tig_new] = pavlib.seq.kmer_in_array(
+                pavlib.seq.kmer_rev_complement_array(tig_kmer_new, k_util.k_size), self.ref_kmer_arr
+            )
+
+        # Assign states (reference k-mers are reverse-complemented if the contig region is reversed)
+        if region_tig.is_rev:
+            state_mer = KMER_ORIENTATION_STATE[self.tig_rev_in_ref.astype(int), self.tig_in_ref.astype(int)]
         else:
-            # Interpolate densities within range
-            interp_range_list.append(inner_range)
+            state_mer = KMER_ORIENTATION_STATE[self.tig_in_ref.astype(int), self.tig_rev_in_ref.astype(int)]
 
-    # Interpolate values (where density does not need to be calculated)
-    interp_chunk_size = SAMPLE_INDEX_CHUNK_SIZE // state_run_smooth
-    interp_index = np.concatenate(interp_range_list)
+        df = pd.DataFrame({
+            'KMER': self.tig_kmer.astype(np.int64 if k_util.k_size < 32 else np.uint64),
+            'INDEX': self.tig_index,
+            'STATE': -1,
+            'STATE_MER': state_mer
+        })
 
-    df.loc[interp_index, 'KERN_FWD'] = np.concatenate(pool.map(
-        interp_fwd, interp_range_list, chunksize=interp_chunk_size
-    ))
+        return get_state_density(df, **kwargs)
 
-    df.loc[interp_index, 'KERN_FWDREV'] = np.concatenate(pool.map(
-        interp_fwdrev, interp_range_list, chunksize=interp_chunk_size
-    ))
+    def _update_ref(self, region_ref):
+        """
+        Update reference k-mers for a new reference region.
 
-    df.loc[interp_index, 'KERN_REV'] = np.concatenate(pool.map(
-        interp_rev, interp_range_list, chunksize=interp_chunk_size
-    ))
+        :param region_ref: Reference region.
 
-    df.loc[interp_index, 'INTERP'] = True
+        :return: A sorted array of reference k-mers added by this update or `None` if all reference k-mers were
+            replaced.
+        """
 
-    # Calculate density values within chunks where values could not be interpolated
-    # (too close to potential state changes)
-    density_index = np.concatenate(density_range_list)
+        k_util = self.k_util
 
-    density_index_chunked = [
-        density_index[x:x + SAMPLE_INDEX_CHUNK_SIZE]
-            for x in range(0, len(density_index), SAMPLE_INDEX_CHUNK_SIZE)
-    ]
+        flank_list = _get_flank_regions(self.region_ref, region_ref, k_util.k_size)
 
-    df.loc[density_index, 'KERN_FWD'] = np.concatenate(pool.map(density_fwd, density_index_chunked))
-    df.loc[density_index, 'KERN_FWDREV'] = np.concatenate(pool.map(density_fwdrev, density_index_chunked))
-    df.loc[density_index, 'KERN_REV'] = np.concatenate(pool.map(density_rev, density_index_chunked))
+        if flank_list is None:
+            # Read all k-mers
+            ref_kmer_count = pavlib.seq.ref_kmers(region_ref, self.ref_fa_name, k_util)
 
-    # Penalize spikes above 1.0.
-    df.loc[df['KERN_FWD'] > 1.0, 'KERN_FWD'] = 1 / df.loc[df['KERN_FWD'] > 1.0]
-    df.loc[df['KERN_FWDREV'] > 1.0, 'KERN_FWDREV'] = 1 / df.loc[df['KERN_FWDREV'] > 1.0]
-    df.loc[df['KERN_REV'] > 1.0, 'KERN_REV'] = 1 / df.loc[df['KERN_REV'] > 1.0]
+            _check_ref_kmer_count(ref_kmer_count, region_ref, k_util)
 
-    # Set max densities on all
-    df['STATE'] = df[['KERN_FWD', 'KERN_FWDREV', 'KERN_REV']].apply(
-        lambda vals: np.argmax(vals.array),
-        axis=1
-    )
+            self.region_ref = region_ref.copy()
+            self.ref_kmer_count = ref_kmer_count
+            self.ref_kmer_arr = pavlib.seq.kmer_array(ref_kmer_count.keys())
 
-    # Column order
-    df = df[['INDEX', 'STATE_MER', 'STATE', 'KERN_FWD', 'KERN_FWDREV', 'KERN_REV', 'KMER']]
+            return None
 
-    # Return
-    df.set_index(df['INDEX'], inplace=True, drop=False)
+        # Read flanks
+        ref_kmer_count = self.ref_kmer_count.copy()
 
-    return df
+        for region_flank in flank_list:
+            ref_kmer_count.update(pavlib.seq.ref_kmers(region_flank, self.ref_fa_name, k_util))
+
+        _check_ref_kmer_count(ref_kmer_count, region_ref, k_util)
+
+        ref_kmer_new = np.setdiff1d(
+            pavlib.seq.kmer_array(ref_kmer_count.keys()), self.ref_kmer_arr, assume_unique=True
+        )
+
+        self.region_ref = region_ref.copy()
+        self.ref_kmer_count = ref_kmer_count
+        self.ref_kmer_arr = np.union1d(self.ref_kmer_arr, ref_kmer_new)
+
+        return ref_kmer_new
+
+    def _update_tig(self, region_tig):
+        """
+        Update contig k-mers for a new contig region. Reference membership arrays are resized, but values for new
+        k-mers are not set.
+
+        :param region_tig: Contig region.
+
+        :return: A boolean array with `True` for each contig k-mer read by this update.
+        """
+
+        flank_list = _get_flank_regions(self.region_tig, region_tig, self.k_util.k_size)
+
+        if flank_list is None:
+            # Read all k-mers
+            self.tig_kmer, self.tig_index = self._read_tig_kmers(region_tig, region_tig.pos)
+
+            self.tig_in_ref = np.zeros(len(self.tig_kmer), dtype=bool)
+            self.tig_rev_in_ref = np.zeros(len(self.tig_kmer), dtype=bool)
+
+            self.region_tig = region_tig.copy()
+
+            return np.ones(len(self.tig_kmer), dtype=bool)
+
+        # Read flanks and merge with k-mers from the last region (flanks are upstream and downstream)
+        kmer_list = [self.tig_kmer]
+        index_list = [self.tig_index + (self.region_tig.pos - region_tig.pos)]
+        in_ref_list = [self.tig_in_ref]
+        rev_in_ref_list = [self.tig_rev_in_ref]
+        is_new_list = [np.zeros(len(self.tig_kmer), dtype=bool)]
+
+        for region_flank in flank_list:
+            kmer_arr, index_arr = self._read_tig_kmers(region_flank, region_tig.pos)
+
+            append = region_flank.pos >= self.region_tig.pos  # Downstream flank
+
+            for arr_list, arr in (
+                    (kmer_list, kmer_arr),
+                    (index_list, index_arr),
+                    (in_ref_list, np.zeros(len(kmer_arr), dtype=bool)),
+                    (rev_in_ref_list, np.zeros(len(kmer_arr), dtype=bool)),
+                    (is_new_list, np.ones(len(kmer_arr), dtype=bool))
+            ):
+                if append:
+                    arr_list.append(arr)
+                else:
+                    arr_list.insert(0, arr)
+
+        self.tig_kmer = np.concatenate(kmer_list)
+        self.tig_index = np.concatenate(index_list)
+        self.tig_in_ref = np.concatenate(in_ref_list)
+        self.tig_rev_in_ref = np.concatenate(rev_in_ref_list)
+
+        self.region_tig = region_tig.copy()
+
+        return np.concatenate(is_new_list)
+
+    def _read_tig_kmers(self, region, index_pos):
+        """
+        Read contig k-mers in contig orientation.
+
+        :param region: Contig region to read.
+        :param index_pos: Contig position k-mer indices are relative to.
+
+        :return: A tuple of k-mer (uint64) and index (int64) arrays.
+        """
+
+        seq = pavlib.seq.region_seq_fasta(region, self.tig_fa_name, False)
+
+        mer_stream = list(kanapy.util.kmer.stream(seq, self.k_util, index=True))
+
+        return (
+            np.fromiter((kmer for kmer, index in mer_stream), dtype=np.uint64, count=len(mer_stream)),
+            np.fromiter((index for kmer, index in mer_stream), dtype=np.int64, count=len(mer_stream)) +
+                (region.pos - index_pos)
+        )
+
+
+def _get_flank_regions(region_last, region, k_size):
+    """
+    Get flanking regions containing k-mers in `region` that are not in `region_last`. Flanks overlap `region_last` by
+    `k_size - 1` bases so that k-mers crossing the boundary are read once.
+
+    :param region_last: Region k-mers were last read for or `None`.
+    :param region: New region.
+    :param k_size: K-mer size.
+
+    :return: A list of flanking regions (upstream flank first, may be empty) or `None` if `region` does not contain
+        `region_last` and all k-mers must be read.
+    """
+
+    if (
+        region_last is None or
+        region.chrom != region_last.chrom or
+        region.pos > region_last.pos or
+        region.end < region_last.end or
+        len(region_last) < k_size
+    ):
+        return None
+
+    flank_list = list()
+
+    if region.pos < region_last.pos:
+        flank_list.append(pavlib.seq.Region(region.chrom, region.pos, region_last.pos + k_size - 1))
+
+    if region.end > region_last.end:
+        flank_list.append(pavlib.seq.Region(region.chrom, region_last.end - k_size + 1, region.end))
+
+    return flank_list
 
 
 def rl_encoder(df, state_col='STATE'):
@@ -338,24 +877,39 @@ def rl_encoder(df, state_col='STATE'):
     :return: Iterator of (state, count, pos, end) tuples.
     """
 
-    state = None
-    count = 0
-    pos = None
-    end = None
+    return iter(rl_encoder_array(df, state_col).tolist())
 
-    for index, row in df[[state_col, 'INDEX']].iterrows():  # STATE/INDEX columns make row Series int (removing float columns so each row is integers)
 
-        if row[state_col] == state:
-            count += 1
-            end = row['INDEX']
+def rl_encoder_array(df, state_col='STATE'):
+    """
+    Run-length encode states in a density table. Same as `rl_encoder()`, but returns runs as a structured array with
+    fields "STATE", "COUNT", "POS", and "END" (one element per run). Fields may be accessed as arrays (e.g.
+    `state_rl['STATE']` for condensed states), and elements may be indexed like `rl_encoder()` tuples.
 
-        else:
-            if state is not None:
-                yield (state, count, pos, end)
+    :param df: Dataframe of states.
+    :param state_col: State column to get state from (see `rl_encoder()`).
+
+    :return: Structured array of runs.
+    """
+
+    state = df[state_col].values
+    index = df['INDEX'].values
+
+    rl_dtype = [('STATE', state.dtype), ('COUNT', np.int64), ('POS', index.dtype), ('END', index.dtype)]
+
+    if len(state) == 0:
+        return np.zeros(0, dtype=rl_dtype)
+
+    # Get first and last record of each run
+    run_pos = np.flatnonzero(np.concatenate([[True], state[1:] != state[:-1]]))
+    run_end = np.append(run_pos[1:], len(state)) - 1
+
+    # Make runs
+    state_rl = np.empty(len(run_pos), dtype=rl_dtype)
 
-            state = row[state_col]
-            count = 1
-            pos = end = row['INDEX']
+    state_rl['STATE'] = state[run_pos]
+    state_rl['COUNT'] = run_end - run_pos + 1
+    state_rl['POS'] = index[run_pos]
+    state_rl['END'] = index[run_end]
 
-    if state is not None:
-        yield (state, count, pos, end)
+    return state_rl
@@ -2,12 +2,10 @@
 Routines for calling inversions.
 """
 
-import codecs
 import intervaltree
+import io
+import multiprocessing as mp
 import numpy as np
-import os
-import pickle
-import subprocess
 
 import pavlib
 import svpoplib
@@ -35,10 +33,27 @@ MIN_TIG_REF_PROP = 0.6  # The contig and reference region sizes must be within t
 DEFAULT_MIN_EXP_COUNT = 1  # The default number of region expansions to try (including the initial expansion) and
                            # finding only fwd k-mer states after smoothing before giving up on the region.
 
-DEFAULT_STATE_RUN_SMOOTH = 20  # Default value for --staterunsmooth parameter to density.py if none specified
+DEFAULT_STATE_RUN_SMOOTH = 20  # Default state-run-smooth value for density.get_smoothed_density() if none specified
+
+COST_EXPECTED_EXPANSIONS = 2  # Number of region scans assumed when predicting the cost of a flagged region (initial scan
+                              # and one expansion to reach reference-oriented k-mers on both flanks).
 
 CALL_SOURCE = 'FLAG-DEN'
 
+INV_CALL_COLUMNS = [
+    '#CHROM', 'POS', 'END',
+    'ID', 'SVTYPE', 'SVLEN',
+    'HAP',
+    'TIG_REGION', 'QUERY_STRAND',
+    'CI',
+    'RGN_REF_INNER', 'RGN_TIG_INNER',
+    'RGN_REF_DISC', 'RGN_TIG_DISC',
+    'FLAG_ID', 'FLAG_TYPE',
+    'ALIGN_INDEX', 'CLUSTER_MATCH',
+    'CALL_SOURCE',
+    'SEQ'
+]  # Columns for inversion calls
+
 # Matrix converting k-mer location to UP/DN match. Assign
 # NA to missing or k-mers in both.
 #
@@ -149,7 +164,7 @@ def get_inv_from_record(row, df_density):
 def scan_for_inv(
         region_flag, ref_fa_name, tig_fa_name, align_lift, k_util, n_tree=None,
         max_region_size=None, threads=1, log=None, srs_tree=None,
-        min_exp_count=DEFAULT_MIN_EXP_COUNT
+        min_exp_count=DEFAULT_MIN_EXP_COUNT, density_method=None
     ):
     """
     Scan region for inversions. Start with a flagged region (`region`) where variants indicated that an inversion
@@ -165,9 +180,9 @@ def scan_for_inv(
         dict-like keyed by chromosome names where each value is an IntervalTree of N bases.
     :param max_region_size: Max region size. If inversion (+ flank) exceeds this size, stop searching for inversions.
         If `None`, set to default, `MAX_REGION_SIZE`. If 0, ignore max and scale to arbitrarily large inversions.
-    :param threads: Number of concurrent threads to use.
+    :param threads: Number of density worker processes (persistent pool, see `density.get_density_pool()`).
     :param log: Log file (open file handle).
-    :param srs_tree: Inversion density "--staterunsmooth" parameters (for `density.py`). Can set different
+    :param srs_tree: Inversion density state-run-smooth parameters (see `density.get_smoothed_density()`). Can set different
         state-run-smoothing parameters depending on the size of the region being explored. The density mechanism
         subsets by this many k-mers (20 by default initially calculates density only on every 20th k-mer). If there
         are state changes or large changes in density within the window, then the density is calculated for the whole
@@ -180,6 +195,8 @@ def scan_for_inv(
     :param min_exp_count: The number of region expansions to try (including the initial expansion) and finding only
         forward-oriented k-mer states after smoothing before giving up on the region. `None` sets the default value,
         `DEFAULT_MIN_EXP_COUNT`.
+    :param density_method: K-mer density method ("kde" or "fft", see `density.get_smoothed_density()`). `None` sets the
+        default method, `density.DEFAULT_DENSITY_METHOD`.
 
     :return: A `InvCall` object describing the inversion found or `None` if no inversion was found.
     """
@@ -190,6 +207,9 @@ def scan_for_inv(
     if max_region_size is None:
         max_region_size = MAX_REGION_SIZE
 
+    if density_method is None:
+        density_method = pavlib.density.DEFAULT_DENSITY_METHOD
+
     # Init
     _write_log(
         'Scanning for inversions in flagged region: {} (flagged region record id = {})'.format(
@@ -218,6 +238,9 @@ def scan_for_inv(
     elif not issubclass(srs_tree.__class__, intervaltree.IntervalTree):
         srs_tree = get_srs_tree(srs_tuple_list)
 
+    # K-mers are kept between expansions, only k-mers in expanded flanks are read
+    incremental_density = pavlib.density.IncrementalDensity(ref_fa_name, tig_fa_name, k_util)
+
     # Scan and expand
     while True:
 
@@ -243,53 +266,27 @@ def scan_for_inv(
         _write_log('Scanning region: {}'.format(region_ref), log)
 
         ## Get k-mer density from region ##
-        pipeline_dir = os.path.dirname(os.path.dirname(pavlib.inv.__file__))
-
-        density_table_args = [
-            'python3',
-            os.path.join(pipeline_dir, 'scripts', 'density.py'),
-            '--tigregion', str(region_tig),
-            '--refregion', str(region_ref),
-            '--ref', ref_fa_name,
-            '--tig', tig_fa_name,
-            '-k', str(k_util.k_size),
-            '-t', str(threads),
-            '-r', 'true' if region_tig.is_rev else 'false',
-            '--staterunsmooth', str(list(srs_tree[len(region_tig)])[0].data)
-        ]
-
-        proc = subprocess.Popen(
-            args=density_table_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-
-        proc_stdout, proc_stderr = proc.communicate()
-
-        if proc.returncode != 0:
-            _write_log(
-                (
-                    'Received return code {} from density.py for region {}:\n{}'
-                ).format(
-                    proc.returncode, str(region_ref),
-                    proc_stderr.decode() if proc_stderr is not None else '<No STDERR Message>'
-                ),
-                log
+        try:
+            df = incremental_density.get_density_table(
+                region_ref, region_tig,
+                threads=threads,
+                min_informative_kmers=MIN_INFORMATIVE_KMERS,
+                density_smooth_factor=DENSITY_SMOOTH_FACTOR,
+                min_state_count=MIN_KMER_STATE_COUNT,
+                state_run_smooth=list(srs_tree[len(region_tig)])[0].data,
+                density_method=density_method
             )
 
+        except Exception as ex:
+            _write_log('Error computing density for region {}: {}'.format(region_ref, ex), log)
             return None
 
-        if proc_stdout is None:
-            _write_log(f'No output from density.py for region {region_ref}')
-            return None
-
-        #df = pickle.loads(proc_stdout)
-        df = pickle.loads(codecs.decode(proc_stdout, "base64"))
-
         if df.shape[0] > 0:
             ## Check inversion ##
 
-            # Get run-length encoded states (list of (state, count) tuples).
-            state_rl = [record for record in pavlib.density.rl_encoder(df)]
-            condensed_states = [record[0] for record in state_rl]  # States only
+            # Get run-length encoded states (array of (state, count, pos, end) records).
+            state_rl = pavlib.density.rl_encoder_array(df)
+            condensed_states = state_rl['STATE']  # States only
 
             if len(state_rl) == 1 and state_rl[0][0] in {0, -1} and expansion_count >= min_exp_count:
                 _write_log(
@@ -386,8 +383,10 @@ def scan_for_inv(
         is_rev=region_tig.is_rev
     )
 
-    # Lift to reference
-    region_ref_outer = align_lift.lift_region_to_sub(region_tig_outer)
+    # Lift to reference (outer and inner regions in one pass, inner may be interpolated into an alignment gap)
+    region_ref_outer, region_ref_inner = align_lift.lift_region_to_sub_many(
+        [region_tig_outer, region_tig_inner], gap=[False, True]
+    )
 
     if region_ref_outer is None:
         _write_log(
@@ -397,8 +396,6 @@ def scan_for_inv(
 
         return None
 
-    region_ref_inner = align_lift.lift_region_to_sub(region_tig_inner, gap=True)
-
     if region_ref_inner is None:
         region_ref_inner = region_ref_outer
 
@@ -451,6 +448,139 @@ def scan_for_inv(
     return inv_call
 
 
+def scan_for_inv_batch(region_flag_list, ref_fa_name, tig_fa_name, align_lift, k_util, threads=1, log=None, **kwargs):
+    """
+    Scan a batch of flagged regions for inversions. Flagged regions are independent, so they are scheduled concurrently
+    across one pool of `threads` processes that lives for the whole batch. Each region is scanned with `threads=1`, so
+    its densities are computed serially in its worker process (no density pool or shared-memory k-mer table). If
+    `threads` is less than 2, regions are scanned in order in this process and densities are also computed serially.
+
+    `RuntimeError` exceptions in `scan_for_inv()` are written to the log and yield `None` for that region. Each worker
+    process gets its own copy of `align_lift`, and `align_lift.max_cache_bytes` is split evenly across workers so the
+    batch stays within one cache budget. Alignment lift cache hits, misses, and evictions in worker processes are added
+    to the counters in `align_lift` (cached records and bytes in `align_lift` are for this process only).
+
+    :param region_flag_list: List of flagged regions (`pavlib.seq.Region`).
+    :param ref_fa_name: Reference FASTA. Must also have a .fai file.
+    :param tig_fa_name: Contig FASTA. Must also have a .fai file.
+    :param align_lift: Alignment lift-over tool (pavlib.align.AlignLift).
+    :param k_util: K-mer utility.
+    :param threads: Number of worker processes.
+    :param log: Log file (open file handle). Log messages for each region are written in the order of
+        `region_flag_list`.
+    :param kwargs: Additional arguments to `scan_for_inv()`.
+
+    :return: A list of `InvCall` objects or `None` (no inversion found) for each region in `region_flag_list`.
+    """
+
+    region_flag_list = list(region_flag_list)
+
+    # Scan in this process
+    if threads < 2 or len(region_flag_list) < 2:
+        return [
+            _scan_for_inv_catch(region_flag, ref_fa_name, tig_fa_name, align_lift, k_util, threads, log, kwargs)
+                for region_flag in region_flag_list
+        ]
+
+    # Scan regions concurrently
+    inv_call_list = list()
+
+    pool_size = min(threads, len(region_flag_list))
+
+    if align_lift.max_cache_bytes is not None:
+        worker_cache_bytes = align_lift.max_cache_bytes // pool_size
+    else:
+        worker_cache_bytes = None
+
+    _write_log(
+        'Scanning {} regions in {} worker processes (alignment lift cache max_bytes={} per worker)'.format(
+            len(region_flag_list), pool_size,
+            '{:,d}'.format(worker_cache_bytes) if worker_cache_bytes is not None else 'None'
+        ),
+        log
+    )
+
+    with mp.Pool(
+            pool_size,
+            initializer=_scan_for_inv_batch_init,
+            initargs=(ref_fa_name, tig_fa_name, align_lift, worker_cache_bytes, k_util, kwargs)
+    ) as pool:
+
+        for inv_call, log_text, lift_stats in pool.imap(_scan_for_inv_batch_worker, region_flag_list, chunksize=1):
+            if log is not None:
+                log.write(log_text)
+                log.flush()
+
+            align_lift.hits += lift_stats[0]
+            align_lift.misses += lift_stats[1]
+            align_lift.evictions += lift_stats[2]
+
+            inv_call_list.append(inv_call)
+
+    return inv_call_list
+
+
+def _scan_for_inv_catch(region_flag, ref_fa_name, tig_fa_name, align_lift, k_util, threads, log, kwargs):
+    """
+    Run `scan_for_inv()` and log `RuntimeError` exceptions.
+
+    :return: `InvCall` or `None`.
+    """
+
+    try:
+        return scan_for_inv(
+            region_flag, ref_fa_name, tig_fa_name, align_lift, k_util, threads=threads, log=log, **kwargs
+        )
+
+    except RuntimeError as ex:
+        _write_log('RuntimeError in scan_for_inv(): {}'.format(ex), log)
+        return None
+
+
+# Arguments shared by all regions in a batch, set once per worker process by _scan_for_inv_batch_init().
+_batch_worker_args = None
+
+
+def _scan_for_inv_batch_init(ref_fa_name, tig_fa_name, align_lift, max_cache_bytes, k_util, kwargs):
+    """
+    Initialize a batch worker process.
+
+    :param max_cache_bytes: Alignment lift cache limit for this worker (its share of the batch cache budget).
+    """
+
+    global _batch_worker_args
+
+    if align_lift.max_cache_bytes is not None:
+        align_lift.max_cache_bytes = max_cache_bytes
+
+    _batch_worker_args = (ref_fa_name, tig_fa_name, align_lift, k_util, kwargs)
+
+
+def _scan_for_inv_batch_worker(region_flag):
+    """
+    Scan one flagged region in a batch worker process.
+
+    :return: A tuple of the `InvCall` (or `None`), log text for the region, and a tuple of alignment lift cache hits,
+        misses, and evictions for the region.
+    """
+
+    ref_fa_name, tig_fa_name, align_lift, k_util, kwargs = _batch_worker_args
+
+    log = io.StringIO()
+
+    lift_stats = (align_lift.hits, align_lift.misses, align_lift.evictions)
+
+    inv_call = _scan_for_inv_catch(region_flag, ref_fa_name, tig_fa_name, align_lift, k_util, 1, log, kwargs)
+
+    lift_stats = (
+        align_lift.hits - lift_stats[0],
+        align_lift.misses - lift_stats[1],
+        align_lift.evictions - lift_stats[2]
+    )
+
+    return inv_call, log.getvalue(), lift_stats
+
+
 def annotate_inv_dup_mers(
         df,
         region_ref_outer, region_ref_inner,
@@ -501,60 +631,62 @@ def annotate_inv_dup_mers(
     )
 
     # Get reference k-mer sets (canonical k-mers)
-    ref_set_up = {
-        k_util.canonical_complement(kmer) for kmer in pavlib.seq.ref_kmers(region_dup_ref_up, ref_fa, k_util).keys()
-    }
+    kmer_up = pavlib.seq.ref_kmers(region_dup_ref_up, ref_fa, k_util).keys()
+    kmer_dn = pavlib.seq.ref_kmers(region_dup_ref_dn, ref_fa, k_util).keys()
 
-    ref_set_dn = {
-        k_util.canonical_complement(kmer) for kmer in pavlib.seq.ref_kmers(region_dup_ref_dn, ref_fa, k_util).keys()
-    }
+    if k_util.k_size <= pavlib.seq.MAX_KMER_ARRAY_K:
+        kmer_up = pavlib.seq.kmer_array(kmer_up)
+        kmer_dn = pavlib.seq.kmer_array(kmer_dn)
 
-    # Set canonical k-mers in df
-    df['KMER_CAN'] = df['KMER'].apply(lambda kmer: k_util.canonical_complement(kmer))
+        ref_set_up = pavlib.seq.kmer_array(
+            np.minimum(kmer_up, pavlib.seq.kmer_rev_complement_array(kmer_up, k_util.k_size))
+        )
+
+        ref_set_dn = pavlib.seq.kmer_array(
+            np.minimum(kmer_dn, pavlib.seq.kmer_rev_complement_array(kmer_dn, k_util.k_size))
+        )
+
+        def kmer_in(kmer_arr, ref_set):
+            return pavlib.seq.kmer_in_array(np.asarray(kmer_arr, dtype=np.uint64), ref_set)
 
-    # Add contig index
-    df['TIG_INDEX'] = df['INDEX'] + region_tig_discovery.pos
+    else:
+        ref_set_up = {k_util.canonical_complement(kmer) for kmer in kmer_up}
+        ref_set_dn = {k_util.canonical_complement(kmer) for kmer in kmer_dn}
+
+        def kmer_in(kmer_arr, ref_set):
+            return np.asarray([kmer in ref_set for kmer in kmer_arr], dtype=bool)
+
+    # Contig index
+    tig_index = df['INDEX'].values + region_tig_discovery.pos
 
     # Annotate upstream and downstream inverted duplications
-    df['FLANK'] = np.nan
+    is_up = (tig_index >= region_dup_tig_up.pos) & (tig_index < region_dup_tig_up.end - k_util.k_size)
+    is_dn = (tig_index >= region_dup_tig_dn.pos) & (tig_index < region_dup_tig_dn.end - k_util.k_size)
+
+    is_up &= ~ is_dn  # Downstream annotation takes precedence if flanks overlap
 
-    df.loc[
-        (df['TIG_INDEX'] >= region_dup_tig_up.pos) & (df['TIG_INDEX'] < region_dup_tig_up.end - k_util.k_size),
-        'FLANK'
-    ] = 'UP'
+    flank = np.full(df.shape[0], np.nan, dtype=object)
+    flank[is_up] = 'UP'
+    flank[is_dn] = 'DN'
 
-    df.loc[
-        (df['TIG_INDEX'] >= region_dup_tig_dn.pos) & (df['TIG_INDEX'] < region_dup_tig_dn.end - k_util.k_size),
-        'FLANK'
-    ] = 'DN'
+    df['FLANK'] = flank
 
     # Annotate upstream/downstream k-mer matches
-    df['MATCH'] = np.nan
-
-    df.loc[df['FLANK'] == 'UP', 'MATCH'] = df.loc[
-        df['FLANK'] == 'UP', 'KMER'
-    ].apply(lambda kmer:
-        KMER_LOC_STATE[
-            int(kmer in ref_set_up),
-            int(kmer in ref_set_dn)
-        ]
-    )
+    kmer_arr = df['KMER'].values
 
-    df.loc[df['FLANK'] == 'DN', 'MATCH'] = df.loc[
-        df['FLANK'] == 'DN', 'KMER'
-    ].apply(lambda kmer:
-        KMER_LOC_STATE[
-            int(kmer in ref_set_dn),
-            int(kmer in ref_set_up)
-        ]
-    )
+    in_up = kmer_in(kmer_arr, ref_set_up)
+    in_dn = kmer_in(kmer_arr, ref_set_dn)
 
-    df['MATCH'] = df['MATCH'].apply(lambda val: val if val != 'NA' else np.nan)
+    match = np.full(df.shape[0], np.nan, dtype=object)
 
-    # Return updated DataFrame
-    del(df['KMER_CAN'])
-    del(df['TIG_INDEX'])
+    match[is_up] = KMER_LOC_STATE[in_up[is_up].astype(int), in_dn[is_up].astype(int)]
+    match[is_dn] = KMER_LOC_STATE[in_dn[is_dn].astype(int), in_up[is_dn].astype(int)]
+
+    match[match == 'NA'] = np.nan
+
+    df['MATCH'] = match
 
+    # Return updated DataFrame
     return df
 
 
@@ -617,6 +749,76 @@ def get_srs_tree(srs_tuple_list):
     return srs_tree
 
 
+def get_flagged_region_cost(
+        df_flag, k_size, max_region_size=None, min_exp_count=None, srs_tree=None, density_method=None
+    ):
+    """
+    Predict the relative cost of scanning flagged regions for inversions with `scan_for_inv()`. Costs are used to
+    balance batches and are comparable only between regions predicted with the same parameters.
+
+    The cost follows region expansions in `scan_for_inv()`: Each flagged region is expanded by `INITIAL_EXPAND` on both
+    sides, then grows by `EXPAND_FACTOR` for each expansion. At least `COST_EXPECTED_EXPANSIONS` scans (or
+    `min_exp_count`, if greater) are assumed, and scans exceeding `max_region_size` are not counted since the scan
+    stops there. Sequence is not read, so the number of informative k-mers in a scan is estimated by the number of
+    k-mers in the reference region (an upper bound). Each scan reads k-mers (linear) and computes densities, which is
+    `n^2 / state_run_smooth` for "kde" and `n log(n)` for "fft".
+
+    :param df_flag: Flagged regions (with "POS" and "END" columns).
+    :param k_size: K-mer size.
+    :param max_region_size: Max region size (see `scan_for_inv()`).
+    :param min_exp_count: Minimum number of expansions (see `scan_for_inv()`).
+    :param srs_tree: State-run-smooth parameters (see `scan_for_inv()`).
+    :param density_method: K-mer density method (see `scan_for_inv()`).
+
+    :return: A numpy array of predicted costs for each record in `df_flag`.
+    """
+
+    if min_exp_count is None:
+        min_exp_count = DEFAULT_MIN_EXP_COUNT
+
+    if max_region_size is None:
+        max_region_size = MAX_REGION_SIZE
+
+    if density_method is None:
+        density_method = pavlib.density.DEFAULT_DENSITY_METHOD
+
+    if density_method not in pavlib.density.DENSITY_METHODS:
+        raise RuntimeError('Unknown density method: {} (expected one of {})'.format(
+            density_method, ', '.join(pavlib.density.DENSITY_METHODS)
+        ))
+
+    if srs_tree is None:
+        srs_tree = get_srs_tree(None)
+
+    elif not issubclass(srs_tree.__class__, intervaltree.IntervalTree):
+        srs_tree = get_srs_tree(srs_tree)
+
+    # Estimate cost over expansions
+    region_len = (df_flag['END'] - df_flag['POS']).to_numpy(dtype=np.int64) + 2 * INITIAL_EXPAND
+
+    cost = np.zeros(region_len.shape[0], dtype=float)
+
+    for expansion_count in range(max(min_exp_count, COST_EXPECTED_EXPANSIONS)):
+
+        n_kmer = np.maximum(region_len - k_size + 1, 0).astype(float)
+
+        if density_method == 'kde':
+            state_run_smooth = np.asarray([list(srs_tree[val])[0].data for val in region_len], dtype=float)
+            scan_cost = n_kmer + n_kmer ** 2 / state_run_smooth
+
+        else:
+            scan_cost = n_kmer + n_kmer * np.log2(n_kmer + 1)
+
+        if max_region_size > 0:
+            scan_cost[region_len > max_region_size] = 0.0
+
+        cost += scan_cost
+
+        region_len = region_len + (region_len * EXPAND_FACTOR).astype(np.int64)
+
+    return cost
+
+
 def _write_log(message, log):
     """
     Write message to log.
@@ -10,11 +10,10 @@ import sys
 
 import pavlib.seq
 import pavlib.inv
+import pavlib.util
 import kanapy.util.kmer
 import svpoplib
 
-import Bio.Seq
-
 # Default parameters
 MAX_TIG_DIST_PROP = 1  # Max allowed tig gap as a factor of the minimum alignment length of two records
 MAX_REF_DIST_PROP = 3  # Max allowed ref gap as a factor of the minimum alignment length of two records
@@ -27,10 +26,26 @@ CALL_SOURCE = 'ALNTRUNC'  # Call source annotation for alignment-truncating even
 CALL_SOURCE_INV_DENSITY = 'ALNTRUNC-DEN'
 CALL_SOURCE_INV_NO_DENSITY = 'ALNTRUNC-NODEN'
 
+INSDEL_COLUMNS = [
+    '#CHROM', 'POS', 'END',
+    'ID', 'SVTYPE', 'SVLEN',
+    'HAP',
+    'TIG_REGION', 'QUERY_STRAND',
+    'CI',
+    'ALIGN_INDEX', 'CLUSTER_MATCH',
+    'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
+    'CALL_SOURCE',
+    'SEQ'
+]  # Columns for INS and DEL calls
+
+DEFAULT_SEQ_CACHE_BYTES = 2 * 1024 ** 3  # Default size of each sequence cache (reference and contig) in bytes
+
+COST_ALN_BP = 10000  # Predicted cost of each alignment record in a work unit (in bp of scanned reference gap)
+
 
 def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tree=None,
                     threads=1, log=sys.stdout, density_out_dir=None, max_tig_dist_prop=None, max_ref_dist_prop=None,
-                    srs_tree=None, max_region_size=None
+                    srs_tree=None, max_region_size=None, density_method=None, seq_cache_bytes=None
     ):
     """
     Scan trimmed alignments for alignment-truncating SV events.
@@ -50,10 +65,14 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
         function is called.
     :param max_tig_dist_prop: Max allowed tig gap as a factor of the minimum alignment length of two records.
     :param max_ref_dist_prop: Max allowed ref gap as a factor of the minimum alignment length of two records.
-    :param srs_tree: Inversion density "--staterunsmooth" parameters (for `density.py`). May be a tree, a list of
-        limits, or `None` to use the default for all sizes. See `inv.scan_for_inv()` for details.
+    :param srs_tree: Inversion density state-run-smooth parameters (see `density.get_smoothed_density()`). May be a
+        tree, a list of limits, or `None` to use the default for all sizes. See `inv.scan_for_inv()` for details.
     :param max_region_size: Max region size for inversion scanning. Value 0 disables the limit, and `None` sets the
         default limit, `inv.MAX_REGION_SIZE`. See `inv.scan_for_inv()` for details.
+    :param density_method: K-mer density method for inversion scanning or `None` for the default. See
+        `inv.scan_for_inv()` for details.
+    :param seq_cache_bytes: Maximum size of each sequence cache (reference and contig) in bytes or `None` for the
+        default, `DEFAULT_SEQ_CACHE_BYTES`. See `SeqCache`.
 
     :return: A tuple of dataframes for SV calls: (INS, DEL, INV).
     """
@@ -68,7 +87,7 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
     df['QRY_LEN'] = df['END'] - df['POS']
 
     # Get liftover tool and k-mer util
-    align_lift = pavlib.align.AlignLift(df, df_tig_fai)
+    align_lift = pavlib.align.AlignLift(df, df_tig_fai, precompute=True)
     k_util = kanapy.util.kmer.KmerUtil(k_size)
 
     # with RefTigManager(ref_fa_name, tig_fa_name) as fa_pair:
@@ -77,17 +96,17 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
     #     tig_fa = fa_pair[0]
 
     # Setup lists
-    ins_list = list()
-    del_list = list()
-    inv_list = list()
+    ins_list = pavlib.util.RecordBuilder(INSDEL_COLUMNS)
+    del_list = pavlib.util.RecordBuilder(INSDEL_COLUMNS)
+    inv_list = pavlib.util.RecordBuilder(pavlib.inv.INV_CALL_COLUMNS)
 
     # Get tig/chromosome combinations that appear more than once
     tig_map_count = collections.Counter(df[['#CHROM', 'QUERY_ID']].apply(tuple, axis=1))
     tig_map_count = [(chrom, tig_id) for (chrom, tig_id), count in tig_map_count.items() if count > 1]
 
     # Cache reference sequence (upper-case for homology searches)
-    seq_cache_ref = SeqCache(ref_fa_name, uppercase=True)
-    seq_cache_tig = SeqCache(tig_fa_name, uppercase=True)
+    seq_cache_ref = SeqCache(ref_fa_name, uppercase=True, max_bytes=seq_cache_bytes)
+    seq_cache_tig = SeqCache(tig_fa_name, uppercase=True, max_bytes=seq_cache_bytes)
 
     for chrom, tig_id in tig_map_count:
 
@@ -152,7 +171,7 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             seq_tig = seq_cache_tig.get(tig_id, is_rev)
 
                             # Get SV sequence
-                            seq = pavlib.seq.region_seq_fasta(ref_region, ref_fa_name)
+                            seq = seq_cache_ref.region_seq(ref_region)
 
                             # Left-shift through matching bases and get position
                             left_shift = np.min([
@@ -167,7 +186,7 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                                 end_tig -= left_shift
 
                                 ref_region = pavlib.seq.Region(chrom, pos_ref, end_ref)
-                                seq = pavlib.seq.region_seq_fasta(ref_region, ref_fa_name)
+                                seq = seq_cache_ref.region_seq(ref_region)
 
                             # Get ID and log
                             sv_id = '{}-{}-DEL-{}'.format(chrom, pos_ref, svlen)
@@ -185,30 +204,17 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             hom_tig_r = pavlib.call.right_homology(pos_tig, seq_tig, seq_upper)
 
                             # Append
-                            del_list.append(pd.Series(
-                                [
-                                    chrom, pos_ref, end_ref,
-                                    sv_id, 'DEL', svlen,
-                                    hap,
-                                    f'{tig_id}:{pos_tig + 1}-{end_tig}', '-' if row1['REV'] else '+',
-                                    dist_tig,
-                                    '{},{}'.format(row1['INDEX'], row2['INDEX']), row1['CLUSTER_MATCH'],
-                                    left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
-                                    CALL_SOURCE,
-                                    seq
-                                ],
-                                index=[
-                                    '#CHROM', 'POS', 'END',
-                                    'ID', 'SVTYPE', 'SVLEN',
-                                    'HAP',
-                                    'TIG_REGION', 'QUERY_STRAND',
-                                    'CI',
-                                    'ALIGN_INDEX', 'CLUSTER_MATCH',
-                                    'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-                                    'CALL_SOURCE',
-                                    'SEQ'
-                                ]
-                            ))
+                            del_list.append([
+                                chrom, pos_ref, end_ref,
+                                sv_id, 'DEL', svlen,
+                                hap,
+                                f'{tig_id}:{pos_tig + 1}-{end_tig}', '-' if row1['REV'] else '+',
+                                dist_tig,
+                                '{},{}'.format(row1['INDEX'], row2['INDEX']), row1['CLUSTER_MATCH'],
+                                left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
+                                CALL_SOURCE,
+                                seq
+                            ])
 
                             # Done with this contig break
                             break
@@ -230,11 +236,7 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             seq_tig = seq_cache_tig.get(tig_id, is_rev)
 
                             # SV sequence
-                            seq = pavlib.seq.region_seq_fasta(
-                                tig_region,
-                                tig_fa_name,
-                                rev_compl=is_rev
-                            )
+                            seq = seq_cache_tig.region_seq(tig_region, rev_compl=is_rev)
 
                             # Left-shift through matching bases and get position
                             left_shift = np.min([
@@ -250,11 +252,7 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
 
                                 tig_region = pavlib.seq.Region(tig_id, pos_tig, end_tig, is_rev=is_rev)
 
-                                seq = pavlib.seq.region_seq_fasta(
-                                    tig_region,
-                                    tig_fa_name,
-                                    rev_compl=is_rev
-                                )
+                                seq = seq_cache_tig.region_seq(tig_region, rev_compl=is_rev)
 
                             # Get ID and log
                             sv_id = '{}-{}-INS-{}'.format(chrom, pos_ref, svlen)
@@ -272,30 +270,17 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             hom_tig_r = pavlib.call.right_homology(end_tig, seq_tig, seq_upper)
 
                             # APPEND
-                            ins_list.append(pd.Series(
-                                [
-                                    chrom, pos_ref, end_ref,
-                                    sv_id, 'INS', svlen,
-                                    hap,
-                                    tig_region.to_base1_string(), '-' if is_rev else '+',
-                                    dist_ref,
-                                    '{},{}'.format(row1['INDEX'], row2['INDEX']), row1['CLUSTER_MATCH'],
-                                    left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
-                                    CALL_SOURCE,
-                                    seq
-                                ],
-                                index=[
-                                    '#CHROM', 'POS', 'END',
-                                    'ID', 'SVTYPE', 'SVLEN',
-                                    'HAP',
-                                    'TIG_REGION', 'QUERY_STRAND',
-                                    'CI',
-                                    'ALIGN_INDEX', 'CLUSTER_MATCH',
-                                    'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-                                    'CALL_SOURCE',
-                                    'SEQ'
-                                ]
-                            ))
+                            ins_list.append([
+                                chrom, pos_ref, end_ref,
+                                sv_id, 'INS', svlen,
+                                hap,
+                                tig_region.to_base1_string(), '-' if is_rev else '+',
+                                dist_ref,
+                                '{},{}'.format(row1['INDEX'], row2['INDEX']), row1['CLUSTER_MATCH'],
+                                left_shift, f'{hom_ref_l},{hom_ref_r}', f'{hom_tig_l},{hom_tig_r}',
+                                CALL_SOURCE,
+                                seq
+                            ])
 
                             # Done with this contig break
                             break
@@ -314,66 +299,48 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                                 n_tree=n_tree,
                                 srs_tree=srs_tree,
                                 log=log,
-                                min_exp_count=1  # If alignment truncation does not contain inverted k-mers at sufficient density, stop searching
+                                min_exp_count=1,  # If alignment truncation does not contain inverted k-mers at sufficient density, stop searching
+                                density_method=density_method
                             )
 
                             if inv_call is not None:
                                 log.write('INV (2-tig): {}\n'.format(inv_call))
                                 log.flush()
 
-                                seq = pavlib.seq.region_seq_fasta(
-                                    inv_call.region_tig_outer,
-                                    tig_fa_name,
-                                    rev_compl=is_rev
-                                )
+                                seq = seq_cache_tig.region_seq(inv_call.region_tig_outer, rev_compl=is_rev)
 
-                                inv_list.append(pd.Series(
-                                    [
-                                        inv_call.region_ref_outer.chrom,
-                                        inv_call.region_ref_outer.pos,
-                                        inv_call.region_ref_outer.end,
+                                inv_list.append([
+                                    inv_call.region_ref_outer.chrom,
+                                    inv_call.region_ref_outer.pos,
+                                    inv_call.region_ref_outer.end,
 
-                                        inv_call.id,
-                                        'INV',
-                                        inv_call.svlen,
+                                    inv_call.id,
+                                    'INV',
+                                    inv_call.svlen,
 
-                                        hap,
+                                    hap,
 
-                                        inv_call.region_tig_outer.to_base1_string(),
-                                        '-' if is_rev else '+',
+                                    inv_call.region_tig_outer.to_base1_string(),
+                                    '-' if is_rev else '+',
 
-                                        0,
+                                    0,
 
-                                        inv_call.region_ref_inner.to_base1_string(),
-                                        inv_call.region_tig_inner.to_base1_string(),
+                                    inv_call.region_ref_inner.to_base1_string(),
+                                    inv_call.region_tig_inner.to_base1_string(),
 
-                                        inv_call.region_ref_discovery.to_base1_string(),
-                                        inv_call.region_tig_discovery.to_base1_string(),
+                                    inv_call.region_ref_discovery.to_base1_string(),
+                                    inv_call.region_tig_discovery.to_base1_string(),
 
-                                        inv_call.region_flag.region_id(),
-                                        'ALNTRUNC',
+                                    inv_call.region_flag.region_id(),
+                                    'ALNTRUNC',
 
-                                        '{},{}'.format(row1['INDEX'], row2['INDEX']),
-                                        row1['CLUSTER_MATCH'],
+                                    '{},{}'.format(row1['INDEX'], row2['INDEX']),
+                                    row1['CLUSTER_MATCH'],
 
-                                        CALL_SOURCE_INV_DENSITY,
+                                    CALL_SOURCE_INV_DENSITY,
 
-                                        seq
-                                    ],
-                                    index=[
-                                        '#CHROM', 'POS', 'END',
-                                        'ID', 'SVTYPE', 'SVLEN',
-                                        'HAP',
-                                        'TIG_REGION', 'QUERY_STRAND',
-                                        'CI',
-                                        'RGN_REF_INNER', 'RGN_TIG_INNER',
-                                        'RGN_REF_DISC', 'RGN_TIG_DISC',
-                                        'FLAG_ID', 'FLAG_TYPE',
-                                        'ALIGN_INDEX', 'CLUSTER_MATCH',
-                                        'CALL_SOURCE',
-                                        'SEQ'
-                                    ]
-                                ))
+                                    seq
+                                ])
 
                                 # Save density table
                                 if density_out_dir is not None:
@@ -413,7 +380,8 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             n_tree=n_tree,
                             srs_tree=srs_tree,
                             log=log,
-                            min_exp_count=1  # If alignment truncation does not contain inverted k-mers at sufficient density, stop searching
+                            min_exp_count=1,  # If alignment truncation does not contain inverted k-mers at sufficient density, stop searching
+                            density_method=density_method
                         )
 
                         # Recover inversion if alignment supports and density fails.
@@ -438,59 +406,40 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
                             log.write('INV (3-tig): {}\n'.format(inv_call))
                             log.flush()
 
-                            seq = pavlib.seq.region_seq_fasta(
-                                inv_call.region_tig_outer,
-                                tig_fa_name,
-                                rev_compl=is_rev
-                            )
+                            seq = seq_cache_tig.region_seq(inv_call.region_tig_outer, rev_compl=is_rev)
 
-                            inv_list.append(pd.Series(
-                                [
-                                    inv_call.region_ref_outer.chrom,
-                                    inv_call.region_ref_outer.pos,
-                                    inv_call.region_ref_outer.end,
+                            inv_list.append([
+                                inv_call.region_ref_outer.chrom,
+                                inv_call.region_ref_outer.pos,
+                                inv_call.region_ref_outer.end,
 
-                                    inv_call.id,
-                                    'INV',
-                                    inv_call.svlen,
+                                inv_call.id,
+                                'INV',
+                                inv_call.svlen,
 
-                                    hap,
+                                hap,
 
-                                    inv_call.region_tig_outer.to_base1_string(),
-                                    '-' if is_rev else '+',
+                                inv_call.region_tig_outer.to_base1_string(),
+                                '-' if is_rev else '+',
 
-                                    0,
+                                0,
 
-                                    inv_call.region_ref_inner.to_base1_string(),
-                                    inv_call.region_tig_inner.to_base1_string(),
+                                inv_call.region_ref_inner.to_base1_string(),
+                                inv_call.region_tig_inner.to_base1_string(),
 
-                                    inv_call.region_ref_discovery.to_base1_string(),
-                                    inv_call.region_tig_discovery.to_base1_string(),
+                                inv_call.region_ref_discovery.to_base1_string(),
+                                inv_call.region_tig_discovery.to_base1_string(),
 
-                                    inv_call.region_flag.region_id(),
-                                    'ALNTRUNC',
+                                inv_call.region_flag.region_id(),
+                                'ALNTRUNC',
 
-                                    '{},{},{}'.format(row1['INDEX'], row2['INDEX'], row3['INDEX']),
-                                    row1['CLUSTER_MATCH'],
+                                '{},{},{}'.format(row1['INDEX'], row2['INDEX'], row3['INDEX']),
+                                row1['CLUSTER_MATCH'],
 
-                                    call_source,
+                                call_source,
 
-                                    seq
-                                ],
-                                index=[
-                                    '#CHROM', 'POS', 'END',
-                                    'ID', 'SVTYPE', 'SVLEN',
-                                    'HAP',
-                                    'TIG_REGION', 'QUERY_STRAND',
-                                    'CI',
-                                    'RGN_REF_INNER', 'RGN_TIG_INNER',
-                                    'RGN_REF_DISC', 'RGN_TIG_DISC',
-                                    'FLAG_ID', 'FLAG_TYPE',
-                                    'ALIGN_INDEX', 'CLUSTER_MATCH',
-                                    'CALL_SOURCE',
-                                    'SEQ'
-                                ]
-                            ))
+                                seq
+                            ])
 
                             # Save density table
                             if density_out_dir is not None and inv_call.df is not None:
@@ -509,114 +458,220 @@ def scan_for_events(df, df_tig_fai, hap, ref_fa_name, tig_fa_name, k_size, n_tre
         # Advance
         subindex1 += 1
 
+    # Report cache use
+    log.write('Reference sequence cache: {}\n'.format(seq_cache_ref.stats()))
+    log.write('Contig sequence cache: {}\n'.format(seq_cache_tig.stats()))
+    log.write('Alignment lift cache: {}\n'.format(align_lift.cache_stats()))
+    log.flush()
+
     # Concat records
-    if len(ins_list) > 0:
-        df_ins = pd.concat(ins_list, axis=1).T
-        df_ins['ID'] = svpoplib.variant.version_id(df_ins['ID'])
-        df_ins.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
-
-    else:
-        df_ins = pd.DataFrame([], columns=[
-            '#CHROM', 'POS', 'END',
-            'ID', 'SVTYPE', 'SVLEN',
-            'HAP',
-            'TIG_REGION', 'QUERY_STRAND',
-            'CI',
-            'ALIGN_INDEX', 'CLUSTER_MATCH',
-            'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-            'CALL_SOURCE',
-            'SEQ'
-        ])
-
-    if len(del_list) > 0:
-        df_del = pd.concat(del_list, axis=1).T
-        df_del['ID'] = svpoplib.variant.version_id(df_del['ID'])
-        df_del.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
-
-    else:
-        df_del = pd.DataFrame([], columns=[
-            '#CHROM', 'POS', 'END',
-            'ID', 'SVTYPE', 'SVLEN',
-            'HAP',
-            'TIG_REGION', 'QUERY_STRAND',
-            'CI',
-            'ALIGN_INDEX', 'CLUSTER_MATCH',
-            'LEFT_SHIFT', 'HOM_REF', 'HOM_TIG',
-            'CALL_SOURCE',
-            'SEQ'
-        ])
-
-    if len(inv_list) > 0:
-        df_inv = pd.concat(inv_list, axis=1).T
-        df_inv['ID'] = svpoplib.variant.version_id(df_inv['ID'])
-        df_inv.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
-
-    else:
-        df_inv = pd.DataFrame([], columns=[
-            '#CHROM', 'POS', 'END',
-            'ID', 'SVTYPE', 'SVLEN',
-            'HAP',
-            'TIG_REGION', 'QUERY_STRAND',
-            'CI',
-            'RGN_REF_INNER', 'RGN_TIG_INNER',
-            'RGN_REF_DISC', 'RGN_TIG_DISC',
-            'FLAG_ID', 'FLAG_TYPE',
-            'ALIGN_INDEX', 'CLUSTER_MATCH',
-            'CALL_SOURCE',
-            'SEQ'
-        ])
+    df_ins = ins_list.to_df()
+    df_del = del_list.to_df()
+    df_inv = inv_list.to_df()
+
+    for df_sv in (df_ins, df_del, df_inv):
+        if df_sv.shape[0] > 0:
+            df_sv['ID'] = svpoplib.variant.version_id(df_sv['ID'])
+            df_sv.sort_values(['#CHROM', 'POS', 'END', 'ID'], inplace=True)
 
     # Return records
     return df_ins, df_del, df_inv
 
 
+def get_work_unit_cost(df, max_region_size=None):
+    """
+    Predict the relative cost of scanning each work unit in `scan_for_events()`. A work unit is a reference/contig pair
+    (chromosome and contig ID) with more than one alignment record. Costs are used to balance batches.
+
+    Each alignment record adds `COST_ALN_BP` (traversing records, left-shifting, and homology searches), and each gap
+    between consecutive records on the reference adds the length of the gap that would be scanned for inversions. Gaps
+    are expanded by `inv.INITIAL_EXPAND` on both sides and gaps exceeding `max_region_size` are not scanned.
+
+    :param df: Dataframe of alignments (trimmed). Output from "align_cut_tig_overlap".
+    :param max_region_size: Max region size for inversion scanning. Value 0 disables the limit, and `None` sets the
+        default limit, `inv.MAX_REGION_SIZE`.
+
+    :return: A dataframe with columns "CHROM", "TIG", "N_ALN" (number of alignment records), "REF_GAP" (sum of
+        reference gaps between records), and "PRED_COST" (predicted cost) with one row per work unit.
+    """
+
+    if max_region_size is None:
+        max_region_size = pavlib.inv.MAX_REGION_SIZE
+
+    if df.shape[0] == 0:
+        return pd.DataFrame([], columns=['CHROM', 'TIG', 'N_ALN', 'REF_GAP', 'PRED_COST'])
+
+    df = df[['#CHROM', 'QUERY_ID', 'POS', 'END']].sort_values(['#CHROM', 'QUERY_ID', 'POS', 'END'])
+
+    # Gaps between consecutive records of each work unit (0 for the first record)
+    gap = (df['POS'] - df.groupby(['#CHROM', 'QUERY_ID'], sort=False)['END'].shift(1)).fillna(0).clip(lower=0)
+
+    df['REF_GAP'] = gap.astype(np.int64)
+
+    scan_len = (df['REF_GAP'] + 2 * pavlib.inv.INITIAL_EXPAND) * (df['REF_GAP'] > 0)
+
+    if max_region_size > 0:
+        scan_len[scan_len > max_region_size] = 0
+
+    df['SCAN_LEN'] = scan_len
+
+    # Summarize by work unit
+    df_cost = df.groupby(['#CHROM', 'QUERY_ID'], sort=False).agg(
+        N_ALN=('POS', 'size'),
+        REF_GAP=('REF_GAP', 'sum'),
+        SCAN_LEN=('SCAN_LEN', 'sum')
+    ).reset_index()
+
+    df_cost = df_cost.loc[df_cost['N_ALN'] > 1]
+
+    df_cost['PRED_COST'] = df_cost['N_ALN'] * COST_ALN_BP + df_cost['SCAN_LEN']
+
+    df_cost.columns = ['CHROM', 'TIG', 'N_ALN', 'REF_GAP', 'SCAN_LEN', 'PRED_COST']
+
+    return df_cost[['CHROM', 'TIG', 'N_ALN', 'REF_GAP', 'PRED_COST']].reset_index(drop=True)
+
+
 class SeqCache:
     """
-    Keep a cache of a sequence string in upper-case. Stores the last instance of the sequence and the ID. When a
-    new ID is requested, the old sequnece is discarded and the new one is loaded.
+    Cache whole sequences from an indexed FASTA file. Sequences are keyed by sequence ID and orientation
+    (reverse-complemented or not), and least-recently used sequences are discarded when the cached sequences exceed
+    `max_bytes`. The most recently used sequence is always kept, even if it alone exceeds `max_bytes`.
+
+    Whole sequences are retrieved by `get()` (upper-case if `uppercase` is `True`), and slices of cached sequences are
+    retrieved by `region_seq()` (case is preserved). A sequence cached in one orientation is reverse-complemented to
+    get the other orientation, and slices are taken from either orientation, so the FASTA is read once per sequence
+    while it stays in the cache.
+
+    Counters "hits", "misses", and "evictions" count whole-sequence lookups and discarded sequences.
     """
 
-    def __init__(self, fa_filename, uppercase=True):
+    def __init__(self, fa_filename, uppercase=True, max_bytes=None):
         """
         Create a cache object to read from indexed FASTA file `fa_filename`.
 
         :param fa_filename: Indexed FASTA file name.
-        :param uppercase: `True` if sequences should be made upper-case, otherwise, preserve case.
+        :param uppercase: `True` if sequences returned by `get()` should be made upper-case, otherwise, preserve case.
+        :param max_bytes: Maximum size of cached sequences in bytes. If `None`, set to `DEFAULT_SEQ_CACHE_BYTES`.
         """
 
+        if max_bytes is None:
+            max_bytes = DEFAULT_SEQ_CACHE_BYTES
+
+        if max_bytes < 0:
+            raise RuntimeError('Sequence cache size must not be negative: {}'.format(max_bytes))
+
         self.fa_filename = fa_filename
         self.uppercase = uppercase
+        self.max_bytes = max_bytes
 
-        self.id = None
-        self.seq = None
-        self.is_rev = None
+        self.cache = collections.OrderedDict()  # Key: (sequence_id, is_rev), Value: (seq, seq_upper)
+        self.cache_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, sequence_id, is_rev):
         """
-        Get a sequence. Returns the cached version if ID matches the current ID, otherwise, the correct sequence is
-        retrieved, cached, and returned.
+        Get a sequence. Returns the cached version if the ID and orientation are cached, otherwise, the correct sequence
+        is retrieved, cached, and returned.
 
-        :param sequence_id: Sequence ID string or Region.
-        :param is_rev: `True` if the sequence is reverse-complemeted. Retrieving the same sequence ID as the cached
-            sequence with `is_rev` mismatch will reload the sequence in the requested orientation.
+        :param sequence_id: Sequence ID string.
+        :param is_rev: `True` if the sequence is reverse-complemeted.
 
         :return: Sequence.
         """
 
-        if self.id != sequence_id or self.is_rev != is_rev:
-            new_seq = pavlib.seq.region_seq_fasta(
-                sequence_id, self.fa_filename
-            )
+        seq, seq_upper = self._get_entry(sequence_id, is_rev)
+
+        return seq_upper if self.uppercase else seq
+
+    def region_seq(self, region, rev_compl=None):
+        """
+        Get the sequence of a region from cached sequences (see `pavlib.seq.region_seq_fasta()`). Case is preserved.
+
+        :param region: Region object.
+        :param rev_compl: Reverse-complement sequence is `True`. If `None`, reverse-complement if `region.is_rev`.
+
+        :return: String sequence.
+        """
+
+        if rev_compl is None:
+            rev_compl = region.is_rev
+
+        # Slice the reverse-complemented sequence if it is cached and the forward sequence is not
+        if (str(region.chrom), True) in self.cache and (str(region.chrom), False) not in self.cache:
+            seq_rev = self._get_entry(region.chrom, True)[0]
+            seq_len = len(seq_rev)
+
+            seq = seq_rev[max(seq_len - region.end, 0):max(seq_len - region.pos, 0)]
+
+            return seq if rev_compl else pavlib.seq.rev_compl(seq)
+
+        # Slice the forward sequence
+        seq = self._get_entry(region.chrom, False)[0][region.pos:region.end]
+
+        return pavlib.seq.rev_compl(seq) if rev_compl else seq
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        :return: A string of cache statistics suitable for logs.
+        """
+
+        return 'hits={}, misses={}, evictions={}, cached={} sequence(s), cached_bytes={:,d}, max_bytes={:,d}'.format(
+            self.hits, self.misses, self.evictions, len(self.cache), self.cache_bytes, self.max_bytes
+        )
+
+    def _get_entry(self, sequence_id, is_rev):
+        """
+        Get a cached entry, read and cache it if it is not cached.
+
+        :param sequence_id: Sequence ID string.
+        :param is_rev: `True` if the sequence is reverse-complemeted.
+
+        :return: A tuple of the sequence and the upper-case sequence (same object if the sequence is upper-case or
+            `uppercase` is `False`).
+        """
+
+        key = (str(sequence_id), bool(is_rev))
+
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+
+            return self.cache[key]
+
+        self.misses += 1
+
+        # Get sequence (reverse-complement a cached sequence in the other orientation if possible)
+        key_other = (key[0], not key[1])
+
+        if key_other in self.cache:
+            seq = pavlib.seq.rev_compl(self.cache[key_other][0])
+        else:
+            seq = pavlib.seq.region_seq_fasta(key[0], self.fa_filename, key[1])
+
+        if self.uppercase:
+            seq_upper = seq.upper()
+
+            if seq_upper == seq:
+                seq_upper = seq
+
+        else:
+            seq_upper = seq
 
-            if self.uppercase:
-                new_seq = new_seq.upper()
+        entry_bytes = len(seq) + (len(seq_upper) if seq_upper is not seq else 0)
 
-            if is_rev:
-                new_seq = str(Bio.Seq.Seq(new_seq).reverse_complement())
+        # Make space and add
+        while len(self.cache) > 0 and self.cache_bytes + entry_bytes > self.max_bytes:
+            old_seq, old_seq_upper = self.cache.popitem(last=False)[1]
 
-            self.seq = new_seq
+            self.cache_bytes -= len(old_seq) + (len(old_seq_upper) if old_seq_upper is not old_seq else 0)
+            self.evictions += 1
 
-            self.id = sequence_id
-            self.is_rev = is_rev
+        self.cache[key] = (seq, seq_upper)
+        self.cache_bytes += entry_bytes
 
-        return self.seq
+        return self.cache[key]
@@ -17,6 +17,23 @@ import svpoplib
 import kanapy
 
 
+# Sequence store files (appended to the FASTA file name)
+SEQ_STORE_SUFFIX = '.seq'
+SEQ_STORE_INDEX_SUFFIX = '.seq.idx'
+
+# Reverse-complement translation table (same base complements as Bio.Seq)
+_REV_COMPL_TABLE = bytes.maketrans(
+    b'ACGTUMRWSYKVHDBNacgtumrwsykvhdbn',
+    b'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn'
+)
+
+# Open sequence stores keyed by FASTA file name
+_SEQ_STORE_DICT = dict()
+
+# K-mers up to this size fit in uint64 k-mer arrays (2 bits per base)
+MAX_KMER_ARRAY_K = 32
+
+
 class Region:
     """
     Represents a region (chromosome, pos, and end) in 0-based half-open coordinates (BED).
@@ -308,9 +325,76 @@ def ref_kmers(region, fa_file_name, k_util):
     return ref_mer_count
 
 
+def kmer_array(kmers):
+    """
+    Get a sorted array of unique k-mers.
+
+    :param kmers: An iterable of k-mers (integers, e.g. keys from `ref_kmers()`) or an array of k-mers.
+
+    :return: A sorted uint64 array of unique k-mers.
+    """
+
+    if isinstance(kmers, np.ndarray):
+        return np.unique(kmers.astype(np.uint64))
+
+    return np.unique(np.fromiter(kmers, dtype=np.uint64))
+
+
+def kmer_rev_complement_array(kmer_arr, k_size):
+    """
+    Reverse-complement an array of k-mers. K-mers are 2-bit encoded with complementary bases summing to 3 (A=0, C=1,
+    G=2, T=3) as done by `kanapy.util.kmer`.
+
+    :param kmer_arr: Array of k-mers.
+    :param k_size: K-mer size. Must not exceed `MAX_KMER_ARRAY_K`.
+
+    :return: A uint64 array of reverse-complemented k-mers.
+    """
+
+    if k_size > MAX_KMER_ARRAY_K:
+        raise RuntimeError('K-mer size exceeds the maximum for k-mer arrays: {} > {}'.format(k_size, MAX_KMER_ARRAY_K))
+
+    kmer_arr = ~np.asarray(kmer_arr, dtype=np.uint64)  # Complement bases (unused upper bits are shifted out below)
+
+    # Reverse 2-bit bases
+    for shift, mask in (
+            (2, 0x3333333333333333),
+            (4, 0x0F0F0F0F0F0F0F0F),
+            (8, 0x00FF00FF00FF00FF),
+            (16, 0x0000FFFF0000FFFF),
+            (32, 0x00000000FFFFFFFF)
+    ):
+        shift = np.uint64(shift)
+        mask = np.uint64(mask)
+
+        kmer_arr = ((kmer_arr >> shift) & mask) | ((kmer_arr & mask) << shift)
+
+    return kmer_arr >> np.uint64(64 - 2 * k_size)
+
+
+def kmer_in_array(kmer_arr, sorted_kmer_arr):
+    """
+    Test k-mers for membership in a sorted k-mer array (see `kmer_array()`).
+
+    :param kmer_arr: uint64 array of k-mers to test.
+    :param sorted_kmer_arr: Sorted uint64 array of unique k-mers.
+
+    :return: A boolean array with `True` for each k-mer in `kmer_arr` found in `sorted_kmer_arr`.
+    """
+
+    if len(sorted_kmer_arr) == 0:
+        return np.zeros(len(kmer_arr), dtype=bool)
+
+    index = np.searchsorted(sorted_kmer_arr, kmer_arr)
+    index[index == len(sorted_kmer_arr)] = 0
+
+    return sorted_kmer_arr[index] == kmer_arr
+
+
 def region_seq_fasta(region, fa_file_name, rev_compl=None):
     """
-    Get sequence from an indexed FASTA file. FASTA must have ".fai" index.
+    Get sequence from an indexed FASTA file. FASTA must have ".fai" index. If a sequence store was written for this
+    FASTA by `write_seq_store()`, sequence is read from the store (see `get_seq_store()`).
 
     :param region: Region object to extract a region, or a string with the recrord ID to extract a whole record.
     :param fa_file_name: FASTA file name.
@@ -319,6 +403,12 @@ def region_seq_fasta(region, fa_file_name, rev_compl=None):
     :return: String sequence.
     """
 
+    # Read from a sequence store if one was written for this FASTA
+    seq_store = get_seq_store(fa_file_name)
+
+    if seq_store is not None:
+        return seq_store.region_seq(region, rev_compl)
+
     with pysam.FastaFile(fa_file_name) as fa_file:
 
         if region.__class__ == str:
@@ -343,6 +433,320 @@ def region_seq_fasta(region, fa_file_name, rev_compl=None):
         return sequence
 
 
+def rev_compl(seq):
+    """
+    Reverse-complement a sequence.
+
+    :param seq: Sequence string.
+
+    :return: Reverse-complemented sequence string.
+    """
+
+    return seq.encode()[::-1].translate(_REV_COMPL_TABLE).decode()
+
+
+def write_seq_store(fa_file_name, store_file_name, index_file_name):
+    """
+    Write an uncompressed sequence store for a FASTA file. All sequences are concatenated into one byte file
+    (`store_file_name`) with no line breaks or headers, and an index (`index_file_name`) records the name, offset, and
+    length of each sequence. Sequences are stored as they appear in the FASTA (case is preserved). The store is read
+    by `SeqStore`.
+
+    :param fa_file_name: FASTA file name (gzipped or uncompressed).
+    :param store_file_name: Output sequence store file name.
+    :param index_file_name: Output index file name.
+    """
+
+    index_list = list()
+
+    # Write empty files if the FASTA is empty
+    if os.stat(fa_file_name).st_size == 0:
+        with open(store_file_name, 'wb'):
+            pass
+
+        pd.DataFrame([], columns=['NAME', 'OFFSET', 'LEN']).to_csv(index_file_name, sep='\t', index=False)
+
+        return
+
+    # Open FASTA (check for gzip magic bytes)
+    with open(fa_file_name, 'rb') as in_file:
+        is_gz = in_file.read(2) == b'\x1f\x8b'
+
+    in_file = gzip.open(fa_file_name, 'rb') if is_gz else open(fa_file_name, 'rb')
+
+    try:
+        with open(store_file_name, 'wb') as out_file:
+
+            seq_name = None
+            seq_offset = 0
+            seq_len = 0
+
+            for line in in_file:
+
+                if line.startswith(b'>'):
+                    if seq_name is not None:
+                        index_list.append((seq_name, seq_offset, seq_len))
+
+                    tok = line[1:].split()
+
+                    if len(tok) == 0:
+                        raise RuntimeError('Empty FASTA record name in {}'.format(fa_file_name))
+
+                    seq_name = tok[0].decode()
+                    seq_offset += seq_len
+                    seq_len = 0
+
+                else:
+                    line = line.rstrip()
+
+                    if len(line) > 0 and seq_name is None:
+                        raise RuntimeError('Sequence before the first FASTA record header in {}'.format(fa_file_name))
+
+                    out_file.write(line)
+                    seq_len += len(line)
+
+            if seq_name is not None:
+                index_list.append((seq_name, seq_offset, seq_len))
+
+    finally:
+        in_file.close()
+
+    # Write index
+    pd.DataFrame(
+        index_list, columns=['NAME', 'OFFSET', 'LEN']
+    ).to_csv(
+        index_file_name, sep='\t', index=False
+    )
+
+
+def get_seq_store(fa_file_name):
+    """
+    Get a sequence store for a FASTA file. The store is written by `write_seq_store()` next to the FASTA file
+    (`SEQ_STORE_SUFFIX` and `SEQ_STORE_INDEX_SUFFIX` appended to the FASTA file name). Stores are opened once per
+    process and reused. Since stores are memory-mapped read-only, processes forked after a store is opened share it.
+
+    :param fa_file_name: FASTA file name.
+
+    :return: A `SeqStore` object or `None` if there is no store for this FASTA.
+
+    :raises RuntimeError: If the store exists, but its index is missing or older than the FASTA.
+    """
+
+    fa_file_name = str(fa_file_name)
+
+    if fa_file_name not in _SEQ_STORE_DICT:
+
+        store_file_name = fa_file_name + SEQ_STORE_SUFFIX
+        index_file_name = fa_file_name + SEQ_STORE_INDEX_SUFFIX
+
+        if not os.path.isfile(store_file_name):
+            return None
+
+        if not os.path.isfile(index_file_name):
+            raise RuntimeError('Sequence store {} exists, but its index is missing: {}'.format(
+                store_file_name, index_file_name
+            ))
+
+        if os.path.getmtime(index_file_name) < os.path.getmtime(fa_file_name):
+            raise RuntimeError('Sequence store index {} is older than the FASTA file: {}'.format(
+                index_file_name, fa_file_name
+            ))
+
+        _SEQ_STORE_DICT[fa_file_name] = SeqStore(store_file_name, index_file_name)
+
+    return _SEQ_STORE_DICT[fa_file_name]
+
+
+class SeqStore:
+    """
+    Read-only memory-mapped sequence store written by `write_seq_store()`. Sequences are fetched as slices of the
+    memory-mapped file without reading or copying other parts of the file.
+
+    Fetch coordinates follow `pysam.FastaFile.fetch()`: 0-based half-open coordinates, `end` is truncated to the
+    sequence length, a negative `pos` or `pos` > `end` raises `ValueError`, and a missing sequence raises `KeyError`.
+    """
+
+    def __init__(self, store_file_name, index_file_name):
+        """
+        Open a sequence store.
+
+        :param store_file_name: Sequence store file name.
+        :param index_file_name: Index file name.
+        """
+
+        self.store_file_name = store_file_name
+
+        df_index = pd.read_csv(index_file_name, sep='\t', dtype={'NAME': str, 'OFFSET': np.int64, 'LEN': np.int64})
+
+        self.offset = dict(zip(df_index['NAME'], df_index['OFFSET']))
+        self.seq_len = dict(zip(df_index['NAME'], df_index['LEN']))
+
+        if os.stat(store_file_name).st_size > 0:
+            self.seq_bytes = np.memmap(store_file_name, dtype=np.uint8, mode='r')
+        else:
+            self.seq_bytes = np.zeros(0, dtype=np.uint8)
+
+    def fetch_bytes(self, name, pos=None, end=None):
+        """
+        Get a sequence or a region of a sequence as a uint8 array. The array is a view of the memory-mapped store
+        (no sequence is copied).
+
+        :param name: Sequence name.
+        :param pos: Start position (0-based) or `None` for the start of the sequence.
+        :param end: End position or `None` for the end of the sequence.
+
+        :return: A read-only uint8 array.
+        """
+
+        name = str(name)
+
+        if name not in self.offset:
+            raise KeyError('sequence \'{}\' not present'.format(name))
+
+        seq_len = self.seq_len[name]
+
+        pos = 0 if pos is None else int(pos)
+        end = seq_len if end is None else int(end)
+
+        if pos < 0:
+            raise ValueError('start out of range ({})'.format(pos))
+
+        if pos > end:
+            raise ValueError('invalid coordinates: start ({}) > stop ({})'.format(pos, end))
+
+        offset = self.offset[name]
+
+        return self.seq_bytes[offset + min(pos, seq_len):offset + min(end, seq_len)]
+
+    def fetch(self, name, pos=None, end=None, rev_compl=False):
+        """
+        Get a sequence or a region of a sequence.
+
+        :param name: Sequence name.
+        :param pos: Start position (0-based) or `None` for the start of the sequence.
+        :param end: End position or `None` for the end of the sequence.
+        :param rev_compl: Reverse-complement sequence if `True`.
+
+        :return: Sequence string.
+        """
+
+        seq_bytes = self.fetch_bytes(name, pos, end).tobytes()
+
+        if rev_compl:
+            seq_bytes = seq_bytes[::-1].translate(_REV_COMPL_TABLE)
+
+        return seq_bytes.decode()
+
+    def region_seq(self, region, rev_compl=None):
+        """
+        Get sequence for a region or a whole sequence. Same as `region_seq_fasta()`.
+
+        :param region: Region object to extract a region, or a string with the recrord ID to extract a whole record.
+        :param rev_compl: Reverse-complement sequence is `True`. If `None`, reverse-complement if `region.is_rev`.
+
+        :return: String sequence.
+        """
+
+        if region.__class__ == str:
+            is_region = False
+        elif region.__class__ == Region:
+            is_region = True
+        else:
+            raise RuntimeError('Unrecognized region type: {}: Expected Region (pavlib.seq) or str'.format(str(region.__class__.__name__)))
+
+        if rev_compl is None:
+            rev_compl = is_region and region.is_rev
+
+        if is_region:
+            return self.fetch(region.chrom, region.pos, region.end, rev_compl)
+
+        return self.fetch(region, None, None, rev_compl)
+
+    def __contains__(self, name):
+        return str(name) in self.offset
+
+
+class FastaSeqCache:
+    """
+    Cache whole sequences from an indexed FASTA file. Each sequence is read once and stored with a byte array (see
+    `CachedSeq`). Sequences are keyed by name and orientation (reverse-complemented or not), and the
+    least-recently used sequence is discarded when more than `max_seq` sequences are cached.
+
+    Callers should order work by sequence name where possible so cached sequences are reused.
+    """
+
+    def __init__(self, fa_file_name, max_seq=2):
+        """
+        Create a sequence cache.
+
+        :param fa_file_name: FASTA file name. FASTA must have a ".fai" index.
+        :param max_seq: Maximum number of sequences to cache.
+        """
+
+        if max_seq < 1:
+            raise RuntimeError('Sequence cache size must be at least 1: {}'.format(max_seq))
+
+        self.fa_file_name = fa_file_name
+        self.max_seq = max_seq
+
+        self.cache = collections.OrderedDict()
+
+    def get(self, name, is_rev=False):
+        """
+        Get a sequence.
+
+        :param name: Sequence name (FASTA record ID).
+        :param is_rev: Get the reverse-complement of the sequence if `True`.
+
+        :return: A `CachedSeq` object.
+        """
+
+        key = (str(name), bool(is_rev))
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        # Get sequence (reverse-complement a cached sequence in the other orientation if possible)
+        key_other = (key[0], not key[1])
+
+        if key_other in self.cache:
+            seq = str(Bio.Seq.Seq(self.cache[key_other].seq).reverse_complement())
+        else:
+            seq = region_seq_fasta(key[0], self.fa_file_name, key[1])
+
+        # Make space and add
+        while len(self.cache) >= self.max_seq:
+            self.cache.popitem(last=False)
+
+        self.cache[key] = CachedSeq(seq)
+
+        return self.cache[key]
+
+
+class CachedSeq:
+    """
+    A sequence stored by `FastaSeqCache`.
+
+    Attributes:
+        * seq: Sequence string.
+        * seq_bytes: Sequence as a uint8 array.
+    """
+
+    def __init__(self, seq):
+        """
+        Create a cached sequence.
+
+        :param seq: Sequence string.
+        """
+
+        self.seq = seq
+        self.seq_bytes = np.frombuffer(seq.encode(), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.seq)
+
+
 # def copy_fa_to_gz(in_file_name, out_file_name):
 #     """
 #     Copy FASTA file to gzipped FASTA if the file is not already gzipped. If the input file is empty, then write an
@@ -2,6 +2,7 @@
 General utility functions.
 """
 
+import heapq
 import numpy as np
 import pandas as pd
 
@@ -97,3 +98,242 @@ def region_merge(file_list, pad=500):
         return pd.concat(df_list, axis=1).T
     else:
         return pd.DataFrame([], columns=['#CHROM', 'POS', 'END'])
+
+
+def lpt_batch(cost, batch_count):
+    """
+    Assign jobs to batches by longest-processing-time-first (LPT) scheduling. Jobs are sorted by decreasing cost and
+    each is assigned to the batch with the lowest total cost so far. The largest batch is at most 4/3 of the optimal
+    makespan.
+
+    Ties are broken by job order and then by batch number, so the assignment is deterministic.
+
+    :param cost: Array-like of job costs.
+    :param batch_count: Number of batches.
+
+    :return: A numpy array of batch numbers (0 to `batch_count - 1`) for each job in `cost`.
+    """
+
+    if batch_count < 1:
+        raise RuntimeError('Batch count must be a positive integer: {}'.format(batch_count))
+
+    cost = np.asarray(cost, dtype=float)
+
+    batch = np.zeros(cost.shape[0], dtype=int)
+
+    batch_heap = [(0.0, batch_index) for batch_index in range(batch_count)]  # (total cost, batch)
+
+    for job_index in np.argsort(-cost, kind='stable'):
+        batch_cost, batch_index = heapq.heappop(batch_heap)
+
+        batch[job_index] = batch_index
+
+        heapq.heappush(batch_heap, (batch_cost + cost[job_index], batch_index))
+
+    return batch
+
+
+class RecordBuilder:
+    """
+    Build a table one record at a time. Values are appended to per-column lists and the table is created once by
+    `to_df()`, which avoids creating a Series for each record and upcasting all columns to object
+    (`pd.concat(series_list, axis=1).T`).
+
+    Column types are inferred from the values in each column unless set by `dtype`.
+    """
+
+    def __init__(self, columns, dtype=None):
+        """
+        Create a record builder.
+
+        :param columns: List of column names.
+        :param dtype: Dict of column types keyed by column names. Columns not in this dict have types inferred from
+            their values.
+        """
+
+        self.columns = list(columns)
+        self.dtype = dtype if dtype is not None else dict()
+
+        self.col_values = [list() for col in self.columns]
+
+    def append(self, values):
+        """
+        Append a record.
+
+        :param values: List of values, one for each column in order.
+        """
+
+        if len(values) != len(self.columns):
+            raise RuntimeError('Record length {} does not match the number of columns ({}): {}'.format(
+                len(values), len(self.columns), values
+            ))
+
+        for col_list, val in zip(self.col_values, values):
+            col_list.append(val)
+
+    def to_df(self):
+        """
+        Get a table of appended records.
+
+        :return: A dataframe with one row for each record (in order) and columns `columns`.
+        """
+
+        return pd.DataFrame(
+            {
+                col: pd.Series(col_list, dtype=self.dtype.get(col, object if len(col_list) == 0 else None))
+                    for col, col_list in zip(self.columns, self.col_values)
+            },
+            columns=self.columns
+        )
+
+    def __len__(self):
+        return len(self.col_values[0]) if len(self.col_values) > 0 else 0
+
+
+class IntervalSet:
+    """
+    Intervals on named sequences (chromosomes or contigs) with vectorized overlap queries. Intervals are half-open
+    (0-based start, end not included) and may carry a data value (e.g. the contig an interval was called from).
+
+    Intervals are stored as start and end arrays sorted by sequence and start position, and the running maximum of end
+    positions is kept for each sequence. A query interval overlaps a stored interval if the running maximum end of the
+    last interval starting before the query end is greater than the query start, so all queries are answered with one
+    `np.searchsorted` call. Overlap semantics follow `intervaltree.IntervalTree` slicing: empty query intervals
+    (start >= end) overlap nothing.
+    """
+
+    def __init__(self):
+        """
+        Create an empty interval set.
+        """
+
+        self.chrom_list = list()
+        self.pos_list = list()
+        self.end_list = list()
+        self.data_list = list()
+
+    def add(self, chrom, pos, end, data=None):
+        """
+        Add intervals. Empty intervals (start >= end) are ignored.
+
+        :param chrom: Sequence name or an array-like of sequence names (one for each interval).
+        :param pos: Interval start position or an array-like of start positions.
+        :param end: Interval end position or an array-like of end positions.
+        :param data: Interval data value or an array-like of values (one for each interval). May be `None`.
+        """
+
+        pos = np.atleast_1d(np.asarray(pos, dtype=np.int64))
+        end = np.atleast_1d(np.asarray(end, dtype=np.int64))
+
+        if pos.shape != end.shape:
+            raise RuntimeError('Interval start and end arrays differ in length: {} != {}'.format(pos.shape[0], end.shape[0]))
+
+        # Drop empty intervals
+        is_int = pos < end
+
+        self.chrom_list.append(_broadcast_obj(chrom, pos.shape[0], 'chrom')[is_int])
+        self.pos_list.append(pos[is_int])
+        self.end_list.append(end[is_int])
+        self.data_list.append(_broadcast_obj(data, pos.shape[0], 'data')[is_int])
+
+    def add_df(self, df, data_col=None):
+        """
+        Add intervals from a DataFrame with "#CHROM", "POS", and "END" columns.
+
+        :param df: DataFrame of intervals.
+        :param data_col: Column of data values or `None`. May also be a Series or array of values (one for each
+            record in `df`).
+        """
+
+        if isinstance(data_col, str):
+            data_col = df[data_col]
+
+        self.add(df['#CHROM'].to_numpy(), df['POS'].to_numpy(), df['END'].to_numpy(), data_col)
+
+    def overlaps(self, chrom, pos, end, data=None):
+        """
+        Test query intervals for overlaps with intervals in this set.
+
+        :param chrom: Sequence name or an array-like of sequence names (one for each query).
+        :param pos: Array-like of query start positions.
+        :param end: Array-like of query end positions.
+        :param data: If not `None`, only count intervals with this data value. May be an array-like of values (one for
+            each query).
+
+        :return: A boolean array with `True` for each query interval overlapping an interval in this set.
+        """
+
+        pos = np.atleast_1d(np.asarray(pos, dtype=np.int64))
+        end = np.atleast_1d(np.asarray(end, dtype=np.int64))
+
+        n = pos.shape[0]
+
+        if len(self) == 0 or n == 0:
+            return np.zeros(n, dtype=bool)
+
+        # Get intervals
+        int_pos = np.concatenate(self.pos_list)
+        int_end = np.concatenate(self.end_list)
+
+        int_key = [np.concatenate(self.chrom_list)]
+        qry_key = [_broadcast_obj(chrom, n, 'chrom')]
+
+        if data is not None:
+            int_key.append(np.concatenate(self.data_list))
+            qry_key.append(_broadcast_obj(data, n, 'data'))
+
+        # Code sequence names (and data values) as integers
+        int_code = np.zeros(int_pos.shape[0], dtype=np.int64)
+        qry_code = np.zeros(n, dtype=np.int64)
+
+        for int_key_arr, qry_key_arr in zip(int_key, qry_key):
+            key_code, key_uniques = pd.factorize(np.concatenate([int_key_arr, qry_key_arr]), use_na_sentinel=False)
+
+            int_code = int_code * len(key_uniques) + key_code[:int_pos.shape[0]]
+            qry_code = qry_code * len(key_uniques) + key_code[int_pos.shape[0]:]
+
+        # Offset positions by code so intervals on each sequence sort together and running maximums do not carry over
+        # from one sequence to the next
+        offset = max(int(np.max(int_end)), int(np.max(end)), 0) + 1
+
+        int_order = np.lexsort((int_pos, int_code))
+
+        int_code = int_code[int_order]
+        int_pos_offset = int_pos[int_order] + int_code * offset
+        int_end_max = np.maximum.accumulate(int_end[int_order] + int_code * offset) - int_code * offset
+
+        # Find the last interval on the same sequence starting before each query end
+        int_index = np.searchsorted(int_pos_offset, np.maximum(end, 0) + qry_code * offset, side='left') - 1
+
+        is_match = int_index >= 0
+        int_index[~ is_match] = 0
+
+        return is_match & (int_code[int_index] == qry_code) & (int_end_max[int_index] > pos) & (pos < end)
+
+    def __len__(self):
+        return int(np.sum([pos.shape[0] for pos in self.pos_list]))
+
+
+def _broadcast_obj(val, n, arg_name):
+    """
+    Get an object array of `n` values from a single value or an array-like of values.
+
+    :param val: Single value or array-like of values.
+    :param n: Number of values.
+    :param arg_name: Argument name for error messages.
+
+    :return: Object array of `n` values.
+    """
+
+    if isinstance(val, (str, bytes)) or val is None or np.ndim(val) == 0:
+        arr = np.empty(n, dtype=object)
+        arr[:] = [val] * n
+
+        return arr
+
+    arr = np.asarray(val, dtype=object)
+
+    if arr.shape[0] != n:
+        raise RuntimeError('Length of "{}" ({}) does not match the number of intervals ({})'.format(arg_name, arr.shape[0], n))
+
+    return arr